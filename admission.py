@@ -0,0 +1,148 @@
+# admission.py - 服务器过载保护（准入控制）
+# 原来每个连接一个线程、每个请求帧再一个线程，流量高峰时线程、内存和数据库连接被同时耗尽，
+# 所有请求一起变慢直至超时。这里在处理请求之前先取得名额：
+#   - 同时处理的请求不超过 SERVER_WORKERS 个，其余按先后排队，排队的不超过 SERVER_QUEUE_DEPTH 个；
+#     队列已满或排队超过 SERVER_QUEUE_TIMEOUT 秒时立即回复“繁忙”，由客户端 BUSY_RETRY_AFTER_MS 毫秒后重试
+#   - 已经开始的投放的后续步骤（第二轮的内部图片）不受队列长度限制，最多等待 CLIENT_TIMEOUT 秒，
+#     仍未取得名额时以 AdmissionTimeoutError 失败（分帧协议回复 ERR），不会无限期占着处理线程
+#   - 每个站点一个令牌桶：平均每秒 LOCATION_RATE_LIMIT 次新投放，最多连续 LOCATION_RATE_BURST 次，
+#     超出时回复“繁忙”，等待时间为下一个令牌到来的时间
+# 分帧协议用 BSY 帧回复等待的毫秒数（见 protocol.py），旧协议没有繁忙回复，仍回复5。
+import math
+import threading
+import time
+from contextlib import contextmanager
+from config import (SERVER_WORKERS, SERVER_QUEUE_DEPTH, SERVER_QUEUE_TIMEOUT, BUSY_RETRY_AFTER_MS,
+                    LOCATION_RATE_LIMIT, LOCATION_RATE_BURST, CLIENT_TIMEOUT)
+from metrics import get_metrics, phase
+from protocol import ServerBusyError
+
+# 拒绝连接前等待客户端发送协议标识的时间（秒），据此选择繁忙回复的格式
+REJECT_WAIT = 0.5
+
+class AdmissionTimeoutError(Exception):
+    """已经开始的投放的后续步骤等待处理名额超时"""
+
+class Admission:
+    """处理名额：同时处理不超过 workers 个请求，排队不超过 queue_depth 个"""
+
+    def __init__(self, workers=SERVER_WORKERS, queue_depth=SERVER_QUEUE_DEPTH,
+                 queue_timeout=SERVER_QUEUE_TIMEOUT, retry_after_ms=BUSY_RETRY_AFTER_MS,
+                 required_timeout=CLIENT_TIMEOUT):
+        self.workers = workers
+        self.queue_depth = queue_depth
+        self.queue_timeout = queue_timeout
+        self.retry_after_ms = retry_after_ms
+        self.required_timeout = required_timeout
+        self._cond = threading.Condition()
+        self._running = 0
+        self._waiting = 0
+
+    def enter(self, required=False):
+        """取得一个名额，返回是否取得；required 为 True 时不受队列长度限制，最多等待 required_timeout 秒"""
+        with self._cond:
+            # 有请求在排队时新来的请求也要排队，不插队
+            if self._running < self.workers and not self._waiting:
+                self._running += 1
+                return True
+            if not required and self._waiting >= self.queue_depth:
+                return False
+
+            self._waiting += 1
+            try:
+                deadline = time.monotonic() + (self.required_timeout if required else self.queue_timeout)
+                while self._running >= self.workers:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        return False
+                    self._cond.wait(remaining)
+                self._running += 1
+                return True
+            finally:
+                self._waiting -= 1
+
+    def leave(self):
+        with self._cond:
+            self._running -= 1
+            self._cond.notify()
+
+    def stats(self):
+        with self._cond:
+            return {"running": self._running, "waiting": self._waiting}
+
+class RateLimiter:
+    """每个站点一个令牌桶：平均每秒 rate 次，最多连续 burst 次；rate 为0时不限制"""
+
+    # 桶的个数超过该值时清理已经装满的桶（装满的桶与没有桶等价）
+    PRUNE_SIZE = 10000
+
+    def __init__(self, rate=LOCATION_RATE_LIMIT, burst=LOCATION_RATE_BURST):
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self._lock = threading.Lock()
+        self._buckets = {}      # 站点编号 -> (令牌数, 更新时间)
+
+    def check(self, key):
+        """消耗一个令牌返回0；没有令牌时返回需要等待的毫秒数"""
+        if not self.rate:
+            return 0
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated) * self.rate)
+            if tokens >= 1:
+                self._buckets[key] = (tokens - 1, now)
+                if len(self._buckets) > self.PRUNE_SIZE:
+                    self._prune(now)
+                return 0
+            self._buckets[key] = (tokens, now)
+            return math.ceil((1 - tokens) / self.rate * 1000)
+
+    def _prune(self, now):
+        full = self.burst / self.rate
+        self._buckets = {key: bucket for key, bucket in self._buckets.items() if now - bucket[1] < full}
+
+# 全局准入控制
+_admission = Admission()
+_rate_limiter = RateLimiter()
+
+get_metrics().register_gauge("admission_running", lambda: _admission.stats()["running"])
+get_metrics().register_gauge("admission_waiting", lambda: _admission.stats()["waiting"])
+
+def get_admission():
+    return _admission
+
+def get_rate_limiter():
+    return _rate_limiter
+
+def set_admission(admission=None, rate_limiter=None):
+    """替换全局准入控制（压力测试等），需在服务器启动前调用"""
+    global _admission, _rate_limiter
+    if admission is not None:
+        _admission = admission
+    if rate_limiter is not None:
+        _rate_limiter = rate_limiter
+
+@contextmanager
+def admitted(required=False):
+    """在名额内执行一个处理步骤，没有取得名额时抛出 ServerBusyError（required 时为 AdmissionTimeoutError）"""
+    admission = get_admission()
+    with phase("queue"):
+        entered = admission.enter(required)
+    if not entered:
+        if required:
+            raise AdmissionTimeoutError(f"等待处理名额超过 {admission.required_timeout} 秒")
+        get_metrics().inc("busy")
+        raise ServerBusyError(admission.retry_after_ms)
+    try:
+        yield
+    finally:
+        admission.leave()
+
+def check_rate(location):
+    """站点的新投放超过限流时抛出 ServerBusyError"""
+    retry_after_ms = get_rate_limiter().check(location.upper())
+    if retry_after_ms:
+        print(f"⚠️  站点 {location} 投放过于频繁，{retry_after_ms}ms 后重试")
+        get_metrics().inc("rate_limited")
+        raise ServerBusyError(retry_after_ms)
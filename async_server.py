@@ -0,0 +1,359 @@
+# async_server.py - 基于asyncio的服务器端程序
+# 与 sever2.py 使用相同的两轮协议（外部图片 -> 类别，内部图片 -> 存储情况）及分帧协议，
+# 所有连接在一个事件循环中处理，不再为每个垃圾桶创建一个系统线程
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from repository import get_repository, DB_ERRORS
+from knowledge_cache import get_knowledge_cache
+from classifier import is_interactive, get_classifier
+from storage_writer import get_storage_writer
+from dashboard import start_dashboard, stop_dashboard
+from metrics import get_metrics, phase
+from admission import get_admission, AdmissionTimeoutError, REJECT_WAIT
+from config import (SERVER_HOST, SERVER_PORT, SERVER_BACKLOG, SERVER_WORKERS,
+                    MAX_CONNECTIONS, CLIENT_TIMEOUT, SESSION_IDLE_TIMEOUT, DASHBOARD_PORT, BUSY_RETRY_AFTER_MS)
+from protocol import (MAGIC, TAG_REQUEST, TAG_INNER, TAG_ERROR, TAG_IMAGE, TAG_HEARTBEAT, TAG_BUSY, FrameError, ServerBusyError,
+                      encode_frame, check_length, read_header_async, read_payload_async)
+from image_receiver import receive_image_async, discard_images, ImageTooLargeError
+from sever2 import (parse_request, classify_admitted, check_inner_path, analyze_admitted, handle_frame,
+                    observe_request)
+
+# 控制台只有一个，需要人工输入的步骤放到单线程中执行，排队的连接不占用线程
+console_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="console")
+
+# 处理步骤的工作线程，与处理名额一样多。名额已满时步骤在执行器中排队，线程中的 Admission.enter
+# 看不到这些步骤，因此由 run_step 在事件循环中按 SERVER_QUEUE_DEPTH、SERVER_QUEUE_TIMEOUT 限制排队
+step_executor = ThreadPoolExecutor(max_workers=SERVER_WORKERS, thread_name_prefix="step")
+
+# 当前保持的连接数
+active_connections = 0
+# 已提交、还没有执行完的处理步骤数（超出 SERVER_WORKERS 的部分在排队）
+pending_steps = 0
+
+get_metrics().register_gauge("step_queue", lambda: max(0, pending_steps - SERVER_WORKERS))
+
+async def run_step(func, *args, required=False):
+    """执行一个阻塞的处理步骤：需要人工输入时放到控制台线程，否则放到工作线程并发执行。
+    排队的步骤已达上限或排队超时时抛出 ServerBusyError；
+    required 为 True 时（已开始的投放的后续步骤）不受排队长度限制，等待超过 required_timeout 秒时
+    抛出 AdmissionTimeoutError"""
+    global pending_steps
+    loop = asyncio.get_running_loop()
+    if is_interactive():
+        return await loop.run_in_executor(console_executor, func, *args)
+
+    admission = get_admission()
+    if not required and pending_steps >= SERVER_WORKERS + admission.queue_depth:
+        get_metrics().inc("busy")
+        raise ServerBusyError(admission.retry_after_ms)
+
+    queued = time.perf_counter()
+    started = asyncio.Event()
+
+    def step():
+        loop.call_soon_threadsafe(started.set)
+        get_metrics().observe("phase_seconds", time.perf_counter() - queued, phase="step_queue")
+        return func(*args)
+
+    pending_steps += 1
+    try:
+        future = step_executor.submit(step)
+        try:
+            await asyncio.wait_for(started.wait(),
+                                   timeout=admission.required_timeout if required else admission.queue_timeout)
+        except asyncio.TimeoutError:
+            # 还没有开始执行的步骤直接取消；恰好已经开始的照常等待结果
+            if future.cancel():
+                if required:
+                    raise AdmissionTimeoutError(f"等待处理名额超过 {admission.required_timeout} 秒")
+                get_metrics().inc("busy")
+                raise ServerBusyError(admission.retry_after_ms)
+        return await asyncio.wrap_future(future)
+    finally:
+        pending_steps -= 1
+
+async def send_text(writer, text):
+    """发送文本并等待缓冲区写出"""
+    with phase("send"):
+        writer.write(text.encode("utf-8"))
+        await writer.drain()
+
+async def recv_text(reader):
+    """接收一条文本消息（与 recv(1024) 语义一致），带超时"""
+    data = await asyncio.wait_for(reader.read(1024), timeout=CLIENT_TIMEOUT)
+    if not data:
+        raise ConnectionResetError("客户端已关闭连接")
+    return data.decode("utf-8").strip()
+
+async def detect_framed_async(reader):
+    """读取连接开头，判断是否为分帧协议，返回 (是否分帧, 已读取的数据)"""
+    head = b""
+    while len(head) < len(MAGIC) and MAGIC.startswith(head):
+        chunk = await asyncio.wait_for(reader.read(len(MAGIC) - len(head)), timeout=CLIENT_TIMEOUT)
+        if not chunk:
+            raise ConnectionResetError("客户端已关闭连接")
+        head += chunk
+    return head == MAGIC, head
+
+async def handle_framed_client_async(reader, writer, addr):
+    """分帧协议：每个请求帧作为独立任务处理，按请求编号回复"""
+    print(f"🧩 客户端 {addr} 使用分帧协议")
+    pending = {}
+    uploads = {}
+    tasks = set()
+
+    async def process(tag, request_id, payload):
+        start = time.perf_counter()
+        try:
+            reply_tag, reply = await run_step(handle_frame, tag, request_id, payload, pending, uploads,
+                                              required=tag == TAG_INNER)
+        except ServerBusyError as e:
+            reply_tag, reply = TAG_BUSY, f"{e.retry_after_ms}"
+        except DB_ERRORS as e:
+            print(f"❌ 数据库连接失败：{e}")
+            reply_tag, reply = TAG_ERROR, "数据库连接失败"
+            get_metrics().inc("errors")
+        except Exception as e:
+            print(f"❌ 处理请求[{request_id}]时出错：{e}")
+            reply_tag, reply = TAG_ERROR, f"{e}"
+            get_metrics().inc("errors")
+        observe_request(tag, start)
+
+        try:
+            with phase("send"):
+                writer.write(encode_frame(reply_tag, request_id, reply))
+                await writer.drain()
+            print(f"📤 已回复[{request_id}]：{reply_tag.decode()} {reply}")
+        except (ConnectionResetError, BrokenPipeError) as e:
+            print(f"❌ 回复[{request_id}]失败：{e}")
+
+    try:
+        while True:
+            # 会话在两次投放之间可能空闲很久，心跳会刷新这个超时
+            header = await asyncio.wait_for(read_header_async(reader), timeout=SESSION_IDLE_TIMEOUT)
+            if header is None:
+                break  # 客户端正常关闭连接
+
+            tag, request_id, length = header
+            if tag == TAG_HEARTBEAT:
+                check_length(tag, length)
+                await asyncio.wait_for(read_payload_async(reader, length), timeout=CLIENT_TIMEOUT)
+                writer.write(encode_frame(TAG_HEARTBEAT, request_id))
+                await writer.drain()
+                continue
+
+            if tag == TAG_IMAGE:
+                # 图片边收边写入暂存目录，收完后才读取下一帧
+                # 已完成第一轮或已上传过一张图片的请求，这一张是内部图片
+                inner = request_id in pending or request_id in uploads
+                try:
+                    with phase("recv_inner" if inner else "recv_outer"):
+                        path = await asyncio.wait_for(receive_image_async(reader, length), timeout=CLIENT_TIMEOUT)
+                    uploads.setdefault(request_id, []).append(path)
+                except (ImageTooLargeError, ValueError) as e:
+                    # 剩余数据无法跳过，回复错误后关闭连接
+                    print(f"❌ 拒绝图片[{request_id}]：{e}")
+                    writer.write(encode_frame(TAG_ERROR, request_id, f"{e}"))
+                    await writer.drain()
+                    break
+                continue
+
+            check_length(tag, length)
+            payload = await asyncio.wait_for(read_payload_async(reader, length), timeout=CLIENT_TIMEOUT)
+            task = asyncio.create_task(process(tag, request_id, payload))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+    except FrameError as e:
+        print(f"❌ 帧格式错误：{e}")
+    finally:
+        # 等待已收到的请求处理完再关闭连接
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+        # 上传后没有被请求用到的暂存图片
+        for paths in uploads.values():
+            discard_images(paths)
+
+async def handle_client_async(reader, writer):
+    """处理单个客户端连接（协程版本）"""
+    global active_connections
+    addr = writer.get_extra_info("peername")
+
+    # 超过连接上限时回复繁忙并关闭：分帧协议回复 BSY（请求编号0），旧协议回复5
+    if active_connections >= MAX_CONNECTIONS:
+        print(f"⚠️  连接数已达上限({MAX_CONNECTIONS})，拒绝客户端：{addr}")
+        get_metrics().inc("rejected_connections")
+        try:
+            framed, _ = await asyncio.wait_for(detect_framed_async(reader), timeout=REJECT_WAIT)
+            if framed:
+                writer.write(encode_frame(TAG_BUSY, 0, f"{BUSY_RETRY_AFTER_MS}"))
+                await writer.drain()
+            else:
+                await send_text(writer, "5")
+        except Exception:
+            pass
+        writer.close()
+        return
+
+    active_connections += 1
+    get_metrics().inc("connections")
+    print(f"\n🔌 客户端连接：{addr}（当前连接数：{active_connections}）")
+    connected = time.perf_counter()
+
+    try:
+        # 新客户端先发送协议标识，使用分帧协议
+        framed, head = await detect_framed_async(reader)
+        if framed:
+            await handle_framed_client_async(reader, writer, addr)
+            return
+
+        # 第一步：接收客户端发送的外部图片路径和站点编号（开头几个字节已读出）
+        try:
+            rest = await asyncio.wait_for(reader.read(1024 - len(head)), timeout=0.1)
+        except asyncio.TimeoutError:
+            rest = b""
+        request_data = (head + rest).decode("utf-8").strip()
+        print(f"📩 收到请求：{request_data}")
+        start = time.perf_counter()
+        get_metrics().observe("phase_seconds", start - connected, phase="recv_outer")
+
+        parsed = parse_request(request_data)
+        if parsed is None:
+            await send_text(writer, "5")  # 发送错误代码
+            return
+
+        outer_path, location = parsed
+
+        # 识别外部垃圾图片，查询垃圾类别编号（旧协议没有繁忙回复，过载时也回复5）
+        try:
+            cate_code = await run_step(classify_admitted, outer_path, location)
+        except ServerBusyError:
+            cate_code = None
+        observe_request(TAG_REQUEST, start)
+        if cate_code is None:
+            await send_text(writer, "5")  # 回复5
+            return
+
+        await send_text(writer, cate_code)  # 回复类别编号
+
+        # 第二步：接收内部垃圾桶图片路径
+        with phase("recv_inner"):
+            inner_path = await recv_text(reader)
+        print(f"📩 收到内部图片：{inner_path}")
+        start = time.perf_counter()
+
+        if not inner_path.endswith('.jpg'):
+            print(f"❌ 内部图片格式错误：{inner_path}")
+            await send_text(writer, "0")  # 发送默认存储
+            return
+
+        check_inner_path(inner_path, location, cate_code)
+
+        # 分析存储情况并更新数据库
+        new_storage = await run_step(analyze_admitted, location, cate_code, inner_path, required=True)
+        observe_request(TAG_INNER, start)
+
+        await send_text(writer, f"{new_storage}")
+        print(f"📤 已发送存储情况：{new_storage}%")
+
+    except asyncio.TimeoutError:
+        print(f"❌ 接收请求超时：{addr}")
+    except (ConnectionResetError, BrokenPipeError):
+        print(f"❌ 客户端 {addr} 连接断开")
+    except DB_ERRORS as e:
+        print(f"❌ 数据库连接失败：{e}")
+        get_metrics().inc("errors")
+        try:
+            await send_text(writer, "5")  # 回复5
+        except Exception:
+            pass
+    except AdmissionTimeoutError as e:
+        # 旧协议没有错误回复，与数据库连接失败一样回复5
+        print(f"❌ 分析存储失败：{e}")
+        get_metrics().inc("errors")
+        try:
+            await send_text(writer, "5")
+        except Exception:
+            pass
+    except Exception as e:
+        print(f"❌ 处理请求时出错：{e}")
+        get_metrics().inc("errors")
+    finally:
+        active_connections -= 1
+        try:
+            writer.close()
+            await writer.wait_closed()
+        except Exception:
+            pass
+        print(f"🔌 客户端 {addr} 连接关闭")
+
+def raise_fd_limit():
+    """尽量提高进程可打开的文件描述符数量，否则无法保持上万个连接"""
+    try:
+        import resource
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        if soft < hard:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+        return resource.getrlimit(resource.RLIMIT_NOFILE)[0]
+    except (ImportError, ValueError, OSError):
+        return None  # Windows 或权限不足时保持默认
+
+async def serve(host=SERVER_HOST, port=SERVER_PORT, backlog=SERVER_BACKLOG, sock=None):
+    """启动asyncio服务器并一直运行，sock 为已监听的套接字时不再绑定 host/port"""
+    if sock is not None:
+        server = await asyncio.start_server(handle_client_async, sock=sock, backlog=backlog)
+    else:
+        server = await asyncio.start_server(
+            handle_client_async, host, port,
+            backlog=backlog, reuse_address=True
+        )
+    print(f"✅ 服务器已启动（asyncio模式，backlog={backlog}，连接上限={MAX_CONNECTIONS}），等待客户端连接...")
+    async with server:
+        await server.serve_forever()
+
+def async_server_program(server_socket=None, dashboard_port=DASHBOARD_PORT):
+    """服务器主程序（asyncio模式），参数见 sever2.server_program"""
+    print("=" * 50)
+    print("智能垃圾桶服务器（asyncio）")
+    print("=" * 50)
+    print(f"监听地址：{SERVER_HOST}:{SERVER_PORT}")
+    print("按 Ctrl+C 停止服务器")
+    print("-" * 50)
+
+    fd_limit = raise_fd_limit()
+    if fd_limit is not None and fd_limit < MAX_CONNECTIONS:
+        print(f"⚠️  文件描述符上限为 {fd_limit}，低于连接上限 {MAX_CONNECTIONS}")
+
+    # 预先建立常驻数据库连接，并定期回收多余的空闲连接
+    repository = get_repository()
+    print(f"🗄️  数据库后端：{repository.name}")
+    repository.warm_up()
+    repository.start_reaper()
+
+    # 启动时加载垃圾知识缓存，分类查询不再访问数据库
+    try:
+        get_knowledge_cache().load()
+    except DB_ERRORS as e:
+        print(f"⚠️  垃圾知识缓存加载失败，将在首次查询时重试：{e}")
+
+    # 存储情况看板（只读 HTTP/JSON，数据来自内存汇总）
+    dashboard = start_dashboard(repository, port=dashboard_port)
+
+    try:
+        asyncio.run(serve(sock=server_socket))
+    except KeyboardInterrupt:
+        print("\n\n🛑 正在关闭服务器...")
+    except Exception as e:
+        print(f"❌ 服务器启动失败：{e}")
+    finally:
+        stop_dashboard(dashboard)
+        console_executor.shutdown(wait=False, cancel_futures=True)
+        step_executor.shutdown(cancel_futures=True)  # 等正在执行的步骤写完存储
+        get_classifier().close()
+        get_storage_writer().close()
+        repository.print_stats()
+        repository.close()
+        print("✅ 服务器已关闭")
+
+if __name__ == "__main__":
+    async_server_program()
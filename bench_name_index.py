@@ -0,0 +1,109 @@
+# bench_name_index.py - 垃圾名称查找方式的基准
+# 生成一个 10 万条名称的垃圾知识库（临时 SQLite 文件），比较：
+#   sql    原来的 SELECT category FROM trash_knowledge WHERE name = ?（精确匹配）
+#   exact  name_index.NameIndex 规范化后精确匹配（内存）
+#   match  name_index.NameIndex 精确 + 模糊匹配
+# 查询分三类：库中已有的名称、改动一个字（替换/插入/删除）的名称、库中没有的名称，
+# 分别统计每次查询的平均耗时、命中率和类别正确率。
+#
+# 用法：
+#   python bench_name_index.py
+#   python bench_name_index.py --names 200000 --queries 5000
+import argparse
+import os
+import random
+import shutil
+import tempfile
+import time
+from name_index import NameIndex
+from repository import SQLiteRepository
+
+# 生成名称用的字符（常用汉字）
+CHARS = ("塑料玻璃金属纸木布橡胶陶瓷电池灯管药品油漆瓶罐盒袋箱杯碗盘筷刀叉勺管线板片块"
+         "旧废破碎空湿干小大长短软硬白黑红绿蓝黄彩透明一次性快递外卖包装食品果皮菜叶骨头壳")
+
+def random_name(rng):
+    return "".join(rng.choice(CHARS) for _ in range(rng.randint(3, 8)))
+
+def make_knowledge(count, rng):
+    knowledge = {}
+    while len(knowledge) < count:
+        knowledge[random_name(rng)] = rng.randint(1, 4)
+    return knowledge
+
+def perturb(name, rng):
+    """随机改动一个字"""
+    position = rng.randrange(len(name))
+    operation = rng.choice(("replace", "insert", "delete"))
+    if operation == "replace":
+        return name[:position] + rng.choice(CHARS) + name[position + 1:]
+    if operation == "insert":
+        return name[:position] + rng.choice(CHARS) + name[position:]
+    return name[:position] + name[position + 1:]
+
+def make_queries(knowledge, count, rng):
+    """返回 {查询类型: [(查询名称, 期望类别或None)]}"""
+    names = list(knowledge)
+    existing = [(name, knowledge[name]) for name in rng.sample(names, count)]
+    perturbed = []
+    for name in rng.sample(names, count):
+        query = perturb(name, rng)
+        if query and query not in knowledge:
+            perturbed.append((query, knowledge[name]))
+    missing = []
+    while len(missing) < count:
+        query = random_name(rng)
+        if query not in knowledge:
+            missing.append((query, None))
+    return {"已有名称": existing, "改动一个字": perturbed, "库中没有": missing}
+
+def bench(lookup, queries):
+    """返回 (每次查询的平均耗时（微秒）, 命中率, 类别正确率)"""
+    start = time.perf_counter()
+    results = [lookup(query) for query, _ in queries]
+    elapsed = time.perf_counter() - start
+    hits = sum(result is not None for result in results)
+    correct = sum(result == expected for result, (_, expected) in zip(results, queries))
+    return elapsed / len(queries) * 1e6, hits / len(queries), correct / len(queries)
+
+def category_of(match):
+    return match.category if match else None
+
+def main():
+    parser = argparse.ArgumentParser(description="垃圾名称查找方式的基准")
+    parser.add_argument("--names", type=int, default=100000, help="知识库中的名称数")
+    parser.add_argument("--queries", type=int, default=2000, help="每类查询的个数")
+    parser.add_argument("--seed", type=int, default=1, help="随机数种子")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    knowledge = make_knowledge(args.names, rng)
+    queries = make_queries(knowledge, args.queries, rng)
+
+    temp_dir = tempfile.mkdtemp(prefix="bench_names_")
+    repository = SQLiteRepository(os.path.join(temp_dir, "knowledge.db"))
+    try:
+        repository.create_schema()
+        repository.seed(knowledge=list(knowledge.items()))
+
+        start = time.perf_counter()
+        _, loaded, aliases = repository.load_knowledge()
+        index = NameIndex(loaded, aliases)
+        print(f"知识库 {len(knowledge)} 条，加载并建立索引耗时 {time.perf_counter() - start:.2f} 秒")
+
+        lookups = {
+            "sql": repository.get_category,
+            "exact": lambda name: category_of(index.exact(name)),
+            "match": lambda name: category_of(index.match(name)),
+        }
+        print(f"\n{'查询类型':<10}{'方式':<8}{'平均耗时(us)':>14}{'命中率':>10}{'正确率':>10}")
+        for kind, kind_queries in queries.items():
+            for method, lookup in lookups.items():
+                micros, hit_rate, accuracy = bench(lookup, kind_queries)
+                print(f"{kind:<10}{method:<8}{micros:>14.1f}{hit_rate:>10.1%}{accuracy:>10.1%}")
+    finally:
+        repository.close()
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
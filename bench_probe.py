@@ -0,0 +1,57 @@
+# bench_probe.py - 图片尺寸读取方式的微基准
+# 比较 image_probe.probe_dimensions（只读文件头）与 Pillow Image.open 读取宽高格式的耗时，
+# 并检查两者结果是否一致。默认使用仓库中的 pic/ 和 AAAAA_*.jpg 示例图片。
+#
+# 用法：
+#   python bench_probe.py
+#   python bench_probe.py --repeat 2000 /path/to/photos/*.jpg
+import argparse
+import glob
+import time
+from PIL import Image
+from image_probe import probe_dimensions
+
+DEFAULT_IMAGES = sorted(glob.glob("pic/*") + glob.glob("AAAAA_*.jpg"))
+
+def pillow_dimensions(image_path):
+    with Image.open(image_path) as img:
+        width, height = img.size
+        return width, height, img.format
+
+def bench(func, paths, repeat):
+    """返回每个文件的平均耗时（微秒）"""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for path in paths:
+            func(path)
+    return (time.perf_counter() - start) / (repeat * len(paths)) * 1e6
+
+def main():
+    parser = argparse.ArgumentParser(description="图片尺寸读取方式的微基准")
+    parser.add_argument("images", nargs="*", default=DEFAULT_IMAGES, help="测试的图片文件")
+    parser.add_argument("--repeat", type=int, default=500, help="每个文件重复读取的次数")
+    args = parser.parse_args()
+    if not args.images:
+        parser.error("没有可用的图片文件")
+
+    print(f"{'文件':<28}{'文件头':>20}{'Pillow':>20}  结果")
+    fallback = 0
+    for path in args.images:
+        probed = probe_dimensions(path)
+        expected = pillow_dimensions(path)
+        if probed is None:
+            fallback += 1
+            status = "退回Pillow"
+        else:
+            status = "一致" if probed == expected else "不一致！"
+        print(f"{path:<28}{str(probed):>20}{str(expected):>20}  {status}")
+
+    header_us = bench(probe_dimensions, args.images, args.repeat)
+    pillow_us = bench(pillow_dimensions, args.images, args.repeat)
+    print("-" * 80)
+    print(f"{len(args.images)} 个文件 × {args.repeat} 次，其中 {fallback} 个需要退回 Pillow")
+    print(f"文件头：{header_us:.1f} 微秒/个")
+    print(f"Pillow：{pillow_us:.1f} 微秒/个（{pillow_us / header_us:.1f} 倍）")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+# classifier.py - 垃圾识别与存储情况估计
+# 服务器原来在处理线程里调用 input() 让人工输入识别结果，所有客户端都要排队等同一个控制台。
+# 这里把两步分析抽象成可替换的后端（在 config.py 中选择）：
+#   识别器 Classifier：外部图片 -> 垃圾名称（再由垃圾知识缓存查出类别）
+#     manual  人工在控制台输入（原来的方式）
+#     hash    根据文件名/文件内容确定性地给出结果，无需人工，可用于无人值守运行和压力测试
+#     batch   多个连接的图片攒批后在进程池中做模型推理（见 inference_pool.py）
+#   存储估计器 FillEstimator：内部图片 -> 存储百分比
+#     manual     人工在控制台输入（原来的方式）
+#     simulated  在当前存储基础上按图片哈希确定性地增加 1-5%
+import hashlib
+import os
+import threading
+from config import CLASSIFIER_BACKEND, FILL_ESTIMATOR_BACKEND, INFERENCE_TIMEOUT
+from knowledge_cache import get_knowledge_cache
+from image_receiver import spool_digest
+
+# 只有一个控制台，多个连接/请求同时需要人工输入时串行执行
+console_lock = threading.Lock()
+
+def image_digest(image_path, head_size=64 * 1024):
+    """图片的稳定哈希：文件存在时取文件头部内容，否则取文件名"""
+    try:
+        with open(image_path, "rb") as f:
+            data = f.read(head_size)
+    except OSError:
+        data = os.path.basename(image_path).encode("utf-8")
+    return hashlib.blake2b(data, digest_size=8).digest()
+
+class Classifier:
+    """识别器接口：classify 返回垃圾名称，无法识别返回None"""
+    name = "base"
+    interactive = False     # 是否需要控制台人工输入
+
+    def classify(self, image_path):
+        raise NotImplementedError
+
+    def close(self):
+        """释放后端占用的资源"""
+
+class ManualClassifier(Classifier):
+    """人工在控制台输入识别结果"""
+    name = "manual"
+    interactive = True
+
+    def classify(self, image_path):
+        with console_lock:
+            print("\n" + "=" * 30)
+            print("第一步：AI垃圾识别模拟")
+            print("=" * 30)
+
+            while True:
+                trash_name = input("> 请输入识别的垃圾名称（如：矿泉水瓶）: ").strip()
+                if trash_name:
+                    return trash_name
+                print("❌ 垃圾名称不能为空！")
+
+class HashClassifier(Classifier):
+    """确定性识别：文件名中包含已知垃圾名称时直接使用，否则按图片哈希从知识库中选一个"""
+    name = "hash"
+
+    def classify(self, image_path):
+        names = get_knowledge_cache().names()
+        if not names:
+            return None
+
+        basename = os.path.basename(image_path)
+        for trash_name in names:
+            if trash_name in basename:
+                return trash_name
+
+        index = int.from_bytes(image_digest(image_path), "big") % len(names)
+        return names[index]
+
+class BatchClassifier(Classifier):
+    """批量模型推理：请求提交到推理进程池，与其他连接的图片一起攒批计算"""
+    name = "batch"
+
+    def __init__(self):
+        # 需要 numpy 和 Pillow，只在选择该后端时导入
+        from inference_pool import get_inference_pool
+        self.pool = get_inference_pool()
+        self.fallback = HashClassifier()
+
+    def classify(self, image_path):
+        names = get_knowledge_cache().names()
+        if not names:
+            return None
+
+        # 上传的图片带着接收时算好的内容哈希，用于查模型输入缓存
+        content_hash = spool_digest(image_path)
+        index, confidence = self.pool.submit(image_path, len(names), content_hash).result(timeout=INFERENCE_TIMEOUT)
+        if index < 0:
+            # 图片无法解码（如客户端只发送了路径），退回确定性识别
+            print(f"⚠️  无法解码图片 {image_path}，使用文件名识别")
+            return self.fallback.classify(image_path)
+
+        print(f"🤖 模型识别：{names[index]}（置信度 {confidence:.2f}）")
+        return names[index]
+
+    def close(self):
+        self.pool.close()
+
+class FillEstimator:
+    """存储估计器接口：estimate 返回新的存储百分比(0-100)
+    analyze 只分析内部图片、不依赖识别结果和当前存储，合并请求中与识别同时执行，
+    结果作为 observation 传给 estimate"""
+    name = "base"
+    interactive = False
+
+    def analyze(self, inner_path):
+        return None
+
+    def estimate(self, location, cate_code, current_storage, inner_path=None, observation=None):
+        raise NotImplementedError
+
+class ManualFillEstimator(FillEstimator):
+    """人工在控制台输入存储百分比（调用方持有 console_lock）"""
+    name = "manual"
+    interactive = True
+
+    def estimate(self, location, cate_code, current_storage, inner_path=None, observation=None):
+        while True:
+            storage_input = input(f"> 请输入更新后的存储百分比（0-100，当前：{current_storage}%）: ").strip()
+            if storage_input.isdigit() and 0 <= int(storage_input) <= 100:
+                return int(storage_input)
+            print("❌ 请输入0-100的数字！")
+
+class SimulatedFillEstimator(FillEstimator):
+    """模拟每投放一次垃圾存储增加 1-5%，增量由内部图片哈希决定"""
+    name = "simulated"
+
+    def analyze(self, inner_path):
+        """内部图片对应的存储增量，没有内部图片返回None"""
+        return 1 + image_digest(inner_path)[0] % 5 if inner_path else None
+
+    def estimate(self, location, cate_code, current_storage, inner_path=None, observation=None):
+        step = observation if observation is not None else self.analyze(inner_path)
+        if step is None:
+            step = 1 + image_digest(f"{location}_{cate_code}")[0] % 5
+        return min(100, int(current_storage) + step)
+
+CLASSIFIERS = {cls.name: cls for cls in (ManualClassifier, HashClassifier, BatchClassifier)}
+FILL_ESTIMATORS = {cls.name: cls for cls in (ManualFillEstimator, SimulatedFillEstimator)}
+
+_classifier = None
+_fill_estimator = None
+
+def get_classifier():
+    """获取 config.CLASSIFIER_BACKEND 对应的识别器"""
+    global _classifier
+    if _classifier is None:
+        if CLASSIFIER_BACKEND not in CLASSIFIERS:
+            raise ValueError(f"未知的识别后端：{CLASSIFIER_BACKEND}，可选：{', '.join(CLASSIFIERS)}")
+        _classifier = CLASSIFIERS[CLASSIFIER_BACKEND]()
+    return _classifier
+
+def get_fill_estimator():
+    """获取 config.FILL_ESTIMATOR_BACKEND 对应的存储估计器"""
+    global _fill_estimator
+    if _fill_estimator is None:
+        if FILL_ESTIMATOR_BACKEND not in FILL_ESTIMATORS:
+            raise ValueError(f"未知的存储估计后端：{FILL_ESTIMATOR_BACKEND}，可选：{', '.join(FILL_ESTIMATORS)}")
+        _fill_estimator = FILL_ESTIMATORS[FILL_ESTIMATOR_BACKEND]()
+    return _fill_estimator
+
+def set_backends(classifier=None, fill_estimator=None):
+    """按名称切换后端（供命令行参数和压力测试使用）"""
+    global _classifier, _fill_estimator
+    if classifier is not None:
+        _classifier = CLASSIFIERS[classifier]()
+    if fill_estimator is not None:
+        _fill_estimator = FILL_ESTIMATORS[fill_estimator]()
+
+def is_interactive():
+    """当前后端是否需要控制台人工输入"""
+    return get_classifier().interactive or get_fill_estimator().interactive
@@ -1,7 +1,116 @@
 # client.py - 垃圾桶客户端程序
 import socket
 import time
-from config import SERVER_HOST, SERVER_PORT
+from config import SERVER_HOST, SERVER_PORT, USE_FRAMED_PROTOCOL, CLIENT_SESSION, CLIENT_COMBINED_REQUEST
+from protocol import (MAGIC, TAG_REQUEST, TAG_INNER, TAG_DISPOSE, TAG_ERROR, TAG_BUSY, ServerBusyError,
+                      send_frame, read_frame)
+from session import BinSession
+
+CATEGORY_NAMES = {
+    "1": "可回收垃圾",
+    "2": "有害垃圾",
+    "3": "厨余垃圾",
+    "4": "其他垃圾"
+}
+
+def send_message(client_socket, tag, request_id, text):
+    """发送一条消息（分帧协议或旧的裸字符串）"""
+    if USE_FRAMED_PROTOCOL:
+        send_frame(client_socket, tag, request_id, text)
+    else:
+        client_socket.send(text.encode("utf-8"))
+
+def recv_message(client_socket, request_id):
+    """接收一条回复，返回文本内容"""
+    if not USE_FRAMED_PROTOCOL:
+        return client_socket.recv(1024).decode("utf-8")
+
+    frame = read_frame(client_socket)
+    if frame is None:
+        raise ConnectionResetError("服务器已关闭连接")
+    tag, reply_id, payload = frame
+    if tag == TAG_ERROR:
+        raise RuntimeError(f"服务器错误：{payload.decode('utf-8')}")
+    if tag == TAG_BUSY:
+        raise ServerBusyError(int(payload))  # 请求编号为0时是连接数已达上限
+    if reply_id != request_id:
+        raise RuntimeError(f"回复编号不匹配：期望 {request_id}，收到 {reply_id}")
+    return payload.decode("utf-8")
+
+class ConnectionExchange:
+    """一次投放：新建一个连接，两轮问答后关闭"""
+
+    def __init__(self):
+        print(f"\n🔗 正在连接服务器 {SERVER_HOST}:{SERVER_PORT}...")
+        self.client_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.client_socket.connect((SERVER_HOST, SERVER_PORT))
+        print("✅ 服务器连接成功")
+        if USE_FRAMED_PROTOCOL:
+            self.client_socket.sendall(MAGIC)  # 协议标识
+        self.request_id = 1
+
+    def ask(self, tag, text):
+        send_message(self.client_socket, tag, self.request_id, text)
+        self.client_socket.settimeout(30)  # 设置30秒接收超时
+        return recv_message(self.client_socket, self.request_id)
+
+    def close(self):
+        self.client_socket.close()
+
+class SessionExchange:
+    """一次投放：在长连接会话上使用一个新的请求编号，不需要重新连接"""
+
+    def __init__(self, session):
+        self.session = session
+        self.request_id = session.next_id()
+
+    def ask(self, tag, text):
+        return self.session.request(tag, self.request_id, text, timeout=30)
+
+    def close(self):
+        pass
+
+def show_storage(storage_str):
+    """显示服务器返回的存储情况"""
+    print("\n" + "=" * 30)
+    print("服务器最终响应：")
+    print("=" * 30)
+
+    try:
+        storage = int(storage_str)
+        print(f"📊 存储情况：{storage}%")
+
+        # 显示存储状态
+        if storage == 0:
+            print("🟢 状态：空")
+        elif storage <= 50:
+            print("🟡 状态：正常")
+        elif storage <= 80:
+            print("🟠 状态：较满")
+        elif storage <= 95:
+            print("🔴 状态：满")
+            print("⚠️  警报：请及时清理！")
+        else:
+            print("🔴 状态：已满")
+            print("🚨 紧急警报：垃圾桶已满，请立即清理！")
+
+    except ValueError:
+        print(f"📊 存储情况：{storage_str}% (解析错误)")
+
+def combined_exchange(exchange, outer_path, inner_path, location):
+    """合并请求：一轮发送两张图片和站点编号，服务器同时识别和分析存储"""
+    request_data = f"{outer_path}|{inner_path}|{location}"
+    print(f"📤 发送合并请求：外部图片={outer_path}, 内部图片={inner_path}, 站点={location}")
+
+    cate_str, _, storage_str = exchange.ask(TAG_DISPOSE, request_data).partition("|")
+    print(f"📥 收到垃圾类别：{cate_str}")
+    if cate_str == "5":
+        print("❌ 无法识别：无对应垃圾桶或垃圾类型")
+        print("❌ 操作终止")
+        return
+
+    print(f"🗑️  识别结果：{cate_str} ({CATEGORY_NAMES.get(cate_str, '未知类型')})")
+    show_storage(storage_str)
 
 def bin_client_program():
     """垃圾桶客户端主程序"""
@@ -11,6 +120,11 @@ def bin_client_program():
     print("模拟垃圾桶与服务器的交互")
     print("按 Ctrl+C 退出程序")
     print("-" * 50)
+
+    # 会话模式：保持一个长连接，多次投放复用（见 session.py）
+    session = BinSession() if USE_FRAMED_PROTOCOL and CLIENT_SESSION else None
+    # 合并请求模式：内部图片与外部图片一起发送（旧服务器只支持两轮，关闭 CLIENT_COMBINED_REQUEST）
+    combined = USE_FRAMED_PROTOCOL and CLIENT_COMBINED_REQUEST
     
     while True:
         try:
@@ -56,43 +170,42 @@ def bin_client_program():
                     continue
                     
                 break  # 格式正确
+
+            if combined:
+                # 合并请求在识别之前就要给出内部图片，无法提示类别
+                while True:
+                    inner_path = input(f"请输入内部垃圾桶图片路径（应为 {location}_类别.jpg）: ").strip()
+                    if not inner_path.endswith('.jpg'):
+                        print("❌ 图片格式必须是.jpg！")
+                        continue
+                    break  # 格式正确
             
-            # 连接服务器
-            print(f"\n🔗 正在连接服务器 {SERVER_HOST}:{SERVER_PORT}...")
+            # 连接服务器（会话模式下复用已有连接）
             try:
-                client_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                # 移除超时设置，使用阻塞模式
-                # client_socket.settimeout(30)  # 设置为30秒超时
-                client_socket.connect((SERVER_HOST, SERVER_PORT))
-                print("✅ 服务器连接成功")
+                exchange = SessionExchange(session) if session else ConnectionExchange()
                 
-                # 第一步：发送外部图片路径和站点编号
-                # 格式：外部图片路径|站点编号
-                request_data = f"{outer_path}|{location}"
-                client_socket.send(request_data.encode("utf-8"))
-                print(f"📤 已发送请求：外部图片={outer_path}, 站点={location}")
-                
-                # 接收服务器返回的垃圾类别
                 try:
-                    # 设置接收超时
-                    client_socket.settimeout(30)  # 设置30秒接收超时
-                    cate_str = client_socket.recv(1024).decode("utf-8")  # 垃圾类别
+                    if combined:
+                        combined_exchange(exchange, outer_path, inner_path, location)
+                        exchange.close()
+                        continue
+
+                    # 第一步：发送外部图片路径和站点编号，接收服务器返回的垃圾类别
+                    # 格式：外部图片路径|站点编号
+                    request_data = f"{outer_path}|{location}"
+                    print(f"📤 发送请求：外部图片={outer_path}, 站点={location}")
+
+                    cate_str = exchange.ask(TAG_REQUEST, request_data)  # 垃圾类别
                     print(f"📥 收到垃圾类别：{cate_str}")
                     
                     # 解析类别
                     if cate_str == "5":
                         print("❌ 无法识别：无对应垃圾桶或垃圾类型")
                         print("❌ 操作终止")
-                        client_socket.close()
+                        exchange.close()
                         continue
                     else:
-                        category_names = {
-                            "1": "可回收垃圾",
-                            "2": "有害垃圾", 
-                            "3": "厨余垃圾",
-                            "4": "其他垃圾"
-                        }
-                        cate_name = category_names.get(cate_str, "未知类型")
+                        cate_name = CATEGORY_NAMES.get(cate_str, "未知类型")
                         print(f"🗑️  识别结果：{cate_str} ({cate_name})")
                     
                     # 第三步：输入内部垃圾桶图片路径
@@ -121,47 +234,21 @@ def bin_client_program():
                         
                         break  # 格式正确
                     
-                    # 第二步：发送内部图片路径
-                    client_socket.send(inner_path.encode("utf-8"))
-                    print(f"📤 已发送内部图片：{inner_path}")
-                    
-                    # 接收服务器返回的存储情况
-                    storage_str = client_socket.recv(1024).decode("utf-8")  # 存储百分比
-                    
-                    print("\n" + "=" * 30)
-                    print("服务器最终响应：")
-                    print("=" * 30)
-                    
-                    # 显示存储情况
-                    try:
-                        storage = int(storage_str)
-                        print(f"📊 存储情况：{storage}%")
-                        
-                        # 显示存储状态
-                        if storage == 0:
-                            print("🟢 状态：空")
-                        elif storage <= 50:
-                            print("🟡 状态：正常")
-                        elif storage <= 80:
-                            print("🟠 状态：较满")
-                        elif storage <= 95:
-                            print("🔴 状态：满")
-                            print("⚠️  警报：请及时清理！")
-                        else:
-                            print("🔴 状态：已满")
-                            print("🚨 紧急警报：垃圾桶已满，请立即清理！")
-                            
-                    except ValueError:
-                        print(f"📊 存储情况：{storage_str}% (解析错误)")
+                    # 第二步：发送内部图片路径，接收服务器返回的存储情况
+                    print(f"📤 发送内部图片：{inner_path}")
+                    storage_str = exchange.ask(TAG_INNER, inner_path)  # 存储百分比
+                    show_storage(storage_str)
                         
                 except socket.timeout:
                     print("❌ 接收响应超时，请检查服务器状态")
+                except ServerBusyError as e:
+                    print(f"⏳ 服务器繁忙，请 {e.retry_after_ms / 1000:.1f} 秒后重新投放")
                 except ConnectionResetError:
                     print("❌ 连接被服务器重置")
                 except Exception as e:
                     print(f"❌ 接收响应失败：{e}")
                     
-                client_socket.close()
+                exchange.close()
                 
             except ConnectionRefusedError:
                 print("❌ 无法连接服务器！请检查：")
@@ -180,7 +267,9 @@ def bin_client_program():
         except Exception as e:
             print(f"❌ 程序出错：{e}")
             continue
-    
+
+    if session:
+        session.close()
     print("✅ 客户端已关闭")
 
 if __name__ == "__main__":
@@ -10,6 +10,112 @@ DB_CONFIG = {
     "charset": "utf8mb4"
 }
 
+# 数据库后端（见 repository.py）：mysql 使用上面的MySQL配置 / sqlite 嵌入式数据库，无需数据库服务器
+DB_BACKEND = "mysql"
+SQLITE_PATH = "garbage.db"      # sqlite 数据库文件（所有表在同一个文件中）
+SQLITE_BUSY_TIMEOUT = 5         # 等待其他连接释放写锁的最长时间（秒）
+
+# 数据库连接池配置（见 db_pool.py）
+DB_POOL_CONFIG = {
+    "min_size": 2,                  # 常驻连接数
+    "max_size": 20,                 # 最大连接数
+    "acquire_timeout": 5,           # 连接池耗尽时最长等待时间（秒）
+    "idle_timeout": 300,            # 多余空闲连接的回收时间（秒）
+    "health_check_interval": 30     # 空闲超过该时间的连接取出前先ping（秒）
+}
+
+# 图片信息数据库配置（DB_BACKEND = "mysql" 时 sql.py 使用）
+IMAGE_DB_CONFIG = {
+    "host": "localhost",
+    "user": "work",
+    "password": "1111",
+    "database": "image_database"
+}
+
 # 网络配置
 SERVER_HOST = "127.0.0.1"
-SERVER_PORT = 8888
\ No newline at end of file
+SERVER_PORT = 8888
+USE_FRAMED_PROTOCOL = True  # 客户端使用分帧协议（见 protocol.py），False 为旧的裸字符串协议
+CLIENT_SESSION = True       # 客户端保持长连接会话，多次投放复用一个连接（见 session.py，仅分帧协议）
+HEARTBEAT_INTERVAL = 15     # 会话空闲时发送心跳的间隔（秒）
+RECONNECT_BACKOFF_BASE = 0.5    # 重连等待时间的初始上限（秒），每次失败翻倍
+RECONNECT_BACKOFF_MAX = 30      # 重连等待时间的最大上限（秒）
+CLIENT_COMBINED_REQUEST = True  # 外部、内部图片和站点编号一次发送，一轮得到类别和存储（见 protocol.py 的 DSP，仅分帧协议）
+
+# 服务器并发配置
+SERVER_BACKLOG = 1024       # listen() 等待队列长度
+MAX_CONNECTIONS = 10000     # asyncio服务器同时保持的最大连接数
+MAX_THREAD_CONNECTIONS = 2000   # 线程模式服务器同时保持的最大连接数（每个连接一个线程）
+CLIENT_TIMEOUT = 60         # 单次接收超时（秒）
+SESSION_IDLE_TIMEOUT = 60   # 分帧协议连接超过该时间没有收到任何帧（包括心跳）时关闭（秒）
+
+# 过载保护配置（见 admission.py）
+SERVER_WORKERS = 32             # 同时处理的请求数（识别、存储分析）
+SERVER_QUEUE_DEPTH = 256        # 等待处理的请求数上限，超出时回复繁忙
+SERVER_QUEUE_TIMEOUT = 2        # 请求排队超过该时间时回复繁忙（秒）
+BUSY_RETRY_AFTER_MS = 500       # 服务器繁忙时建议客户端等待的时间（毫秒）
+LOCATION_RATE_LIMIT = 2         # 每个站点平均每秒最多新投放次数，0为不限制
+LOCATION_RATE_BURST = 5         # 每个站点最多连续投放次数
+
+# 预派生多进程配置（见 prefork.py）
+PREFORK_WORKERS = None          # 工作进程数，None 为CPU核数
+PREFORK_MODE = "thread"         # 工作进程中运行的服务器：thread（sever2.py）/ async（async_server.py）
+PREFORK_REPORT_INTERVAL = 1     # 工作进程上报计数和存储更新的间隔（秒）
+PREFORK_MIN_UPTIME = 5          # 工作进程运行不到该时间就退出时，等待一段时间再重启（秒）
+PREFORK_RESTART_BACKOFF_MAX = 30    # 连续快速退出时重启等待时间的上限（秒），每次翻倍
+
+# 垃圾知识缓存配置（见 knowledge_cache.py）
+KNOWLEDGE_CACHE_TTL = 600                # 强制整表重新加载的间隔（秒）
+KNOWLEDGE_VERSION_CHECK_INTERVAL = 5     # 检查知识库版本号的间隔（秒）
+
+# 图片上传配置（见 image_receiver.py）
+IMAGE_SPOOL_DIR = "spool"                # 上传图片暂存目录
+MAX_IMAGE_SIZE = 10 * 1024 * 1024        # 单张图片大小上限（字节）
+IMAGE_CHUNK_SIZE = 64 * 1024             # 接收时每次读取的块大小（字节）
+
+# 分析后端配置（见 classifier.py）
+CLASSIFIER_BACKEND = "manual"            # manual 人工输入 / hash 确定性自动识别 / batch 批量模型推理
+FILL_ESTIMATOR_BACKEND = "manual"        # manual 人工输入 / simulated 模拟存储增长
+
+# 批量推理配置（CLASSIFIER_BACKEND = "batch" 时使用，见 inference_pool.py）
+INFERENCE_WORKERS = None                 # 推理子进程数，None 为CPU核数
+INFERENCE_MAX_BATCH = 32                 # 每批最多图片数
+INFERENCE_MAX_WAIT_MS = 10               # 攒批最长等待时间（毫秒）
+INFERENCE_INPUT_SIZE = 32                # 模型输入尺寸（边长，像素）
+INFERENCE_WEIGHTS = ""                   # 模型权重文件（.npz，包含W和b），为空时使用固定种子生成的权重
+INFERENCE_TIMEOUT = 10                   # 等待推理结果的超时时间（秒）
+
+# 衍生图缓存配置（见 image_derivatives.py）
+DERIVATIVE_CACHE_DIR = "derivatives"     # 模型输入的缓存目录（按内容哈希存放，只由 sql.py --derivatives 写入）
+
+# 存储情况写入配置（见 storage_writer.py）
+STORAGE_WRITE_MODE = "sync"              # sync 每次立即写入 / write_behind 合并后批量写入
+STORAGE_FLUSH_INTERVAL_MS = 200          # write_behind 刷新间隔（毫秒）
+STORAGE_FLUSH_MAX_UPDATES = 500          # write_behind 累计多少个垃圾桶后立即刷新
+
+# 图片信息入库配置（见 sql.py）
+INGEST_WORKERS = None                    # 读取图片信息的并发数，None 为CPU核数
+INGEST_USE_PROCESSES = False             # True 使用进程池（解码受GIL限制时），False 使用线程池（以文件读取为主时）
+INGEST_BATCH_SIZE = 500                  # 每批写入数据库的行数（一次 executemany + 一次提交）
+INGEST_CHUNK_SIZE = 64                   # 每个任务处理的文件数，减少任务调度开销
+INGEST_PROGRESS_INTERVAL = 2             # 进度报告间隔（秒）
+INGEST_MANIFEST_PATH = "image_manifest.json"  # 变化检测清单（见 image_manifest.py）
+INGEST_DEDUP = True                      # 按内容哈希去重，相同内容只在 image_blobs 中记录一份
+IMAGE_BLOB_DIR = ""                      # 去重时每种内容在该目录保存一份副本（优先硬链接），为空则引用第一次见到的文件
+
+# 批量导入配置（init_db.py --bins/--knowledge）
+SEED_CHUNK_SIZE = 1000                   # 每次 executemany 的行数，整个导入在一个事务中提交
+
+# 垃圾名称模糊匹配配置（见 name_index.py）
+# 阈值越低，认错的字越多也能找到，但库中没有的名称也越容易被错配到别的类别（回复错误的类别比回复5更糟）。
+# bench_name_index.py（10万条名称）中：0.6 时改动一个字的名称 84% 找对，库中没有的名称 24% 被错配；
+# 0.7 且要求领先另一类别 0.05 时，改动一个字的 79% 找对，库中没有的错配降到 4%
+NAME_MATCH_MIN_CONFIDENCE = 0.7          # 低于该置信度视为未找到（1.0 为名称或别名精确匹配）
+NAME_MATCH_MIN_MARGIN = 0.05             # 另一类别的候选与最好的相差不到该值时视为未找到，0为不要求
+NAME_MATCH_MAX_CANDIDATES = 32           # 按共享片段数取出的候选个数，只对这些候选计算编辑距离
+
+# 存储情况看板配置（见 dashboard.py、fill_stats.py）
+DASHBOARD_HOST = "127.0.0.1"
+DASHBOARD_PORT = 8889                    # 只读 HTTP/JSON 看板接口端口，None 不启动
+DASHBOARD_TOP_N = 10                     # 默认返回最满的垃圾桶个数
+FILL_ALERT_THRESHOLD = 80                # 存储超过该百分比的垃圾桶计入 over_threshold
@@ -0,0 +1,90 @@
+# dashboard.py - 垃圾桶存储情况看板接口（只读 HTTP/JSON）
+# 服务器启动时在后台线程中监听 DASHBOARD_HOST:DASHBOARD_PORT，数据来自内存汇总（见 fill_stats.py），
+# 请求不访问数据库：
+#   GET /api/fill?top=N              总体和各类别的汇总，以及最满的 N 个垃圾桶
+#   GET /api/fill/locations          各位置的汇总
+#   GET /api/fill/locations/ABCDE    单个位置的汇总和各类别垃圾桶的存储
+#   GET /api/workers                 预派生模式下各工作进程和合计的运行计数（见 prefork.py）
+#   GET /metrics                     Prometheus 文本格式的计数和各阶段耗时直方图（见 metrics.py）
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+from config import DASHBOARD_HOST, DASHBOARD_PORT, DASHBOARD_TOP_N
+from fill_stats import get_fill_stats
+from metrics import get_worker_metrics, prometheus_text
+from repository import DB_ERRORS
+
+class DashboardHandler(BaseHTTPRequestHandler):
+    """看板请求处理"""
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        parts = [part for part in url.path.split("/") if part]
+        stats = get_fill_stats()
+
+        if parts == ["api", "fill"]:
+            try:
+                top = int(parse_qs(url.query).get("top", [DASHBOARD_TOP_N])[0])
+            except ValueError:
+                return self.send_json(400, {"error": "top 必须是整数"})
+            return self.send_json(200, stats.summary(max(top, 0)))
+
+        if parts == ["api", "fill", "locations"]:
+            return self.send_json(200, stats.locations())
+
+        if len(parts) == 4 and parts[:3] == ["api", "fill", "locations"]:
+            result = stats.location(parts[3])
+            if result is None:
+                return self.send_json(404, {"error": f"位置不存在：{parts[3]}"})
+            return self.send_json(200, result)
+
+        if parts == ["api", "workers"]:
+            return self.send_json(200, get_worker_metrics().snapshot())
+
+        if parts == ["metrics"]:
+            body = prometheus_text().encode("utf-8")
+            return self.send_body(200, body, "text/plain; version=0.0.4; charset=utf-8")
+
+        self.send_json(404, {"error": "未知的接口"})
+
+    def send_json(self, status, data):
+        body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+        self.send_body(status, body, "application/json; charset=utf-8")
+
+    def send_body(self, status, body, content_type):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Cache-Control", "no-store")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # 看板每秒轮询，不打印访问日志
+
+def start_dashboard(repository, host=DASHBOARD_HOST, port=DASHBOARD_PORT):
+    """读一次 trash_bin 建立存储情况汇总，并在后台线程中启动看板接口
+    返回 HTTP 服务器（用于关闭）；port 为 None 或启动失败时返回None"""
+    if port is None:
+        return None
+    try:
+        count = get_fill_stats().load(repository.list_bins())
+        print(f"📊 存储情况汇总已加载：{count} 个垃圾桶")
+    except DB_ERRORS as e:
+        print(f"⚠️  存储情况汇总加载失败，只包含启动后更新过的垃圾桶：{e}")
+
+    try:
+        server = ThreadingHTTPServer((host, port), DashboardHandler)
+    except OSError as e:
+        print(f"❌ 看板接口启动失败：{e}")
+        return None
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="dashboard", daemon=True).start()
+    print(f"📊 看板接口：http://{host}:{server.server_address[1]}/api/fill")
+    return server
+
+def stop_dashboard(server):
+    if server is not None:
+        server.shutdown()
+        server.server_close()
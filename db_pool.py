@@ -0,0 +1,237 @@
+# db_pool.py - 数据库连接池
+# 服务器每处理一个客户端都要 pymysql.connect 一次，建立连接的耗时远大于
+# 实际的 SELECT/UPDATE。这里维护一组可复用的连接：
+#   - min_size/max_size 限制连接数量
+#   - 空闲一段时间的连接在取出前先 ping 一次（健康检查）
+#   - 空闲超过 idle_timeout 的多余连接会被回收
+#   - 连接池耗尽时最多等待 acquire_timeout 秒，超时抛出 PoolTimeoutError
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+import pymysql
+from config import DB_CONFIG, DB_POOL_CONFIG
+
+class PoolTimeoutError(Exception):
+    """连接池耗尽，等待超时"""
+
+class ConnectionPool:
+    """线程安全的有界连接池，connect 为创建新连接的函数"""
+
+    def __init__(self, connect, min_size=2, max_size=20, acquire_timeout=5,
+                 idle_timeout=300, health_check_interval=30, name="default"):
+        if min_size > max_size:
+            raise ValueError("min_size 不能大于 max_size")
+        self.connect = connect
+        self.min_size = min_size
+        self.max_size = max_size
+        self.acquire_timeout = acquire_timeout
+        self.idle_timeout = idle_timeout
+        self.health_check_interval = health_check_interval
+        self.name = name
+
+        self._idle = deque()        # (连接, 放回时间)，右端为最近使用
+        self._size = 0              # 已创建且未关闭的连接数（含正在使用的）
+        self._closed = False
+        self._cond = threading.Condition()
+        self._reaper = None
+
+        # 统计信息
+        self._stats = {
+            "acquired": 0,          # 成功取出次数
+            "waited": 0,            # 需要等待才取到连接的次数
+            "wait_time_total": 0.0, # 累计等待时间（秒）
+            "wait_time_max": 0.0,   # 最长等待时间（秒）
+            "timeouts": 0,          # 连接池耗尽导致的超时次数
+            "created": 0,           # 新建连接数
+            "closed": 0,            # 关闭连接数
+            "reaped": 0,            # 因空闲被回收的连接数
+            "health_failures": 0,   # 健康检查失败次数
+        }
+
+    def _open_connection(self):
+        """创建新连接（调用方已预留 _size 名额）"""
+        try:
+            conn = self.connect()
+        except Exception:
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            raise
+        with self._cond:
+            self._stats["created"] += 1
+        return conn
+
+    def _close_connection(self, conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+        with self._cond:
+            self._size -= 1
+            self._stats["closed"] += 1
+            self._cond.notify()
+
+    def _is_healthy(self, conn):
+        try:
+            conn.ping()
+            return True
+        except Exception:
+            with self._cond:
+                self._stats["health_failures"] += 1
+            return False
+
+    def warm_up(self):
+        """预先建立 min_size 个连接，失败时打印提示并返回False"""
+        try:
+            while True:
+                with self._cond:
+                    if self._closed or self._size >= self.min_size:
+                        return True
+                    self._size += 1
+                conn = self._open_connection()
+                with self._cond:
+                    self._idle.append((conn, time.monotonic()))
+                    self._cond.notify()
+        except Exception as e:
+            print(f"❌ 连接池[{self.name}]预热失败：{e}")
+            return False
+
+    def acquire(self, timeout=None):
+        """取出一个连接，连接池耗尽时最多等待 timeout 秒"""
+        if timeout is None:
+            timeout = self.acquire_timeout
+        start = time.monotonic()
+        deadline = start + timeout
+        waited = False
+
+        while True:
+            conn = None
+            idle_since = None
+            with self._cond:
+                while True:
+                    if self._closed:
+                        raise PoolTimeoutError(f"连接池[{self.name}]已关闭")
+                    if self._idle:
+                        conn, idle_since = self._idle.pop()
+                        break
+                    if self._size < self.max_size:
+                        self._size += 1
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._stats["timeouts"] += 1
+                        raise PoolTimeoutError(
+                            f"连接池[{self.name}]耗尽：{self.max_size} 个连接均在使用中，等待 {timeout} 秒超时"
+                        )
+                    waited = True
+                    self._cond.wait(remaining)
+
+            if conn is None:
+                conn = self._open_connection()
+            elif time.monotonic() - idle_since >= self.health_check_interval and not self._is_healthy(conn):
+                # 连接已失效（如MySQL wait_timeout断开），丢弃后重新获取
+                self._close_connection(conn)
+                continue
+
+            wait_time = time.monotonic() - start
+            with self._cond:
+                self._stats["acquired"] += 1
+                if waited:
+                    self._stats["waited"] += 1
+                self._stats["wait_time_total"] += wait_time
+                self._stats["wait_time_max"] = max(self._stats["wait_time_max"], wait_time)
+            return conn
+
+    def release(self, conn, broken=False):
+        """放回连接；broken=True 表示连接已不可用，直接关闭"""
+        if not broken and not self._closed:
+            # 结束未提交的事务，避免下一个使用者读到旧快照；回滚失败说明连接已断开
+            try:
+                conn.rollback()
+            except Exception:
+                broken = True
+        if broken or self._closed:
+            self._close_connection(conn)
+            return
+        with self._cond:
+            self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+        self.reap_idle()
+
+    @contextmanager
+    def connection(self, timeout=None):
+        """with pool.connection() as conn: ... 用完自动放回"""
+        conn = self.acquire(timeout)
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def reap_idle(self):
+        """关闭空闲超过 idle_timeout 的多余连接，保留至少 min_size 个"""
+        expired = []
+        now = time.monotonic()
+        with self._cond:
+            # 左端是最久未使用的连接
+            while (self._idle and self._size - len(expired) > self.min_size
+                   and now - self._idle[0][1] >= self.idle_timeout):
+                expired.append(self._idle.popleft()[0])
+            self._stats["reaped"] += len(expired)
+        for conn in expired:
+            self._close_connection(conn)
+        return len(expired)
+
+    def start_reaper(self, interval=30):
+        """启动后台线程定期回收空闲连接"""
+        if self._reaper is not None:
+            return
+
+        def run():
+            while not self._closed:
+                time.sleep(interval)
+                self.reap_idle()
+
+        self._reaper = threading.Thread(target=run, name=f"pool-reaper-{self.name}", daemon=True)
+        self._reaper.start()
+
+    def stats(self):
+        """返回统计信息快照"""
+        with self._cond:
+            stats = dict(self._stats)
+            stats["size"] = self._size
+            stats["idle"] = len(self._idle)
+            stats["in_use"] = self._size - len(self._idle)
+        stats["wait_time_avg"] = stats["wait_time_total"] / stats["acquired"] if stats["acquired"] else 0.0
+        return stats
+
+    def print_stats(self):
+        """打印统计信息"""
+        s = self.stats()
+        print(f"📊 连接池[{self.name}]：连接 {s['size']} 个（使用中 {s['in_use']}，空闲 {s['idle']}），"
+              f"取出 {s['acquired']} 次，等待 {s['waited']} 次，"
+              f"平均等待 {s['wait_time_avg'] * 1000:.1f}ms，最长等待 {s['wait_time_max'] * 1000:.1f}ms，"
+              f"耗尽超时 {s['timeouts']} 次，新建 {s['created']}，回收 {s['reaped']}，"
+              f"健康检查失败 {s['health_failures']}")
+
+    def close(self):
+        """关闭连接池及所有空闲连接"""
+        with self._cond:
+            self._closed = True
+            idle = [conn for conn, _ in self._idle]
+            self._idle.clear()
+            self._cond.notify_all()
+        for conn in idle:
+            self._close_connection(conn)
+
+# 默认连接池（information数据库），首次使用时创建
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_pool():
+    """获取 DB_CONFIG 对应的全局连接池"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ConnectionPool(lambda: pymysql.connect(**DB_CONFIG), name="information", **DB_POOL_CONFIG)
+        return _pool
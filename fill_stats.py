@@ -0,0 +1,125 @@
+# fill_stats.py - 垃圾桶存储情况的内存汇总
+# 看板每秒轮询一次，如果每次都 SELECT 整个 trash_bin 再排序，垃圾桶一多数据库就被看板拖慢。
+# 这里在服务器启动时读一次 trash_bin，之后每次存储更新（StorageWriter.write）时增量维护：
+#   - 每个位置、每个类别：垃圾桶数、存储总和（求平均）、超过 FILL_ALERT_THRESHOLD 的个数
+#   - 按存储值（0-100）分桶的集合，取最满的 N 个只需从 100 往下数，不用排序
+# 每次更新和查询汇总都是 O(1) / O(N)，与垃圾桶总数无关。
+# 其他进程（如 init_db.py）新增的垃圾桶在服务器重启或该垃圾桶第一次更新时才出现在汇总中。
+import threading
+from itertools import islice
+from config import FILL_ALERT_THRESHOLD
+
+class FillStats:
+    """垃圾桶存储情况汇总"""
+
+    def __init__(self, threshold=FILL_ALERT_THRESHOLD):
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self._storage = {}                              # (位置, 类别) -> 存储
+        self._locations = {}                            # 位置 -> [垃圾桶数, 存储总和, 超过阈值的个数]
+        self._categories = {}                           # 类别 -> [垃圾桶数, 存储总和, 超过阈值的个数]
+        self._buckets = [set() for _ in range(101)]     # 存储值 -> {(位置, 类别)}
+        self._updates = 0
+
+    def load(self, bins):
+        """用 [(位置, 类别, 存储)] 重建汇总（如 repository.list_bins() 的结果），返回垃圾桶数"""
+        with self._lock:
+            self._reset()
+            for location, cate_id, storage in bins:
+                self._set(location.upper(), int(cate_id), storage)
+            return len(self._storage)
+
+    def update(self, location, cate_id, storage):
+        """记录一次存储更新"""
+        with self._lock:
+            self._set(location.upper(), int(cate_id), storage)
+            self._updates += 1
+
+    def _set(self, location, cate_id, storage):
+        storage = min(max(int(storage or 0), 0), 100)
+        key = (location, cate_id)
+        old = self._storage.get(key)
+        if old == storage:
+            return
+        if old is not None:
+            self._buckets[old].discard(key)
+        self._storage[key] = storage
+        self._buckets[storage].add(key)
+
+        for groups, group in ((self._locations, location), (self._categories, cate_id)):
+            totals = groups.setdefault(group, [0, 0, 0])
+            if old is None:
+                totals[0] += 1
+            else:
+                totals[1] -= old
+                totals[2] -= old >= self.threshold
+            totals[1] += storage
+            totals[2] += storage >= self.threshold
+
+    def _describe(self, totals):
+        count, total, over = totals
+        return {"bins": count, "average": round(total / count, 1) if count else 0.0,
+                "over_threshold": over}
+
+    def top(self, n):
+        """最满的 n 个垃圾桶 [(位置, 类别, 存储)]，由满到空（存储相同的垃圾桶之间不排序）"""
+        result = []
+        with self._lock:
+            for storage in range(100, -1, -1):
+                if len(result) >= n:
+                    break
+                result.extend((location, cate_id, storage)
+                              for location, cate_id in islice(self._buckets[storage], n - len(result)))
+        return result
+
+    def summary(self, top=10):
+        """总体、各类别的汇总和最满的 top 个垃圾桶"""
+        with self._lock:
+            totals = [sum(values) for values in zip(*self._categories.values())] or [0, 0, 0]
+            summary = self._describe(totals)
+            summary["threshold"] = self.threshold
+            summary["locations"] = len(self._locations)
+            summary["updates"] = self._updates
+            summary["categories"] = {str(cate_id): self._describe(values)
+                                     for cate_id, values in sorted(self._categories.items())}
+        summary["top"] = [{"location": location, "category": cate_id, "storage": storage}
+                          for location, cate_id, storage in self.top(top)]
+        return summary
+
+    def locations(self):
+        """各位置的汇总 {位置: {...}}"""
+        with self._lock:
+            return {location: self._describe(values) for location, values in sorted(self._locations.items())}
+
+    def location(self, location):
+        """单个位置的汇总和各类别垃圾桶的存储，位置不存在返回None"""
+        location = location.upper()
+        with self._lock:
+            if location not in self._locations:
+                return None
+            result = self._describe(self._locations[location])
+            result["location"] = location
+            result["storage"] = {str(cate_id): self._storage[(location, cate_id)]
+                                 for cate_id in sorted(self._categories) if (location, cate_id) in self._storage}
+            return result
+
+# 全局汇总，首次使用时创建
+_stats = None
+_stats_lock = threading.Lock()
+
+def get_fill_stats():
+    """获取全局存储情况汇总"""
+    global _stats
+    with _stats_lock:
+        if _stats is None:
+            _stats = FillStats()
+        return _stats
+
+def set_fill_stats(stats):
+    """替换全局存储情况汇总（预派生模式的工作进程转发给主进程），需在服务器启动前调用"""
+    global _stats
+    with _stats_lock:
+        _stats = stats
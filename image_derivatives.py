@@ -0,0 +1,69 @@
+# image_derivatives.py - 模型输入的磁盘缓存
+# 摄像头上传的是完整分辨率的照片（如 1.jpg 约 380KB），识别只需要 INFERENCE_INPUT_SIZE x
+# INFERENCE_INPUT_SIZE 的 RGB uint8 数组。JPEG 用 Image.draft 在解码时按 1/2、1/4、1/8 缩小，
+# 其他格式解码后先用 Image.reduce 做整数倍缩小，再缩放到模型输入尺寸。
+# 缓存（.npy）按内容哈希（与 images.content_hash 相同）存放在 DERIVATIVE_CACHE_DIR 中：
+#   - 只由入库（sql.py --derivatives）写入，入库的图片数量有限，缓存大小随图片库增长
+#   - 服务器只读缓存：上传的图片带着接收时算好的内容哈希（见 image_receiver.spool_digest），
+#     与已入库的图片内容相同时直接读缓存，否则在内存中解码，不写磁盘，不会随投放次数无限增长
+import os
+import uuid
+import numpy as np
+from PIL import Image
+from config import DERIVATIVE_CACHE_DIR, INFERENCE_INPUT_SIZE
+from image_manifest import file_digest
+
+def cache_path(content_hash, input_size=INFERENCE_INPUT_SIZE, cache_dir=DERIVATIVE_CACHE_DIR):
+    """模型输入的缓存路径"""
+    return os.path.join(cache_dir, content_hash[:2], f"{content_hash}_input{input_size}.npy")
+
+def decode_reduced(image_path, min_size):
+    """解码为RGB图，尺寸缩小到两边都不小于 min_size（原图更小时保持原尺寸）"""
+    with Image.open(image_path) as img:
+        # JPEG 在解码时直接缩小，其他格式忽略
+        img.draft("RGB", (min_size, min_size))
+        img = img.convert("RGB")
+    factor = min(img.width // min_size, img.height // min_size)
+    if factor >= 2:
+        img = img.reduce(factor)
+    return img
+
+def decode_model_input(image_path, input_size=INFERENCE_INPUT_SIZE):
+    """在内存中解码出模型输入数组 (input_size, input_size, 3)"""
+    img = decode_reduced(image_path, input_size)
+    return np.asarray(img.resize((input_size, input_size), Image.BILINEAR), dtype=np.uint8)
+
+def write_atomic(path, save):
+    """先写临时文件再改名，并发生成同一份缓存时不会读到写了一半的文件"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp_path = f"{path}.{uuid.uuid4().hex}.part"
+    try:
+        save(temp_path)
+        os.replace(temp_path, path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+def save_array(path, array):
+    # np.save 会给没有 .npy 后缀的文件名补上后缀，这里传入文件对象
+    with open(path, "wb") as f:
+        np.save(f, array)
+
+def ensure_derivatives(image_path, content_hash=None, input_size=INFERENCE_INPUT_SIZE):
+    """（入库时）生成模型输入缓存，已存在时跳过，返回缓存路径"""
+    content_hash = content_hash or file_digest(image_path)
+    input_path = cache_path(content_hash, input_size)
+    if not os.path.exists(input_path):
+        array = decode_model_input(image_path, input_size)
+        write_atomic(input_path, lambda path: save_array(path, array))
+    return input_path
+
+def load_model_input(image_path, input_size=INFERENCE_INPUT_SIZE, content_hash=None):
+    """模型输入数组 (input_size, input_size, 3)：content_hash 已知且有缓存时读缓存，
+    否则在内存中解码（不写缓存，也不为查缓存去读整个文件算哈希）"""
+    if content_hash:
+        try:
+            return np.load(cache_path(content_hash, input_size))
+        except (OSError, ValueError):
+            pass
+    return decode_model_input(image_path, input_size)
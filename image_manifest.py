@@ -0,0 +1,80 @@
+# image_manifest.py - 图片入库的变化检测清单
+# sql.py 每次运行都会重新读取所有图片并依赖 ON DUPLICATE KEY UPDATE 去重，
+# 对没有变化的文件夹重新扫描一遍和第一次一样慢。清单记录上次入库时每个文件的
+# (大小, 修改时间, 内容哈希)，保存在本地 JSON 文件中：
+#   - 大小和修改时间都没变的文件直接跳过，不打开也不写数据库
+#   - 修改时间变了但内容哈希相同（如被复制/touch）的文件只计算哈希，不用 Pillow 打开；
+#     不去重（sql.py --no-dedup）时不计算哈希，这些文件只读文件头重新入库
+#   - 清单中有、这次扫描中没有的文件视为已删除，从 images 表和清单中移除
+# 清单与数据库不一致时（如清空了 images 表），用 sql.py --full 忽略清单完整扫描一次。
+import hashlib
+import json
+import os
+from config import INGEST_MANIFEST_PATH
+
+MANIFEST_VERSION = 1
+
+def file_digest(file_path, chunk_size=1024 * 1024):
+    """文件内容哈希（blake2b，16字节，十六进制）"""
+    digest = hashlib.blake2b(digest_size=16)
+    with open(file_path, "rb") as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            digest.update(chunk)
+    return digest.hexdigest()
+
+class ImageManifest:
+    """路径 -> [大小, 修改时间(纳秒), 内容哈希或None]"""
+
+    def __init__(self, path=INGEST_MANIFEST_PATH):
+        self.path = path
+        self.files = {}
+        self.dirty = False
+
+    def load(self):
+        """读取清单文件，不存在或损坏时从空清单开始，返回条目数"""
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("version") == MANIFEST_VERSION:
+                self.files = data["files"]
+        except FileNotFoundError:
+            pass
+        except (ValueError, KeyError, AttributeError) as e:
+            print(f"⚠️  清单文件 {self.path} 无法读取，将完整扫描：{e}")
+        return len(self.files)
+
+    def get(self, file_path):
+        return self.files.get(file_path)
+
+    def is_unchanged(self, file_path, size, mtime_ns):
+        entry = self.files.get(file_path)
+        return entry is not None and entry[0] == size and entry[1] == mtime_ns
+
+    def update(self, file_path, size, mtime_ns, digest=None):
+        self.files[file_path] = [size, mtime_ns, digest]
+        self.dirty = True
+
+    def remove(self, file_path):
+        if self.files.pop(file_path, None) is not None:
+            self.dirty = True
+
+    def paths_under(self, folder_path):
+        """清单中位于 folder_path 及其子文件夹中的所有路径"""
+        prefix = os.path.join(folder_path, "")
+        return [file_path for file_path in self.files if file_path.startswith(prefix)]
+
+    def save(self):
+        """写入临时文件后替换，中途退出不会留下损坏的清单"""
+        if not self.dirty:
+            return
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        temp_path = self.path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump({"version": MANIFEST_VERSION, "files": self.files}, f,
+                      ensure_ascii=False, separators=(",", ":"))
+        os.replace(temp_path, self.path)
+        self.dirty = False
@@ -0,0 +1,64 @@
+# image_probe.py - 只读文件头获取图片尺寸
+# 入库时 get_image_info 为了宽高和格式要为每个文件构造一个 PIL Image。
+# 宽高其实就在文件头里：
+#   PNG   签名后的第一个块 IHDR，偏移 16 处为 4 字节宽、4 字节高（大端）
+#   JPEG  逐个跳过标记段，直到 SOFn 段：精度(1) 高(2) 宽(2)
+# 这里只读取这几个字节（JPEG 按段长度 seek，EXIF 缩略图等大段不会被读取），
+# 无法解析的文件（其他格式、损坏的头）返回None，由调用方退回 Pillow。
+import struct
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+# SOF0-SOF15 中不是帧头的标记：DHT、JPG扩展、DAC
+NON_SOF_MARKERS = {0xC4, 0xC8, 0xCC}
+
+# 没有长度字段的独立标记：TEM、RST0-RST7
+STANDALONE_MARKERS = {0x01} | set(range(0xD0, 0xD8))
+
+def probe_png(f, head):
+    if len(head) < 24 or head[12:16] != b"IHDR":
+        return None
+    width, height = struct.unpack(">II", head[16:24])
+    return width, height, "PNG"
+
+def probe_jpeg(f, max_segments=256):
+    f.seek(2)
+    for _ in range(max_segments):
+        if f.read(1) != b"\xff":
+            return None
+        marker = f.read(1)
+        while marker == b"\xff":   # 段之间可能有填充的 0xFF
+            marker = f.read(1)
+        if not marker:
+            return None
+        code = marker[0]
+        if code in STANDALONE_MARKERS:
+            continue
+        if code in (0xD9, 0xDA):
+            return None     # 到了图像数据或结尾还没有帧头
+        length_bytes = f.read(2)
+        if len(length_bytes) < 2:
+            return None
+        length = struct.unpack(">H", length_bytes)[0]
+        if length < 2:
+            return None
+        if 0xC0 <= code <= 0xCF and code not in NON_SOF_MARKERS:
+            data = f.read(5)
+            if len(data) < 5:
+                return None
+            height, width = struct.unpack(">HH", data[1:5])
+            if width == 0 or height == 0:
+                return None     # 高度为0表示在DNL段中给出，交给 Pillow
+            return width, height, "JPEG"
+        f.seek(length - 2, 1)
+    return None
+
+def probe_dimensions(image_path):
+    """只读文件头获取 (宽, 高, 格式)，格式名与 Pillow 一致；无法解析返回None"""
+    with open(image_path, "rb") as f:
+        head = f.read(32)
+        if head.startswith(PNG_SIGNATURE):
+            return probe_png(f, head)
+        if head.startswith(b"\xff\xd8"):
+            return probe_jpeg(f)
+    return None
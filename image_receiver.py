@@ -0,0 +1,125 @@
+# image_receiver.py - 图片上传接收
+# 摄像头通过 IMG 帧上传图片（transport.py 格式：IMG + 8字节长度 + 数据；分帧协议中为
+# IMG + 请求编号 + 8字节长度 + 数据）。这里按块边收边写入暂存目录，不在内存中缓存整张图片，
+# 超过大小限制的图片直接拒绝。
+# 暂存文件只在处理一个请求期间使用，请求处理完（或连接关闭时仍未使用）即删除（见 discard_images）。
+# 接收时顺便计算内容哈希（与 image_manifest.file_digest 相同）并写进文件名，
+# 识别时用它查模型输入缓存（见 image_derivatives.py），不必再读一遍文件。
+import hashlib
+import os
+import re
+import time
+import uuid
+from config import IMAGE_SPOOL_DIR, MAX_IMAGE_SIZE, IMAGE_CHUNK_SIZE
+
+class ImageTooLargeError(Exception):
+    """上传的图片超过 MAX_IMAGE_SIZE"""
+
+def guess_extension(head):
+    """根据文件头判断图片格式"""
+    if head.startswith(b"\xff\xd8"):
+        return ".jpg"
+    if head.startswith(b"\x89PNG"):
+        return ".png"
+    return ".bin"
+
+def new_spool_path(spool_dir=IMAGE_SPOOL_DIR):
+    """生成暂存文件路径（不含扩展名），按日期分目录"""
+    day_dir = os.path.join(spool_dir, time.strftime("%Y%m%d"))
+    os.makedirs(day_dir, exist_ok=True)
+    return os.path.join(day_dir, f"{time.strftime('%H%M%S')}_{uuid.uuid4().hex[:12]}")
+
+# 暂存文件名：时分秒_随机编号_内容哈希.扩展名
+_SPOOL_NAME = re.compile(r"\d{6}_[0-9a-f]{12}_([0-9a-f]{32})\.\w+")
+
+def spool_digest(path, spool_dir=IMAGE_SPOOL_DIR):
+    """暂存图片接收时计算的内容哈希，不是暂存图片时返回None"""
+    if not os.path.abspath(path).startswith(os.path.abspath(spool_dir) + os.sep):
+        return None
+    match = _SPOOL_NAME.fullmatch(os.path.basename(path))
+    return match.group(1) if match else None
+
+def check_size(size, max_size=MAX_IMAGE_SIZE):
+    if size > max_size:
+        raise ImageTooLargeError(f"图片过大：{size} 字节，上限 {max_size} 字节")
+    if size == 0:
+        raise ValueError("图片为空")
+
+class SpoolWriter:
+    """把图片数据写入暂存目录：先写临时文件，完整收到后再改名，避免留下半张图片"""
+
+    def __init__(self, size, spool_dir=IMAGE_SPOOL_DIR):
+        self.size = size
+        self.received = 0
+        self.base = new_spool_path(spool_dir)
+        self.tmp_path = self.base + ".part"
+        self.file = open(self.tmp_path, "wb")
+        self.head = b""
+        self.digest = hashlib.blake2b(digest_size=16)
+
+    def write(self, chunk):
+        if not self.head:
+            self.head = chunk[:8]
+        self.file.write(chunk)
+        self.digest.update(chunk)
+        self.received += len(chunk)
+
+    def remaining(self):
+        return self.size - self.received
+
+    def finish(self):
+        """写入完成，返回最终文件路径"""
+        self.file.close()
+        path = f"{self.base}_{self.digest.hexdigest()}{guess_extension(self.head)}"
+        os.replace(self.tmp_path, path)
+        return path
+
+    def abort(self):
+        """接收失败，删除临时文件"""
+        try:
+            self.file.close()
+            os.remove(self.tmp_path)
+        except OSError:
+            pass
+
+def discard_images(paths):
+    """删除已经用完的暂存图片"""
+    for path in paths:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+def receive_image(sock, size, spool_dir=IMAGE_SPOOL_DIR, max_size=MAX_IMAGE_SIZE):
+    """从套接字读取 size 字节的图片并写入暂存目录，返回文件路径"""
+    check_size(size, max_size)
+    writer = SpoolWriter(size, spool_dir)
+    try:
+        while writer.remaining() > 0:
+            chunk = sock.recv(min(IMAGE_CHUNK_SIZE, writer.remaining()))
+            if not chunk:
+                raise ConnectionResetError("图片接收中连接已关闭")
+            writer.write(chunk)
+        path = writer.finish()
+    except BaseException:
+        writer.abort()
+        raise
+    print(f"🖼️  已接收图片：{path}（{size / 1024:.1f}KB）")
+    return path
+
+async def receive_image_async(reader, size, spool_dir=IMAGE_SPOOL_DIR, max_size=MAX_IMAGE_SIZE):
+    """asyncio版本的 receive_image"""
+    check_size(size, max_size)
+    writer = SpoolWriter(size, spool_dir)
+    try:
+        while writer.remaining() > 0:
+            chunk = await reader.read(min(IMAGE_CHUNK_SIZE, writer.remaining()))
+            if not chunk:
+                raise ConnectionResetError("图片接收中连接已关闭")
+            writer.write(chunk)
+        path = writer.finish()
+    except BaseException:
+        writer.abort()
+        raise
+    print(f"🖼️  已接收图片：{path}（{size / 1024:.1f}KB）")
+    return path
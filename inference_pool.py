@@ -0,0 +1,179 @@
+# inference_pool.py - 批量CPU推理进程池
+# 每个连接处理线程各自做推理会让CPU和GIL互相争抢。这里把所有连接的外部图片集中起来：
+#   - 批处理线程把请求攒成一批（最多 INFERENCE_MAX_BATCH 张，或最多等待 INFERENCE_MAX_WAIT_MS 毫秒）
+#   - 整批交给进程池，在子进程中取模型输入（见 image_derivatives.py：已知内容哈希且入库时
+#     生成过缓存的直接读取，否则用 draft 模式在内存中缩小解码）
+#   - 用 NumPy 对整批做向量化计算（线性模型 + softmax），结果按请求返回给等待的连接
+# 模型权重可通过 INFERENCE_WEIGHTS 指定（.npz，包含 W 和 b）；未指定时使用固定随机种子生成的权重，
+# 结果是确定性的，用于联调和压力测试。
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+import numpy as np
+from config import (INFERENCE_WORKERS, INFERENCE_MAX_BATCH, INFERENCE_MAX_WAIT_MS,
+                    INFERENCE_INPUT_SIZE, INFERENCE_WEIGHTS)
+from image_derivatives import load_model_input
+
+# ---------------------------- 子进程中执行 ----------------------------
+
+_models = {}
+
+def load_model(num_classes, input_size):
+    """加载（或生成）模型权重，每个子进程按 (类别数, 输入尺寸) 缓存"""
+    key = (num_classes, input_size)
+    if key not in _models:
+        dim = input_size * input_size * 3
+        if INFERENCE_WEIGHTS and os.path.exists(INFERENCE_WEIGHTS):
+            data = np.load(INFERENCE_WEIGHTS)
+            weights, bias = data["W"].astype(np.float32), data["b"].astype(np.float32)
+            if weights.shape != (dim, num_classes):
+                raise ValueError(f"模型权重形状 {weights.shape} 与输入 ({dim}, {num_classes}) 不匹配")
+        else:
+            rng = np.random.default_rng(20240601)
+            weights = (rng.standard_normal((dim, num_classes)) / np.sqrt(dim)).astype(np.float32)
+            bias = np.zeros(num_classes, dtype=np.float32)
+        _models[key] = (weights, bias)
+    return _models[key]
+
+def decode_image(image_path, input_size, content_hash=None):
+    """input_size x input_size 的RGB数组"""
+    return load_model_input(image_path, input_size, content_hash)
+
+def infer_batch(images, num_classes, input_size):
+    """对一批图片 [(路径, 内容哈希或None)] 做推理，返回 [(类别下标, 置信度)]，无法解码的图片返回 (-1, 0.0)"""
+    batch = np.zeros((len(images), input_size, input_size, 3), dtype=np.uint8)
+    valid = np.zeros(len(images), dtype=bool)
+    for i, (path, content_hash) in enumerate(images):
+        try:
+            batch[i] = decode_image(path, input_size, content_hash)
+            valid[i] = True
+        except Exception:
+            pass
+
+    weights, bias = load_model(num_classes, input_size)
+    x = batch.reshape(len(images), -1).astype(np.float32) / 255.0
+    x -= x.mean(axis=1, keepdims=True)
+    logits = x @ weights + bias
+    logits -= logits.max(axis=1, keepdims=True)
+    probs = np.exp(logits)
+    probs /= probs.sum(axis=1, keepdims=True)
+
+    indices = probs.argmax(axis=1)
+    confidences = probs.max(axis=1)
+    return [(int(indices[i]), float(confidences[i])) if valid[i] else (-1, 0.0)
+            for i in range(len(images))]
+
+# ---------------------------- 服务器进程中执行 ----------------------------
+
+class BatchInferencePool:
+    """把并发请求攒批后交给进程池推理"""
+
+    def __init__(self, workers=INFERENCE_WORKERS, max_batch=INFERENCE_MAX_BATCH,
+                 max_wait_ms=INFERENCE_MAX_WAIT_MS, input_size=INFERENCE_INPUT_SIZE):
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self.input_size = input_size
+        self.executor = ProcessPoolExecutor(max_workers=workers or os.cpu_count())
+        self._queue = queue.Queue()
+        self._closed = False
+        self._stats_lock = threading.Lock()
+        self._stats = {"requests": 0, "batches": 0, "failed": 0}
+        self._thread = threading.Thread(target=self._batch_loop, name="inference-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, image_path, num_classes, content_hash=None):
+        """提交一张图片，返回 Future，结果为 (类别下标, 置信度)；content_hash 已知时用于查模型输入缓存"""
+        if self._closed:
+            raise RuntimeError("推理进程池已关闭")
+        future = Future()
+        self._queue.put((image_path, num_classes, future, content_hash))
+        return future
+
+    def _collect_batch(self, first):
+        """从第一个请求开始攒批，直到达到批大小或等待超时"""
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is None:
+                self._queue.put(None)  # 留给主循环处理关闭
+                break
+            batch.append(item)
+        return batch
+
+    def _batch_loop(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            batch = self._collect_batch(item)
+
+            # 知识库刷新后类别数可能变化，按类别数分组
+            groups = {}
+            for entry in batch:
+                groups.setdefault(entry[1], []).append(entry)
+            for num_classes, entries in groups.items():
+                self._dispatch(entries, num_classes)
+
+    def _dispatch(self, entries, num_classes):
+        images = [(path, content_hash) for path, _, _, content_hash in entries]
+        futures = [future for _, _, future, _ in entries]
+        with self._stats_lock:
+            self._stats["requests"] += len(entries)
+            self._stats["batches"] += 1
+
+        def done(result_future):
+            try:
+                results = result_future.result()
+            except Exception as e:
+                with self._stats_lock:
+                    self._stats["failed"] += len(futures)
+                for future in futures:
+                    future.set_exception(e)
+                return
+            for future, result in zip(futures, results):
+                future.set_result(result)
+
+        try:
+            self.executor.submit(infer_batch, images, num_classes, self.input_size).add_done_callback(done)
+        except Exception as e:
+            for future in futures:
+                future.set_exception(e)
+
+    def stats(self):
+        """返回统计信息快照"""
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats["avg_batch"] = stats["requests"] / stats["batches"] if stats["batches"] else 0.0
+        return stats
+
+    def close(self):
+        """停止攒批并关闭进程池"""
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(None)
+        self._thread.join(timeout=5)
+        self.executor.shutdown(wait=True, cancel_futures=True)
+        s = self.stats()
+        print(f"📊 推理进程池：请求 {s['requests']} 次，批次 {s['batches']} 个，"
+              f"平均批大小 {s['avg_batch']:.1f}，失败 {s['failed']} 次")
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_inference_pool():
+    """获取全局推理进程池，首次使用时启动"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = BatchInferencePool()
+        return _pool
@@ -1,54 +1,61 @@
 # init_db.py - 数据库初始化程序
-import pymysql
-from config import DB_CONFIG
+# 不带参数时交互式输入；--bins/--knowledge/--aliases 从 CSV/JSON 文件批量导入，不需要交互：
+#   垃圾桶    CSV 每行 "位置" 或 "位置,类别"（只有位置时创建类别1-5），
+#             JSON 为列表，元素是位置字符串、[位置, 类别] 或 {"location": .., "category_id": ..}
+#   垃圾知识  CSV 每行 "名称,类别"，JSON 为 {名称: 类别} 或 [名称, 类别]/{"name": .., "category": ..} 的列表
+#   别名      CSV 每行 "别名,名称"，JSON 为 {别名: 名称} 或 [别名, 名称]/{"alias": .., "name": ..} 的列表
+# CSV 可以有表头（location/name/alias 开头），空行和 # 开头的行忽略。
+import argparse
+import csv
+import json
+import os
+import time
+from config import SQLITE_PATH, SEED_CHUNK_SIZE
+from repository import get_repository, DB_ERRORS
 
-def init_mysql_db():
-    """初始化MySQL数据库和表结构"""
+# 预设的常见垃圾数据
+PRESET_TRASH_DATA = {
+    "可回收垃圾": [
+        "矿泉水瓶", "易拉罐", "报纸", "书本", "纸箱",
+        "玻璃瓶", "塑料瓶", "金属罐", "废旧衣物", "纸盒"
+    ],
+    "有害垃圾": [
+        "废电池", "过期药品", "废灯管", "废油漆桶",
+        "杀虫剂瓶", "废温度计", "废血压计", "废胶片"
+    ],
+    "厨余垃圾": [
+        "剩饭剩菜", "果皮", "菜叶", "蛋壳", "骨头",
+        "茶叶渣", "过期食品", "咖啡渣", "花卉"
+    ],
+    "其他垃圾": [
+        "卫生纸", "塑料袋", "陶瓷碎片", "烟头",
+        "一次性餐具", "尘土", "废旧纸巾", "尿不湿"
+    ]
+}
+
+def init_database():
+    """初始化数据库和表结构（MySQL 或 SQLite，见 config.DB_BACKEND）"""
     print("=" * 50)
     print("数据库初始化工具")
     print("=" * 50)
-    
-    # 1. 连接MySQL（先连接mysql库创建information数据库）
+
+    # 1. 创建数据库（MySQL 会先创建 information 库）和表
+    repository = get_repository()
     try:
-        conn_root = pymysql.connect(
-            host=DB_CONFIG["host"],
-            user=DB_CONFIG["user"],
-            password=DB_CONFIG["password"],
-            charset=DB_CONFIG["charset"]
-        )
-        cursor_root = conn_root.cursor()
-        print("✅ 已连接到MySQL服务器")
-        
-        # 创建information数据库（如果不存在）
-        cursor_root.execute("CREATE DATABASE IF NOT EXISTS information DEFAULT CHARACTER SET utf8mb4")
-        print("✅ 数据库 'information' 已准备就绪")
-        conn_root.close()
-    except pymysql.Error as e:
-        print(f"❌ MySQL连接失败：{e}")
+        repository.create_schema()
+        if repository.name == "sqlite":
+            print(f"✅ SQLite数据库 '{SQLITE_PATH}' 已准备就绪")
+        else:
+            print("✅ 数据库 'information' 已准备就绪")
+    except DB_ERRORS as e:
+        print(f"❌ 数据库连接失败：{e}")
         print("请检查：")
-        print("1. MySQL服务是否已启动")
+        print("1. MySQL服务是否已启动（或在 config.py 中设置 DB_BACKEND = \"sqlite\"）")
         print("2. config.py中的配置是否正确")
         print("3. 用户名/密码是否正确")
         return False
 
-    # 2. 连接information数据库，创建表
-    try:
-        conn = pymysql.connect(**DB_CONFIG)
-        cursor = conn.cursor()
-        print("✅ 已连接到 'information' 数据库")
-    except pymysql.Error as e:
-        print(f"❌ 连接information数据库失败：{e}")
-        return False
-
-    # 初始化1：创建垃圾桶表
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS trash_bin (
-        location CHAR(5) NOT NULL,          -- 5位英文字符位置信息
-        category_id INT NOT NULL,           -- 垃圾桶类别编号(1-5)
-        storage INT DEFAULT 0,              -- 存储情况(0-100)
-        PRIMARY KEY (location, category_id)
-    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
-    ''')
+    # 初始化1：垃圾桶表
     print("✅ 垃圾桶表 'trash_bin' 已创建")
 
     # 初始化垃圾桶数据（简化输入）
@@ -69,8 +76,7 @@ def init_mysql_db():
             break
             
         if user_input.lower() == 'list':
-            cursor.execute("SELECT location, category_id, storage FROM trash_bin ORDER BY location, category_id")
-            bins = cursor.fetchall()
+            bins = repository.list_bins()
             if bins:
                 print("\n当前已添加的垃圾桶:")
                 print("-" * 40)
@@ -87,8 +93,7 @@ def init_mysql_db():
         if user_input.lower() == 'clear':
             confirm = input("⚠️  确定要清空所有垃圾桶数据吗？(yes/no): ").strip().lower()
             if confirm == 'yes':
-                cursor.execute("DELETE FROM trash_bin")
-                conn.commit()
+                repository.clear_bins()
                 print("✅ 已清空所有垃圾桶数据")
                 bin_count = 0
             continue
@@ -104,25 +109,14 @@ def init_mysql_db():
         existed_count = 0
         
         for cate_id in range(1, 6):  # 类别1到5
-            try:
-                cursor.execute(
-                    "INSERT INTO trash_bin (location, category_id) VALUES (%s, %s)",
-                    (location, cate_id)
-                )
+            if repository.add_bin(location, cate_id):
                 added_count += 1
                 print(f"✅ 已添加：位置={location}, 类别={cate_id}")
-            except pymysql.IntegrityError:
-                conn.rollback()
+            else:
+                # 已存在，跳过
                 existed_count += 1
-                # 检查是否已存在，如果存在则跳过
-                cursor.execute(
-                    "SELECT 1 FROM trash_bin WHERE location = %s AND category_id = %s",
-                    (location, cate_id)
-                )
-                if cursor.fetchone():
-                    print(f"⚠️  已存在：位置={location}, 类别={cate_id}")
+                print(f"⚠️  已存在：位置={location}, 类别={cate_id}")
         
-        conn.commit()
         bin_count += added_count
         
         if added_count > 0:
@@ -130,14 +124,7 @@ def init_mysql_db():
         if existed_count > 0:
             print(f"⚠️  {existed_count} 个垃圾桶已存在，未重复创建")
 
-    # 初始化2：创建垃圾知识表
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS trash_knowledge (
-        category INT NOT NULL,              -- 垃圾类别(1-4)
-        name CHAR(50) NOT NULL,             -- 垃圾名称（主码）
-        PRIMARY KEY (name)
-    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
-    ''')
+    # 初始化2：垃圾知识表（知识库版本表随之创建，每次修改垃圾知识后递增版本号，服务器据此刷新内存缓存）
     print("\n✅ 垃圾知识表 'trash_knowledge' 已创建")
 
     # 初始化垃圾知识数据（交互式输入）
@@ -153,25 +140,6 @@ def init_mysql_db():
     print("输入 'batch' 批量导入预设垃圾数据")
     
     knowledge_count = 0
-    # 预设的常见垃圾数据
-    preset_trash_data = {
-        "可回收垃圾": [
-            "矿泉水瓶", "易拉罐", "报纸", "书本", "纸箱",
-            "玻璃瓶", "塑料瓶", "金属罐", "废旧衣物", "纸盒"
-        ],
-        "有害垃圾": [
-            "废电池", "过期药品", "废灯管", "废油漆桶",
-            "杀虫剂瓶", "废温度计", "废血压计", "废胶片"
-        ],
-        "厨余垃圾": [
-            "剩饭剩菜", "果皮", "菜叶", "蛋壳", "骨头",
-            "茶叶渣", "过期食品", "咖啡渣", "花卉"
-        ],
-        "其他垃圾": [
-            "卫生纸", "塑料袋", "陶瓷碎片", "烟头",
-            "一次性餐具", "尘土", "废旧纸巾", "尿不湿"
-        ]
-    }
     
     while True:
         user_input = input("\n> 请输入垃圾信息: ").strip()
@@ -180,8 +148,7 @@ def init_mysql_db():
             break
             
         if user_input.lower() == 'list':
-            cursor.execute("SELECT name, category FROM trash_knowledge ORDER BY category, name")
-            items = cursor.fetchall()
+            items = repository.list_knowledge()
             if items:
                 print("\n当前已添加的垃圾知识:")
                 print("-" * 40)
@@ -199,30 +166,25 @@ def init_mysql_db():
         if user_input.lower() == 'clear':
             confirm = input("⚠️  确定要清空所有垃圾知识数据吗？(yes/no): ").strip().lower()
             if confirm == 'yes':
-                cursor.execute("DELETE FROM trash_knowledge")
-                conn.commit()
+                repository.clear_knowledge()
                 print("✅ 已清空所有垃圾知识数据")
                 knowledge_count = 0
             continue
             
         if user_input.lower() == 'batch':
             print("\n开始批量导入预设垃圾数据...")
-            batch_count = 0
-            for category_num, (category_name, trash_list) in enumerate(preset_trash_data.items(), 1):
+            category_of = {}
+            items = []
+            for category_num, (category_name, trash_list) in enumerate(PRESET_TRASH_DATA.items(), 1):
                 for trash_name in trash_list:
-                    try:
-                        cursor.execute(
-                            "INSERT INTO trash_knowledge (name, category) VALUES (%s, %s)",
-                            (trash_name, category_num)
-                        )
-                        batch_count += 1
-                        print(f"✅ 导入: {trash_name} -> {category_name}")
-                    except pymysql.IntegrityError:
-                        conn.rollback()
-                        # 已存在，跳过
-                        pass
-            
-            conn.commit()
+                    items.append((trash_name, category_num))
+                    category_of[trash_name] = category_name
+
+            # 一个事务导入，已存在的跳过
+            added = repository.add_knowledge_many(items)
+            for trash_name in added:
+                print(f"✅ 导入: {trash_name} -> {category_of[trash_name]}")
+            batch_count = len(added)
             knowledge_count += batch_count
             print(f"\n✅ 批量导入完成！共添加 {batch_count} 条垃圾知识")
             continue
@@ -245,30 +207,20 @@ def init_mysql_db():
             continue
             
         # 插入数据
-        try:
-            cursor.execute(
-                "INSERT INTO trash_knowledge (name, category) VALUES (%s, %s)",
-                (name, int(cate_id))
-            )
-            conn.commit()
+        if repository.add_knowledge(name, int(cate_id)):
             knowledge_count += 1
             category_names = {1: "可回收垃圾", 2: "有害垃圾", 3: "厨余垃圾", 4: "其他垃圾"}
             cate_name = category_names.get(int(cate_id), "未知")
             print(f"✅ 成功添加：{name} -> {cate_name}(类别{cate_id})")
-        except pymysql.IntegrityError:
-            conn.rollback()
+        else:
             print(f"❌ 该垃圾名称已存在！")
 
     # 统计最终数据
-    cursor.execute("SELECT COUNT(*) FROM trash_bin")
-    total_bins = cursor.fetchone()[0]
-    
-    cursor.execute("SELECT COUNT(*) FROM trash_knowledge")
-    total_knowledge = cursor.fetchone()[0]
+    total_bins = repository.count_bins()
+    total_knowledge = repository.count_knowledge()
 
     # 关闭连接
-    cursor.close()
-    conn.close()
+    repository.close()
     
     print("\n" + "=" * 50)
     print("✅ 数据库初始化完成！")
@@ -282,6 +234,127 @@ def init_mysql_db():
     print("=" * 50)
     return True
 
+def read_records(path):
+    """读取 CSV/JSON 文件，返回 [(行号, [字段...])]"""
+    if os.path.splitext(path)[1].lower() == ".json":
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        if isinstance(data, dict):
+            data = list(data.items())
+        records = []
+        for number, item in enumerate(data, 1):
+            if isinstance(item, dict):
+                first = next((key for key in ("location", "alias", "name") if key in item), None)
+                second = next((key for key in ("category_id", "category", "name")
+                               if key in item and key != first), None)
+                item = [item.get(first), item.get(second)]
+            elif not isinstance(item, (list, tuple)):
+                item = [item]
+            records.append((number, [str(value).strip() for value in item if value is not None]))
+        return records
+
+    records = []
+    with open(path, encoding="utf-8-sig", newline="") as f:
+        for number, row in enumerate(csv.reader(f), 1):
+            row = [value.strip() for value in row]
+            if not row or not row[0] or row[0].startswith("#"):
+                continue
+            if number == 1 and row[0].lower() in ("location", "name", "alias"):
+                continue  # 表头
+            records.append((number, row))
+    return records
+
+def parse_bins(records):
+    """返回 ([(位置, 类别)], [格式错误的行号])"""
+    rows, invalid = [], []
+    for number, record in records:
+        location = record[0].upper() if record else ""
+        if not (len(location) == 5 and location.isalpha()) or len(record) > 2:
+            invalid.append(number)
+        elif len(record) == 1:
+            rows.extend((location, cate_id) for cate_id in range(1, 6))
+        elif record[1].isdigit() and 1 <= int(record[1]) <= 5:
+            rows.append((location, int(record[1])))
+        else:
+            invalid.append(number)
+    return rows, invalid
+
+def parse_knowledge(records):
+    """返回 ([(名称, 类别)], [格式错误的行号])"""
+    rows, invalid = [], []
+    for number, record in records:
+        if len(record) == 2 and record[0] and record[1].isdigit() and 1 <= int(record[1]) <= 4:
+            rows.append((record[0], int(record[1])))
+        else:
+            invalid.append(number)
+    return rows, invalid
+
+def parse_aliases(records):
+    """返回 ([(别名, 名称)], [格式错误的行号])"""
+    rows, invalid = [], []
+    for number, record in records:
+        if len(record) == 2 and record[0] and record[1]:
+            rows.append((record[0], record[1]))
+        else:
+            invalid.append(number)
+    return rows, invalid
+
+def print_seed_report(title, path, record_count, rows, invalid, added):
+    print(f"{title}（{path}）: 读取 {record_count} 行，共 {len(rows)} 条，新增 {added} 条，"
+          f"已存在跳过 {len(rows) - added} 条，格式错误 {len(invalid)} 行")
+    if invalid:
+        shown = ", ".join(str(number) for number in invalid[:10])
+        print(f"   ⚠️  格式错误的行: {shown}{' ...' if len(invalid) > 10 else ''}")
+
+def seed_from_files(bins_path=None, knowledge_path=None, aliases_path=None, chunk_size=SEED_CHUNK_SIZE):
+    """从文件批量导入垃圾桶、垃圾知识和别名（一个事务），打印新增/跳过的行数和耗时"""
+    try:
+        bin_records = read_records(bins_path) if bins_path else []
+        knowledge_records = read_records(knowledge_path) if knowledge_path else []
+        alias_records = read_records(aliases_path) if aliases_path else []
+    except (OSError, ValueError) as e:
+        print(f"❌ 读取导入文件失败：{e}")
+        return False
+    bins, invalid_bins = parse_bins(bin_records)
+    knowledge, invalid_knowledge = parse_knowledge(knowledge_records)
+    aliases, invalid_aliases = parse_aliases(alias_records)
+
+    repository = get_repository()
+    try:
+        repository.create_schema()
+        start = time.perf_counter()
+        added_bins, added_knowledge, added_aliases = repository.seed(bins, knowledge, aliases, chunk_size)
+        elapsed = time.perf_counter() - start
+    except DB_ERRORS as e:
+        print(f"❌ 批量导入失败，已回滚：{e}")
+        return False
+    finally:
+        repository.close()
+
+    print("✅ 批量导入完成")
+    if bins_path:
+        print_seed_report("垃圾桶", bins_path, len(bin_records), bins, invalid_bins, added_bins)
+    if knowledge_path:
+        print_seed_report("垃圾知识", knowledge_path, len(knowledge_records), knowledge,
+                          invalid_knowledge, added_knowledge)
+    if aliases_path:
+        print_seed_report("别名", aliases_path, len(alias_records), aliases, invalid_aliases, added_aliases)
+    total = len(bins) + len(knowledge) + len(aliases)
+    print(f"   写入耗时 {elapsed:.2f} 秒（{total / max(elapsed, 1e-6):.0f} 条/秒）")
+    return True
+
+def main():
+    parser = argparse.ArgumentParser(description="数据库初始化，不带参数时交互式输入")
+    parser.add_argument("--bins", help="从 CSV/JSON 文件批量导入垃圾桶")
+    parser.add_argument("--knowledge", help="从 CSV/JSON 文件批量导入垃圾知识")
+    parser.add_argument("--aliases", help="从 CSV/JSON 文件批量导入垃圾名称的别名")
+    parser.add_argument("--chunk-size", type=int, default=SEED_CHUNK_SIZE, help="每次 executemany 的行数")
+    args = parser.parse_args()
+
+    if args.bins or args.knowledge or args.aliases:
+        return seed_from_files(args.bins, args.knowledge, args.aliases, args.chunk_size)
+    init_database()
+    input("\n按 Enter 键退出...")
+
 if __name__ == "__main__":
-    init_mysql_db()
-    input("\n按 Enter 键退出...")
\ No newline at end of file
+    main()
\ No newline at end of file
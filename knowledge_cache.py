@@ -0,0 +1,107 @@
+# knowledge_cache.py - 垃圾知识（名称 -> 类别）内存缓存
+# trash_knowledge 表很小且几乎不变，服务器启动时整表读入内存，分类查询变成字典查找；
+# 同时加载 trash_alias 别名表，建立名称索引（见 name_index.py）用于别名和模糊匹配。
+# 刷新策略：
+#   - 每隔 KNOWLEDGE_VERSION_CHECK_INTERVAL 秒读一次 knowledge_version 表的版本号，
+#     版本变化（init_db.py 添加/清空数据时会递增）才重新加载
+#   - 无论版本是否变化，超过 KNOWLEDGE_CACHE_TTL 秒强制重新加载一次
+#   - invalidate() 可在进程内显式使缓存失效
+# 版本表的建表和递增见 repository.py
+import threading
+import time
+from config import KNOWLEDGE_CACHE_TTL, KNOWLEDGE_VERSION_CHECK_INTERVAL
+from repository import get_repository, DB_ERRORS
+from name_index import NameIndex
+
+class KnowledgeCache:
+    """trash_knowledge 的进程内索引"""
+
+    def __init__(self, repository=None, ttl=KNOWLEDGE_CACHE_TTL,
+                 check_interval=KNOWLEDGE_VERSION_CHECK_INTERVAL):
+        self.repository = repository or get_repository()
+        self.ttl = ttl
+        self.check_interval = check_interval
+
+        self._index = {}            # 名称 -> 类别
+        self._names = []            # 排序后的名称列表
+        self._name_index = NameIndex({})  # 别名和模糊匹配索引
+        self._version = None        # 加载时的版本号（版本表不存在时为None）
+        self._loaded_at = None      # 上次加载时间，None 表示未加载或已失效
+        self._checked_at = 0.0      # 上次检查版本号的时间
+        self._lock = threading.Lock()
+
+    def load(self):
+        """从数据库整表加载，返回条目数"""
+        version, index, aliases = self.repository.load_knowledge()
+        name_index = NameIndex(index, aliases)
+
+        now = time.monotonic()
+        with self._lock:
+            self._index = index
+            self._names = sorted(index)
+            self._name_index = name_index
+            self._version = version
+            self._loaded_at = now
+            self._checked_at = now
+        print(f"📚 垃圾知识缓存已加载：{len(index)} 条，别名 {len(aliases)} 条（版本 {version}）")
+        return len(index)
+
+    def invalidate(self):
+        """使缓存失效，下一次查询时重新加载"""
+        with self._lock:
+            self._loaded_at = None
+
+    def _refresh_if_needed(self):
+        now = time.monotonic()
+        with self._lock:
+            loaded_at = self._loaded_at
+            if loaded_at is not None and now - self._checked_at < self.check_interval:
+                return
+            # 只让一个线程去检查，其他线程继续使用当前数据
+            self._checked_at = now
+            version = self._version
+
+        if loaded_at is None:
+            self.load()
+            return
+
+        try:
+            if now - loaded_at >= self.ttl:
+                self.load()
+                return
+            current = self.repository.knowledge_version()
+            if current is not None and current != version:
+                self.load()
+        except DB_ERRORS as e:
+            # 数据库暂时不可用时继续使用旧数据
+            print(f"⚠️  垃圾知识缓存刷新失败，继续使用旧数据：{e}")
+
+    def get(self, name):
+        """查询垃圾类别，未找到返回None"""
+        self._refresh_if_needed()
+        return self._index.get(name.strip())
+
+    def match(self, name):
+        """按名称、别名或模糊匹配查询，返回 name_index.Match（名称、类别、置信度），未找到返回None"""
+        self._refresh_if_needed()
+        return self._name_index.match(name)
+
+    def names(self):
+        """所有垃圾名称（已排序）"""
+        self._refresh_if_needed()
+        return self._names
+
+    def __len__(self):
+        return len(self._index)
+
+# 全局缓存，首次使用时创建
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_knowledge_cache():
+    """获取全局垃圾知识缓存"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = KnowledgeCache()
+        return _cache
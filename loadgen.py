@@ -0,0 +1,388 @@
+# loadgen.py - 垃圾桶协议压力测试工具
+# 用 asyncio 模拟成千上万个垃圾桶，按与 client2.py 相同的协议连续投放垃圾：
+#   外部图片(+站点编号) -> 类别回复，内部图片 -> 存储回复
+# 统计吞吐量、各阶段延迟的 p50/p95/p99、错误率和超时率。
+#
+# 用法：
+#   python loadgen.py --bins 2000 --duration 30              # 压测已启动的服务器
+#   python loadgen.py --local --bins 500 --duration 10       # 在本进程内启动服务器（临时 SQLite 数据库）
+#   python loadgen.py --local --upload --protocol framed     # 上传图片数据而不是只发送路径
+#   python loadgen.py --local --session                      # 每个垃圾桶保持一个长连接（见 session.py）
+#   python loadgen.py --local --combined                     # 合并请求，一轮完成识别和存储分析（DSP）
+import argparse
+import asyncio
+import contextlib
+import glob
+import os
+import random
+import shutil
+import string
+import tempfile
+import threading
+import time
+from config import SERVER_HOST, SERVER_PORT
+from protocol import (MAGIC, TAG_REQUEST, TAG_INNER, TAG_DISPOSE, TAG_IMAGE, TAG_ERROR, TAG_BUSY,
+                      ServerBusyError, encode_frame, read_frame_async)
+
+# 默认使用仓库中的示例图片
+DEFAULT_IMAGES = sorted(glob.glob("pic/*.jpg") + glob.glob("pic/*.png") + glob.glob("*.jpg"))
+
+PHASES = ("connect", "category", "storage", "combined", "total")
+
+# ---------------------------- 本地服务器 ----------------------------
+
+def create_local_repository(locations, path):
+    """在临时 SQLite 文件中建表，导入预设垃圾知识，并为每个站点创建5个垃圾桶"""
+    from init_db import PRESET_TRASH_DATA
+    from repository import SQLiteRepository
+
+    repository = SQLiteRepository(path)
+    repository.create_schema()
+    repository.add_knowledge_many([(name, cate) for cate, names in enumerate(PRESET_TRASH_DATA.values(), 1)
+                                   for name in names])
+    repository.upsert_storages([(location, cate, 0) for location in locations for cate in range(1, 6)])
+    return repository
+
+def start_local_server(locations, write_mode, db_path, location_rate=0):
+    """在后台线程中启动 asyncio 服务器（SQLite + 自动识别后端），返回 (端口, 停止函数)"""
+    import repository
+    import classifier
+    import storage_writer
+    import async_server
+    import admission
+
+    repository.set_repository(create_local_repository(locations, db_path))
+    classifier.set_backends("hash", "simulated")
+    storage_writer._writer = storage_writer.StorageWriter(mode=write_mode)
+    admission.set_admission(rate_limiter=admission.RateLimiter(rate=location_rate))
+
+    loop = asyncio.new_event_loop()
+    ready = threading.Event()
+    state = {}
+
+    async def run():
+        server = await asyncio.start_server(async_server.handle_client_async, "127.0.0.1", 0, backlog=4096)
+        state["port"] = server.sockets[0].getsockname()[1]
+        state["server"] = server
+        ready.set()
+        async with server:
+            await server.serve_forever()
+
+    def target():
+        asyncio.set_event_loop(loop)
+        try:
+            loop.run_until_complete(run())
+        except asyncio.CancelledError:
+            pass
+        # 还在等待下一帧的连接（长连接会话）随服务器一起取消
+        pending = asyncio.all_tasks(loop)
+        for task in pending:
+            task.cancel()
+        loop.run_until_complete(asyncio.gather(*pending, return_exceptions=True))
+
+    thread = threading.Thread(target=target, name="local-server", daemon=True)
+    thread.start()
+    ready.wait()
+
+    def stop():
+        loop.call_soon_threadsafe(state["server"].close)
+        thread.join(timeout=5)
+        storage_writer.get_storage_writer().close()
+        repository.get_repository().print_stats()
+        repository.get_repository().close()
+
+    return state["port"], stop
+
+# ---------------------------- 模拟垃圾桶 ----------------------------
+
+def make_locations(count, seed=0):
+    """生成 count 个不重复的5位字母站点编号"""
+    rng = random.Random(seed)
+    locations = set()
+    while len(locations) < count:
+        locations.add("".join(rng.choice(string.ascii_uppercase) for _ in range(5)))
+    return sorted(locations)
+
+class Stats:
+    def __init__(self):
+        self.latencies = {phase: [] for phase in PHASES}
+        self.completed = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.rejected = 0       # 服务器回复5（无法识别，旧协议下也包括繁忙）
+        self.busy = 0           # 服务器回复繁忙（BSY）
+        self.error_samples = {}
+
+    def error(self, e):
+        self.errors += 1
+        name = type(e).__name__
+        self.error_samples[name] = self.error_samples.get(name, 0) + 1
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(p / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+class Bin:
+    """一个模拟垃圾桶"""
+
+    def __init__(self, args, location, images, stats, rng):
+        self.args = args
+        self.location = location
+        self.images = images
+        self.stats = stats
+        self.rng = rng
+        self.connection = None      # --session 时保持的 (reader, writer)
+
+    async def open_connection(self, timings):
+        """--session 时复用已有连接（不计 connect 阶段），否则新建连接"""
+        if self.connection is not None:
+            return self.connection
+        start = time.perf_counter()
+        reader, writer = await asyncio.wait_for(
+            asyncio.open_connection(self.args.host, self.args.port), timeout=self.args.timeout)
+        timings["connect"] = time.perf_counter() - start
+        if self.args.protocol == "framed":
+            writer.write(MAGIC)
+        if self.args.session:
+            self.connection = reader, writer
+        return reader, writer
+
+    async def close_connection(self, writer):
+        if self.connection is not None and self.connection[1] is writer:
+            self.connection = None
+        writer.close()
+        with contextlib.suppress(Exception):
+            await writer.wait_closed()
+
+    async def read_reply(self, reader, request_id):
+        if self.args.protocol == "legacy":
+            data = await reader.read(1024)
+            if not data:
+                raise ConnectionResetError("服务器已关闭连接")
+            return data.decode("utf-8")
+        frame = await read_frame_async(reader)
+        if frame is None:
+            raise ConnectionResetError("服务器已关闭连接")
+        tag, reply_id, payload = frame
+        if tag == TAG_ERROR:
+            raise RuntimeError(payload.decode("utf-8"))
+        if tag == TAG_BUSY:
+            raise ServerBusyError(int(payload))
+        if reply_id != request_id:
+            raise RuntimeError(f"回复编号不匹配：{reply_id} != {request_id}")
+        return payload.decode("utf-8")
+
+    def send_message(self, writer, tag, request_id, text, image=None):
+        if self.args.protocol == "legacy":
+            writer.write(text.encode("utf-8"))
+            return
+        if image is not None:
+            writer.write(encode_frame(TAG_IMAGE, request_id, image))
+        writer.write(encode_frame(tag, request_id, text))
+
+    async def dispose(self, request_id):
+        """一次完整的投放，返回各阶段耗时"""
+        args = self.args
+        outer_path, outer_data = self.rng.choice(self.images)
+        timings = {}
+        start = time.perf_counter()
+
+        reader, writer = await self.open_connection(timings)
+        keep = False
+        try:
+            if args.combined:
+                # 合并请求：外部、内部图片一起发送，一轮得到类别和存储
+                t = time.perf_counter()
+                inner_path = f"/trash/{self.location}_1.jpg"
+                if args.upload:
+                    _, inner_data = self.rng.choice(self.images)
+                    writer.write(encode_frame(TAG_IMAGE, request_id, outer_data))
+                    self.send_message(writer, TAG_DISPOSE, request_id, f"||{self.location}", inner_data)
+                else:
+                    self.send_message(writer, TAG_DISPOSE, request_id, f"{outer_path}|{inner_path}|{self.location}")
+                await writer.drain()
+                result = await asyncio.wait_for(self.read_reply(reader, request_id), timeout=args.timeout)
+                timings["combined"] = time.perf_counter() - t
+                if result.startswith("5|"):
+                    return timings, False
+                timings["total"] = time.perf_counter() - start
+                keep = args.session
+                return timings, True
+
+            # 第一轮：外部图片 -> 类别
+            t = time.perf_counter()
+            if args.upload:
+                self.send_message(writer, TAG_REQUEST, request_id, f"|{self.location}", outer_data)
+            else:
+                self.send_message(writer, TAG_REQUEST, request_id, f"{outer_path}|{self.location}")
+            await writer.drain()
+            cate = await asyncio.wait_for(self.read_reply(reader, request_id), timeout=args.timeout)
+            timings["category"] = time.perf_counter() - t
+            if cate.strip() == "5":
+                return timings, False
+
+            # 第二轮：内部图片 -> 存储情况
+            t = time.perf_counter()
+            inner_path = f"/trash/{self.location}_{cate.strip()}.jpg"
+            if args.upload:
+                _, inner_data = self.rng.choice(self.images)
+                self.send_message(writer, TAG_INNER, request_id, "", inner_data)
+            else:
+                self.send_message(writer, TAG_INNER, request_id, inner_path)
+            await writer.drain()
+            await asyncio.wait_for(self.read_reply(reader, request_id), timeout=args.timeout)
+            timings["storage"] = time.perf_counter() - t
+            timings["total"] = time.perf_counter() - start
+            keep = args.session
+            return timings, True
+        finally:
+            # 会话只在完整投放后保留，出错或回复5时连接状态不确定，关闭后下次重连
+            if not keep:
+                await self.close_connection(writer)
+
+    async def run(self, deadline):
+        request_id = 0
+        # 错开启动时间，避免所有垃圾桶同时连接
+        await asyncio.sleep(self.rng.uniform(0, self.args.think_ms / 1000))
+        while time.monotonic() < deadline:
+            if self.args.requests and request_id >= self.args.requests:
+                break
+            request_id += 1
+            try:
+                timings, ok = await self.dispose(request_id)
+                for phase, value in timings.items():
+                    self.stats.latencies[phase].append(value)
+                if ok:
+                    self.stats.completed += 1
+                else:
+                    self.stats.rejected += 1
+            except ServerBusyError as e:
+                # 按服务器建议的时间等待后再投放
+                self.stats.busy += 1
+                await asyncio.sleep(e.retry_after_ms / 1000)
+                continue
+            except asyncio.TimeoutError:
+                self.stats.timeouts += 1
+            except Exception as e:
+                self.stats.error(e)
+            if self.args.think_ms:
+                await asyncio.sleep(self.rng.expovariate(1000 / self.args.think_ms))
+        if self.connection is not None:
+            await self.close_connection(self.connection[1])
+
+async def run_load(args, locations, images):
+    stats = Stats()
+    rng = random.Random(args.seed)
+    deadline = time.monotonic() + args.duration
+    bins = [Bin(args, locations[i % len(locations)], images, stats, random.Random(rng.random()))
+            for i in range(args.bins)]
+    start = time.perf_counter()
+    await asyncio.gather(*(b.run(deadline) for b in bins))
+    return stats, time.perf_counter() - start
+
+def load_images(paths):
+    images = []
+    for path in paths:
+        with open(path, "rb") as f:
+            images.append((path, f.read()))
+    return images
+
+def print_report(args, stats, elapsed):
+    attempts = stats.completed + stats.rejected + stats.busy + stats.errors + stats.timeouts
+    print("\n" + "=" * 60)
+    print(f"压力测试结果：{args.bins} 个垃圾桶，协议 {args.protocol}，"
+          f"{'上传图片' if args.upload else '只发送路径'}{'，长连接会话' if args.session else ''}"
+          f"{'，合并请求' if args.combined else ''}，"
+          f"耗时 {elapsed:.1f} 秒")
+    print("=" * 60)
+    print(f"完成投放：{stats.completed} 次，吞吐量 {stats.completed / elapsed:.1f} 次/秒")
+    if attempts:
+        print(f"回复5：{stats.rejected} 次，繁忙：{stats.busy} 次（{stats.busy / attempts:.2%}），"
+              f"错误：{stats.errors} 次（{stats.errors / attempts:.2%}），"
+              f"超时：{stats.timeouts} 次（{stats.timeouts / attempts:.2%}）")
+    for name, count in sorted(stats.error_samples.items()):
+        print(f"  {name}: {count}")
+    print("-" * 60)
+    print(f"{'阶段':<10}{'次数':>8}{'p50(ms)':>12}{'p95(ms)':>12}{'p99(ms)':>12}{'max(ms)':>12}")
+    for phase in PHASES:
+        values = sorted(stats.latencies[phase])
+        if not values:
+            continue
+        print(f"{phase:<10}{len(values):>8}"
+              f"{percentile(values, 50) * 1000:>12.2f}{percentile(values, 95) * 1000:>12.2f}"
+              f"{percentile(values, 99) * 1000:>12.2f}{values[-1] * 1000:>12.2f}")
+    print("=" * 60)
+
+def main():
+    parser = argparse.ArgumentParser(description="垃圾桶协议压力测试")
+    parser.add_argument("--host", default=SERVER_HOST)
+    parser.add_argument("--port", type=int, default=SERVER_PORT)
+    parser.add_argument("--bins", type=int, default=100, help="同时模拟的垃圾桶数")
+    parser.add_argument("--locations", type=int, default=0, help="站点编号数量，默认每个垃圾桶一个")
+    parser.add_argument("--duration", type=float, default=10, help="测试时长（秒）")
+    parser.add_argument("--requests", type=int, default=0, help="每个垃圾桶最多投放次数，0为不限")
+    parser.add_argument("--think-ms", type=float, default=100, help="两次投放之间的平均间隔（毫秒）")
+    parser.add_argument("--timeout", type=float, default=30, help="等待回复的超时时间（秒）")
+    parser.add_argument("--protocol", choices=("framed", "legacy"), default="framed")
+    parser.add_argument("--upload", action="store_true", help="上传图片数据（仅分帧协议）")
+    parser.add_argument("--session", action="store_true", help="每个垃圾桶保持一个长连接（仅分帧协议）")
+    parser.add_argument("--combined", action="store_true", help="使用合并请求，一轮完成投放（仅分帧协议）")
+    parser.add_argument("--images", nargs="*", default=DEFAULT_IMAGES, help="使用的图片文件")
+    parser.add_argument("--local", action="store_true", help="在本进程内启动服务器（临时 SQLite 数据库）")
+    parser.add_argument("--write-mode", choices=("sync", "write_behind"), default="sync",
+                        help="本地服务器的存储写入模式")
+    parser.add_argument("--location-rate", type=float, default=0,
+                        help="本地服务器每个站点每秒最多新投放次数，默认不限流")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    if args.upload and args.protocol != "framed":
+        parser.error("--upload 只能与 --protocol framed 一起使用")
+    if args.session and args.protocol != "framed":
+        parser.error("--session 只能与 --protocol framed 一起使用")
+    if args.combined and args.protocol != "framed":
+        parser.error("--combined 只能与 --protocol framed 一起使用")
+    if not args.images:
+        parser.error("没有可用的图片文件")
+
+    locations = make_locations(args.locations or args.bins, args.seed)
+    images = load_images(args.images)
+    sizes = [len(data) for _, data in images]
+    print(f"🚀 {args.bins} 个垃圾桶，{len(locations)} 个站点，{len(images)} 张图片"
+          f"（{min(sizes) / 1024:.1f}-{max(sizes) / 1024:.1f}KB），持续 {args.duration} 秒")
+
+    stop = None
+    db_dir = None
+    server_log = open(os.devnull, "w", encoding="utf-8")
+    if args.local:
+        db_dir = tempfile.mkdtemp(prefix="loadgen-")
+        with contextlib.redirect_stdout(server_log):
+            args.port, stop = start_local_server(locations, args.write_mode,
+                                                 os.path.join(db_dir, "loadgen.db"), args.location_rate)
+        args.host = "127.0.0.1"
+        print(f"🖥️  本地服务器已启动：127.0.0.1:{args.port}，数据库 {db_dir}（服务器输出已屏蔽）")
+
+    try:
+        if args.local:
+            # 服务器与压测在同一进程，屏蔽服务器的逐条输出
+            with contextlib.redirect_stdout(server_log):
+                stats, elapsed = asyncio.run(run_load(args, locations, images))
+        else:
+            stats, elapsed = asyncio.run(run_load(args, locations, images))
+    except KeyboardInterrupt:
+        print("\n🛑 测试中断")
+        return
+    finally:
+        if stop is not None:
+            with contextlib.redirect_stdout(server_log):
+                stop()
+        server_log.close()
+        if db_dir is not None:
+            shutil.rmtree(db_dir, ignore_errors=True)
+
+    print_report(args, stats, elapsed)
+
+if __name__ == "__main__":
+    main()
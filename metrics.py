@@ -0,0 +1,226 @@
+# metrics.py - 服务器运行计数和各阶段耗时
+# 每个服务器进程在内存中累计连接数、识别次数、存储更新次数和错误数，不访问数据库；
+# 每个处理阶段的耗时记入直方图（固定分桶，记录一次只是一次加法），用于查看哪个阶段决定了 p99：
+#   recv_outer / recv_inner   接收外部 / 内部图片（旧协议为接收请求字符串，包括等待客户端的时间）
+#   queue                     等待处理名额（见 admission.py）
+#   step_queue                asyncio 服务器中等待工作线程（见 async_server.py）
+#   classify                  识别外部图片
+#   knowledge_lookup          查询垃圾类别
+#   storage_read              查询当前存储
+#   storage_write             更新存储（sync 模式下包括提交）
+#   send                      发送回复
+# 以及每个请求从收到到得出回复的总耗时（category / storage / dispose）。
+# 看板接口 GET /metrics 以 Prometheus 文本格式输出（见 dashboard.py）。
+# 预派生模式（见 prefork.py）下各工作进程定期把计数和直方图上报给主进程，
+# 主进程用 WorkerMetrics 汇总，GET /api/workers 返回各进程和合计的计数，GET /metrics 输出合计。
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter
+from contextlib import contextmanager
+
+# 直方图分桶上限（秒），最后还有一个 +Inf 桶
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+# 输出的指标名前缀和说明
+PREFIX = "gcs_"
+HELP = {
+    "phase_seconds": "各处理阶段耗时（秒）",
+    "request_seconds": "请求从收到到得出回复的耗时（秒）",
+    "connections": "接受的连接数",
+    "rejected_connections": "因连接数已达上限拒绝的连接数",
+    "classifications": "识别外部图片的次数",
+    "unrecognized": "无法识别或未找到类别的次数",
+    "storage_updates": "存储更新次数",
+    "busy": "因处理名额不足回复繁忙的请求数",
+    "rate_limited": "因站点限流回复繁忙的请求数",
+    "errors": "处理出错的请求数",
+    "admission_running": "正在处理的请求数",
+    "admission_waiting": "等待处理名额的请求数",
+    "step_queue": "asyncio 服务器中等待工作线程的处理步骤数",
+}
+
+def merge_histograms(target, histograms):
+    """把 [(名称, 标签, 各桶计数, 总和, 次数)] 累加到 {(名称, 标签): [各桶计数, 总和, 次数]}"""
+    for name, labels, buckets, total, count in histograms:
+        entry = target.get((name, labels))
+        if entry is None:
+            target[(name, labels)] = [list(buckets), total, count]
+        else:
+            entry[0] = [a + b for a, b in zip(entry[0], buckets)]
+            entry[1] += total
+            entry[2] += count
+    return target
+
+class Metrics:
+    """一个进程内的计数器、直方图和瞬时值"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._counters = Counter()
+        self._histograms = {}       # (名称, 标签) -> [各桶计数, 总和, 次数]
+        self._gauges = {}           # 名称 -> 返回当前值的函数
+
+    def inc(self, name, amount=1):
+        with self._lock:
+            self._counters[name] += amount
+
+    def observe(self, name, seconds, **labels):
+        """记录一次耗时，labels 为标签（如 phase="classify"）"""
+        key = (name, tuple(sorted(labels.items())))
+        index = bisect_left(self.buckets, seconds)
+        with self._lock:
+            entry = self._histograms.get(key)
+            if entry is None:
+                entry = self._histograms[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][index] += 1
+            entry[1] += seconds
+            entry[2] += 1
+
+    @contextmanager
+    def time(self, name, **labels):
+        """记录 with 语句块的耗时（出错时也记录）"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def register_gauge(self, name, func):
+        """登记一个瞬时值，输出时调用 func() 取值"""
+        self._gauges[name] = func
+
+    def snapshot(self):
+        """{"counters": {...}, "histograms": [(名称, 标签, 各桶计数, 总和, 次数)], "gauges": {...}}"""
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = [(name, labels, list(buckets), total, count)
+                          for (name, labels), (buckets, total, count) in self._histograms.items()]
+        gauges = {name: func() for name, func in self._gauges.items()}
+        return {"counters": counters, "histograms": histograms, "gauges": gauges}
+
+class WorkerMetrics:
+    """主进程汇总的各工作进程计数；工作进程重启后计数从零开始，退出前的计数记入 retired"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._workers = {}          # 工作进程序号 -> {"pid", "started", "restarts", "counters", ...}
+        self._retired = Counter()   # 已退出的工作进程最后一次上报的计数
+        self._retired_histograms = {}
+
+    def started(self, index, pid):
+        """工作进程（重新）启动"""
+        with self._lock:
+            previous = self._workers.get(index)
+            if previous is not None:
+                self._retired.update(previous["counters"])
+                merge_histograms(self._retired_histograms, previous["histograms"])
+            self._workers[index] = {
+                "pid": pid, "started": time.time(), "alive": True,
+                "restarts": previous["restarts"] + 1 if previous else 0,
+                "counters": {}, "histograms": [], "gauges": {}, "reported": None,
+            }
+
+    def exited(self, index, exitcode):
+        with self._lock:
+            if index in self._workers:
+                self._workers[index]["alive"] = False
+                self._workers[index]["exitcode"] = exitcode
+
+    def update(self, index, pid, report):
+        """记录一次上报：report 为 Metrics.snapshot() 的内容（其余内容原样保存）"""
+        with self._lock:
+            worker = self._workers.get(index)
+            if worker is None or worker["pid"] != pid:
+                return  # 已被替换的工作进程的迟到上报
+            worker.update(report)
+            worker["reported"] = time.time()
+
+    def __len__(self):
+        return len(self._workers)
+
+    def aggregate(self):
+        """合计的 Metrics.snapshot() 格式：计数和直方图包括已退出的工作进程，瞬时值只含运行中的"""
+        with self._lock:
+            counters = Counter(self._retired)
+            histograms = merge_histograms({}, [(name, labels, buckets, total, count) for (name, labels),
+                                               (buckets, total, count) in self._retired_histograms.items()])
+            gauges = Counter()
+            for worker in self._workers.values():
+                counters.update(worker["counters"])
+                merge_histograms(histograms, worker["histograms"])
+                if worker["alive"]:
+                    gauges.update(worker["gauges"])
+        return {"counters": dict(counters), "gauges": dict(gauges),
+                "histograms": [(name, labels, buckets, total, count)
+                               for (name, labels), (buckets, total, count) in histograms.items()]}
+
+    def snapshot(self):
+        """各工作进程（不含直方图）和合计的计数"""
+        total = self.aggregate()["counters"]
+        with self._lock:
+            workers = {str(index): {key: value for key, value in worker.items() if key != "histograms"}
+                       for index, worker in sorted(self._workers.items())}
+        return {"workers": workers, "total": total}
+
+def _format_labels(labels, **extra):
+    pairs = list(labels) + list(extra.items())
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in pairs) + "}"
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+def render_prometheus(snapshot, buckets=LATENCY_BUCKETS):
+    """把 Metrics.snapshot() 格式的数据输出为 Prometheus 文本格式"""
+    lines = []
+
+    def header(name, kind, suffix=""):
+        # HELP/TYPE 中的名称必须与样本名称一致，计数器的 _total 后缀也要带上
+        lines.append(f"# HELP {PREFIX}{name}{suffix} {HELP.get(name, name)}")
+        lines.append(f"# TYPE {PREFIX}{name}{suffix} {kind}")
+
+    for name, value in sorted(snapshot["counters"].items()):
+        header(name, "counter", "_total")
+        lines.append(f"{PREFIX}{name}_total {value}")
+
+    for name, value in sorted(snapshot["gauges"].items()):
+        header(name, "gauge")
+        lines.append(f"{PREFIX}{name} {_format_value(value)}")
+
+    bounds = [str(bound) for bound in buckets] + ["+Inf"]
+    histograms = sorted(snapshot["histograms"], key=lambda entry: (entry[0], entry[1]))
+    for i, (name, labels, counts, total, count) in enumerate(histograms):
+        if i == 0 or histograms[i - 1][0] != name:
+            header(name, "histogram")
+        cumulative = 0
+        for bound, bucket_count in zip(bounds, counts):
+            cumulative += bucket_count
+            lines.append(f"{PREFIX}{name}_bucket{_format_labels(labels, le=bound)} {cumulative}")
+        lines.append(f"{PREFIX}{name}_sum{_format_labels(labels)} {_format_value(total)}")
+        lines.append(f"{PREFIX}{name}_count{_format_labels(labels)} {count}")
+    return "\n".join(lines) + "\n"
+
+# 全局计数器
+_metrics = Metrics()
+_worker_metrics = WorkerMetrics()
+
+def get_metrics():
+    """本进程的计数器"""
+    return _metrics
+
+def get_worker_metrics():
+    """主进程汇总的工作进程计数（非预派生模式下为空）"""
+    return _worker_metrics
+
+def phase(name):
+    """记录一个处理阶段的耗时：with phase("classify"): ..."""
+    return _metrics.time("phase_seconds", phase=name)
+
+def prometheus_text():
+    """GET /metrics 的内容：预派生模式的主进程输出各工作进程的合计，否则输出本进程"""
+    if len(_worker_metrics):
+        return render_prometheus(_worker_metrics.aggregate())
+    return render_prometheus(_metrics.snapshot())
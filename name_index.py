@@ -0,0 +1,131 @@
+# name_index.py - 垃圾名称的模糊/别名查找
+# trash_knowledge 只能按名称精确匹配（CHAR(50) 主键），识别出的名称与库中稍有不同
+# （"塑料水瓶" 与 "塑料瓶"、全角字符、多余的空格）就查不到，只能回复类别5。
+# 这里在内存中建立索引，查找依次尝试：
+#   1. 规范化后的名称或别名（trash_alias 表）精确匹配，置信度 1.0
+#   2. 字符二元组（bigram）倒排索引取出共享片段最多的候选，按编辑距离排序，
+#      置信度 = 1 - 编辑距离 / 较长名称的长度
+# 置信度低于 NAME_MATCH_MIN_CONFIDENCE 时视为未找到；模糊匹配时另一类别的候选置信度与最好的
+# 相差不到 NAME_MATCH_MIN_MARGIN 时也视为未找到（两个类别都说得通，宁可回复类别5也不要猜错）。
+import re
+import unicodedata
+from collections import Counter, defaultdict, namedtuple
+from config import NAME_MATCH_MIN_CONFIDENCE, NAME_MATCH_MIN_MARGIN, NAME_MATCH_MAX_CANDIDATES
+
+# 查找结果：库中的垃圾名称、类别、置信度（0-1）
+Match = namedtuple("Match", "name category confidence")
+
+# 规范化时去掉的字符：空白、标点和下划线（汉字、字母、数字保留）
+_IGNORED = re.compile(r"[\W_]+")
+
+def normalize(name):
+    """规范化名称：全角转半角（NFKC）、转小写、去掉空白和标点"""
+    return _IGNORED.sub("", unicodedata.normalize("NFKC", name)).lower()
+
+def bigrams(text):
+    """相邻两个字符组成的片段集合，单个字符的名称返回它本身"""
+    if len(text) < 2:
+        return {text} if text else set()
+    return {text[i:i + 2] for i in range(len(text) - 1)}
+
+def edit_distance(a, b, limit):
+    """Levenshtein 编辑距离，超过 limit 时提前返回 limit + 1
+    只计算对角线两侧 limit 以内的格子（距离更远的格子一定超过 limit）"""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    over = limit + 1
+    previous = [j if j <= limit else over for j in range(len(b) + 1)]
+    for i, char_a in enumerate(a, 1):
+        current = [over] * (len(b) + 1)
+        current[0] = i if i <= limit else over
+        row_min = current[0]
+        for j in range(max(1, i - limit), min(len(b), i + limit) + 1):
+            cost = previous[j - 1] + (char_a != b[j - 1])
+            if previous[j] + 1 < cost:
+                cost = previous[j] + 1
+            if current[j - 1] + 1 < cost:
+                cost = current[j - 1] + 1
+            current[j] = cost
+            if cost < row_min:
+                row_min = cost
+        if row_min > limit:
+            return over
+        previous = current
+    return min(previous[-1], over)
+
+class NameIndex:
+    """垃圾名称索引：精确 / 别名 / 模糊匹配"""
+
+    def __init__(self, knowledge, aliases=None, min_confidence=NAME_MATCH_MIN_CONFIDENCE,
+                 min_margin=NAME_MATCH_MIN_MARGIN, max_candidates=NAME_MATCH_MAX_CANDIDATES):
+        """knowledge 为 {名称: 类别}，aliases 为 {别名: 名称}（指向不存在的名称的别名忽略）"""
+        self.min_confidence = min_confidence
+        self.min_margin = min_margin
+        self.max_candidates = max_candidates
+
+        self._exact = {}                    # 规范化的名称/别名 -> (名称, 类别)
+        for name, category in knowledge.items():
+            self._exact.setdefault(normalize(name), (name, category))
+        for alias, name in (aliases or {}).items():
+            if name in knowledge:
+                self._exact.setdefault(normalize(alias), (name, knowledge[name]))
+
+        self._keys = []                     # 候选序号 -> 规范化的名称/别名
+        self._postings = defaultdict(list)  # 二元组 -> 候选序号列表
+        for key in self._exact:
+            if not key:
+                continue
+            for gram in bigrams(key):
+                self._postings[gram].append(len(self._keys))
+            self._keys.append(key)
+
+    def __len__(self):
+        return len(self._exact)
+
+    def exact(self, name):
+        """规范化后精确匹配名称或别名，未找到返回None"""
+        entry = self._exact.get(normalize(name))
+        return Match(entry[0], entry[1], 1.0) if entry else None
+
+    def match(self, name):
+        """返回置信度最高的 Match；低于 min_confidence，或另一类别的候选与它相差不到 min_margin 时返回None"""
+        key = normalize(name)
+        entry = self._exact.get(key)
+        if entry:
+            return Match(entry[0], entry[1], 1.0)
+        if not key:
+            return None
+
+        # 单个字符的名称只有它本身一个片段，查询时也查每个字符
+        grams = bigrams(key)
+        shared = Counter()
+        for gram in grams | set(key):
+            shared.update(self._postings.get(gram, ()))
+
+        # 编辑距离超过 limit 时置信度一定低于 min_confidence，不必算完；
+        # 每处编辑最多破坏查询中的两个片段，共享片段太少的候选不用计算编辑距离。
+        # 候选按共享片段数而不是置信度排序，所有候选都要比较
+        scores = {}                         # 类别 -> (最高置信度, 候选)
+        for index, count in shared.most_common(self.max_candidates):
+            candidate = self._keys[index]
+            length = max(len(key), len(candidate))
+            limit = int(length * (1 - self.min_confidence))
+            if count < len(grams) - 2 * limit:
+                continue
+            distance = edit_distance(key, candidate, limit)
+            if distance > limit:
+                continue
+            confidence = 1 - distance / length
+            category = self._exact[candidate][1]
+            if confidence > scores.get(category, (0.0,))[0]:
+                scores[category] = (confidence, candidate)
+        if not scores:
+            return None
+
+        ranked = sorted(scores.values(), reverse=True)
+        best_confidence, best = ranked[0]
+        if len(ranked) > 1 and best_confidence - ranked[1][0] < self.min_margin:
+            return None
+
+        name, category = self._exact[best]
+        return Match(name, category, round(best_confidence, 3))
@@ -0,0 +1,257 @@
+# prefork.py - 预派生多进程服务器
+# server_program() 只有一个 Python 进程，识别、解析和数据库访问都受 GIL 限制，只能用满一个核。
+# 预派生模式由主进程启动 PREFORK_WORKERS 个工作进程，每个工作进程运行完整的服务器
+# （sever2.py 线程模式或 async_server.py），共享同一个监听端口：
+#   - 支持 SO_REUSEPORT 的系统（Linux、BSD）上每个工作进程各自绑定端口，由内核把新连接分给各进程
+#   - 否则（Windows）主进程绑定并监听，把监听套接字传给工作进程，各进程在同一个套接字上 accept
+# 主进程不处理连接，负责：
+#   - 工作进程退出时重新启动；运行不到 PREFORK_MIN_UPTIME 秒就退出时，重启前等待的时间逐次翻倍
+#   - 汇总各工作进程每 PREFORK_REPORT_INTERVAL 秒上报的运行计数（见 metrics.py）和存储更新；
+#     看板只在主进程运行，存储情况汇总（fill_stats.py）包含所有工作进程的更新，
+#     GET /api/workers 返回各工作进程和合计的计数，GET /metrics 输出合计的计数和各阶段耗时直方图
+# 注意：
+#   - 工作进程没有控制台，识别和存储估计必须使用自动后端（如 hash / simulated）
+#   - batch 识别后端在每个工作进程中各有一个推理进程池，需相应减小 INFERENCE_WORKERS
+#   - write_behind 模式下缓冲在各工作进程中，同一个垃圾桶的连续投放落到不同进程时
+#     可能读到刷新之前的存储值；需要读到最新值时使用 sync 模式或长连接会话（见 session.py）
+#
+# 用法：
+#   python prefork.py --classifier hash --estimator simulated
+#   python prefork.py --workers 4 --mode async --classifier batch --estimator simulated
+import argparse
+import multiprocessing
+import os
+import queue
+import signal
+import socket
+import threading
+import time
+from config import (SERVER_HOST, SERVER_PORT, SERVER_BACKLOG, CLASSIFIER_BACKEND, FILL_ESTIMATOR_BACKEND,
+                    PREFORK_WORKERS, PREFORK_MODE, PREFORK_REPORT_INTERVAL, PREFORK_MIN_UPTIME,
+                    PREFORK_RESTART_BACKOFF_MAX)
+from classifier import CLASSIFIERS, FILL_ESTIMATORS
+from fill_stats import get_fill_stats, set_fill_stats
+from metrics import get_metrics, get_worker_metrics
+
+# 各工作进程能否各自绑定同一个端口
+REUSE_PORT = hasattr(socket, "SO_REUSEPORT")
+
+def create_listener(host, port, reuse_port):
+    """创建监听套接字"""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if reuse_port:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind((host, port))
+    sock.listen(SERVER_BACKLOG)
+    return sock
+
+class ForwardingFillStats:
+    """工作进程中代替 FillStats：记下存储更新，由上报线程转发给主进程的汇总"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._updates = []
+
+    def update(self, location, cate_id, storage):
+        with self._lock:
+            self._updates.append((location.upper(), int(cate_id), storage))
+
+    def drain(self):
+        with self._lock:
+            updates, self._updates = self._updates, []
+        return updates
+
+def _interrupt(signum, frame):
+    """主进程用 SIGTERM 停止工作进程时按 Ctrl+C 处理，让服务器正常关闭（刷新缓冲的存储更新）"""
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    raise KeyboardInterrupt
+
+def report_loop(index, report_queue, fill_stats, interval, stopped):
+    """（工作进程）定期上报运行计数和存储更新，服务器关闭后再上报一次"""
+    from repository import get_repository
+    from storage_writer import get_storage_writer
+
+    def report():
+        snapshot = {**get_metrics().snapshot(),
+                    "pool": get_repository().pool.stats(),
+                    "writer": get_storage_writer().stats()}
+        report_queue.put((index, os.getpid(), snapshot, fill_stats.drain()))
+
+    while not stopped.wait(interval):
+        report()
+    report()
+
+def worker_main(index, mode, backends, address, listener, report_queue, interval):
+    """工作进程入口"""
+    # Ctrl+C 由主进程处理，工作进程等主进程的 SIGTERM
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, _interrupt)
+
+    from classifier import set_backends
+    set_backends(*backends)
+    fill_stats = ForwardingFillStats()
+    set_fill_stats(fill_stats)
+    if listener is None:
+        listener = create_listener(*address, reuse_port=True)
+
+    stopped = threading.Event()
+    reporter = threading.Thread(target=report_loop, name="worker-report",
+                                args=(index, report_queue, fill_stats, interval, stopped))
+    reporter.start()
+    try:
+        if mode == "async":
+            from async_server import async_server_program
+            async_server_program(listener, dashboard_port=None)
+        else:
+            from sever2 import server_program
+            server_program(listener, dashboard_port=None)
+    finally:
+        stopped.set()
+        reporter.join()
+
+class Supervisor:
+    """启动、重启工作进程，汇总它们的上报"""
+
+    def __init__(self, workers, mode, backends, host=SERVER_HOST, port=SERVER_PORT,
+                 interval=PREFORK_REPORT_INTERVAL):
+        self.workers = workers
+        self.mode = mode
+        self.backends = backends
+        self.address = (host, port)
+        self.interval = interval
+
+        # spawn：工作进程不继承主进程的数据库连接和线程
+        self._context = multiprocessing.get_context("spawn")
+        self._queue = self._context.Queue()
+        self._listener = None if REUSE_PORT else create_listener(host, port, reuse_port=False)
+        self._processes = {}        # 序号 -> 工作进程
+        self._started = {}          # 序号 -> 启动时间
+        self._next_start = {}       # 序号 -> 最早重启时间
+        self._fast_exits = {}       # 序号 -> 连续快速退出次数
+
+    def start_worker(self, index):
+        process = self._context.Process(
+            target=worker_main, name=f"gcs-worker-{index}",
+            args=(index, self.mode, self.backends, self.address, self._listener, self._queue, self.interval))
+        process.start()
+        self._processes[index] = process
+        self._started[index] = time.monotonic()
+        get_worker_metrics().started(index, process.pid)
+        print(f"👷 工作进程 {index} 已启动（pid {process.pid}）")
+
+    def check_workers(self):
+        """重启已退出的工作进程"""
+        now = time.monotonic()
+        for index in range(self.workers):
+            process = self._processes.get(index)
+            if process is not None:
+                if process.is_alive():
+                    continue
+                del self._processes[index]
+                get_worker_metrics().exited(index, process.exitcode)
+
+                if now - self._started[index] < PREFORK_MIN_UPTIME:
+                    self._fast_exits[index] = self._fast_exits.get(index, 0) + 1
+                    delay = min(PREFORK_RESTART_BACKOFF_MAX, 2 ** (self._fast_exits[index] - 1))
+                else:
+                    self._fast_exits[index] = 0
+                    delay = 0
+                self._next_start[index] = now + delay
+                print(f"⚠️  工作进程 {index}（pid {process.pid}）已退出，退出码 {process.exitcode}，"
+                      f"{delay} 秒后重启")
+
+            if now >= self._next_start.get(index, 0):
+                self.start_worker(index)
+
+    def drain_reports(self, timeout):
+        """处理工作进程的上报，最多等待 timeout 秒"""
+        try:
+            message = self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return
+        fill_stats = get_fill_stats()
+        while True:
+            index, pid, report, updates = message
+            get_worker_metrics().update(index, pid, report)
+            for location, cate_id, storage in updates:
+                fill_stats.update(location, cate_id, storage)
+            try:
+                message = self._queue.get_nowait()
+            except queue.Empty:
+                return
+
+    def run(self):
+        """运行到 Ctrl+C 或 SIGTERM"""
+        for index in range(self.workers):
+            self.start_worker(index)
+        while True:
+            self.drain_reports(0.5)
+            self.check_workers()
+
+    def stop(self, timeout=10):
+        """让工作进程正常关闭，超时后强制结束"""
+        for process in self._processes.values():
+            process.terminate()
+        deadline = time.monotonic() + timeout
+        while any(process.is_alive() for process in self._processes.values()):
+            if time.monotonic() > deadline:
+                for process in self._processes.values():
+                    process.kill()
+                break
+            # 工作进程退出前要把最后的上报写完，一边等待一边读取
+            self.drain_reports(0.2)
+        for process in self._processes.values():
+            process.join()
+        self.drain_reports(0)
+        if self._listener is not None:
+            self._listener.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="智能垃圾桶服务器（预派生多进程）")
+    parser.add_argument("--workers", type=int, default=PREFORK_WORKERS or os.cpu_count() or 1,
+                        help="工作进程数，默认为CPU核数")
+    parser.add_argument("--mode", choices=("thread", "async"), default=PREFORK_MODE,
+                        help="工作进程中运行的服务器")
+    parser.add_argument("--classifier", choices=sorted(CLASSIFIERS), default=CLASSIFIER_BACKEND)
+    parser.add_argument("--estimator", choices=sorted(FILL_ESTIMATORS), default=FILL_ESTIMATOR_BACKEND)
+    parser.add_argument("--host", default=SERVER_HOST)
+    parser.add_argument("--port", type=int, default=SERVER_PORT)
+    args = parser.parse_args()
+
+    if CLASSIFIERS[args.classifier].interactive or FILL_ESTIMATORS[args.estimator].interactive:
+        parser.error("工作进程没有控制台，请使用自动后端，如 --classifier hash --estimator simulated")
+    if args.workers < 1:
+        parser.error("--workers 至少为1")
+
+    print("=" * 50)
+    print("智能垃圾桶服务器（预派生多进程）")
+    print("=" * 50)
+    print(f"监听地址：{args.host}:{args.port}，工作进程 {args.workers} 个（{args.mode} 模式），"
+          f"{'SO_REUSEPORT' if REUSE_PORT else '共享监听套接字'}")
+    print("按 Ctrl+C 停止服务器")
+    print("-" * 50)
+
+    # 主进程收到 SIGTERM 时与 Ctrl+C 一样停止所有工作进程
+    signal.signal(signal.SIGTERM, _interrupt)
+
+    from dashboard import start_dashboard, stop_dashboard
+    from repository import get_repository
+
+    supervisor = Supervisor(args.workers, args.mode, (args.classifier, args.estimator), args.host, args.port)
+    repository = get_repository()
+    dashboard = start_dashboard(repository)
+    repository.close()  # 主进程只在加载存储情况汇总时访问数据库
+    try:
+        supervisor.run()
+    except KeyboardInterrupt:
+        print("\n\n🛑 正在关闭服务器...")
+    finally:
+        supervisor.stop()
+        stop_dashboard(dashboard)
+        total = get_worker_metrics().snapshot()["total"]
+        print(f"📊 合计：{', '.join(f'{name} {count}' for name, count in sorted(total.items())) or '无'}")
+        print("✅ 服务器已关闭")
+
+if __name__ == "__main__":
+    main()
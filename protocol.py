@@ -0,0 +1,178 @@
+# protocol.py - 垃圾桶与服务器之间的分帧协议
+# 旧协议直接 send/recv(1024) 裸字符串，高负载下消息可能粘包或被拆开，也无法在一个连接上
+# 同时处理多个请求。分帧协议与 transport.py 的 STR/IMG 前缀类似，每一帧为：
+#
+#   类型(3字节) + 请求编号(4字节，大端) + 长度(8字节，大端) + 内容
+#
+# 客户端建立连接后先发送 MAGIC，服务器据此区分新旧协议。同一连接上可以连续发送多个请求，
+# 服务器按请求编号回复，回复顺序不一定与请求顺序一致。
+#
+# 帧类型：
+#   REQ 客户端 -> 服务器  外部图片路径|站点编号
+#   CAT 服务器 -> 客户端  垃圾类别编号（5 表示无法识别）
+#   INR 客户端 -> 服务器  内部垃圾桶图片路径
+#   STO 服务器 -> 客户端  存储百分比
+#   ERR 服务器 -> 客户端  错误信息
+#   IMG 客户端 -> 服务器  图片数据（见 image_receiver.py），在 REQ 之前上传为外部图片，
+#                         收到 CAT 之后上传为内部图片；对应的 REQ/INR 中图片路径可以留空
+#   HBT 双向              心跳（见 session.py），服务器收到后立即原样回复，内容为空
+#   DSP 客户端 -> 服务器  合并请求：外部图片路径|内部图片路径|站点编号，一轮完成识别和存储分析；
+#                         之前可以依次上传外部、内部图片（IMG），对应路径留空
+#   RES 服务器 -> 客户端  合并请求的结果：类别编号|存储百分比（无法识别时为 5|）
+#   BSY 服务器 -> 客户端  服务器繁忙或站点投放过于频繁（见 admission.py），内容为建议等待的毫秒数；
+#                         请求编号为0时表示连接数已达上限，服务器随后关闭连接
+#
+# 另外兼容 transport.py 的旧格式（没有 MAGIC 和请求编号，服务器不回复）：
+#   STR + 长度(4字节) + 字符串    IMG + 长度(8字节) + 图片数据
+# 旧协议的路径也可能以 STR/IMG 开头（如相机文件名 IMG_0001.jpg），只有长度合理时才按 transport 格式处理。
+import socket
+import struct
+import time
+from config import MAX_IMAGE_SIZE
+
+MAGIC = b"GCS1"
+
+HEADER = struct.Struct("!3sIQ")
+
+TAG_REQUEST = b"REQ"
+TAG_CATEGORY = b"CAT"
+TAG_INNER = b"INR"
+TAG_STORAGE = b"STO"
+TAG_ERROR = b"ERR"
+TAG_IMAGE = b"IMG"
+TAG_HEARTBEAT = b"HBT"
+TAG_DISPOSE = b"DSP"
+TAG_RESULT = b"RES"
+TAG_BUSY = b"BSY"
+
+# 文本帧的最大长度，防止异常长度把内存撑爆
+MAX_TEXT_FRAME = 64 * 1024
+
+class FrameError(Exception):
+    """帧格式错误"""
+
+class ServerBusyError(Exception):
+    """服务器繁忙（BSY），retry_after_ms 毫秒后重试"""
+
+    def __init__(self, retry_after_ms):
+        super().__init__(f"服务器繁忙，请 {retry_after_ms}ms 后重试")
+        self.retry_after_ms = retry_after_ms
+
+def encode_frame(tag, request_id, payload=b""):
+    """编码一帧，payload 可以是 bytes 或 str"""
+    if isinstance(payload, str):
+        payload = payload.encode("utf-8")
+    return HEADER.pack(tag, request_id, len(payload)) + payload
+
+def decode_header(header):
+    """解析帧头，返回 (类型, 请求编号, 长度)"""
+    return HEADER.unpack(header)
+
+def recv_exact(sock, size):
+    """从套接字读取正好 size 个字节，连接关闭时抛出 ConnectionResetError"""
+    buf = bytearray()
+    while len(buf) < size:
+        chunk = sock.recv(min(size - len(buf), 65536))
+        if not chunk:
+            raise ConnectionResetError("连接已关闭")
+        buf.extend(chunk)
+    return bytes(buf)
+
+def read_header(sock):
+    """读取帧头；对端在帧边界正常关闭时返回None"""
+    first = sock.recv(HEADER.size)
+    if not first:
+        return None
+    if len(first) < HEADER.size:
+        first += recv_exact(sock, HEADER.size - len(first))
+    return decode_header(first)
+
+def check_length(tag, length, max_size=MAX_TEXT_FRAME):
+    if length > max_size:
+        raise FrameError(f"帧过长：{tag!r} {length} 字节")
+
+def read_frame(sock, max_size=MAX_TEXT_FRAME):
+    """读取一帧，返回 (类型, 请求编号, 内容)；对端正常关闭时返回None"""
+    header = read_header(sock)
+    if header is None:
+        return None
+    tag, request_id, length = header
+    check_length(tag, length, max_size)
+    return tag, request_id, recv_exact(sock, length)
+
+def send_frame(sock, tag, request_id, payload=b""):
+    """发送一帧"""
+    sock.sendall(encode_frame(tag, request_id, payload))
+
+async def read_header_async(reader):
+    """asyncio版本的 read_header"""
+    import asyncio
+    try:
+        header = await reader.readexactly(HEADER.size)
+    except asyncio.IncompleteReadError as e:
+        if not e.partial:
+            return None
+        raise ConnectionResetError("连接已关闭")
+    return decode_header(header)
+
+async def read_payload_async(reader, length):
+    """asyncio版本：读取正好 length 字节的帧内容"""
+    import asyncio
+    try:
+        return await reader.readexactly(length)
+    except asyncio.IncompleteReadError:
+        raise ConnectionResetError("连接已关闭")
+
+async def read_frame_async(reader, max_size=MAX_TEXT_FRAME):
+    """asyncio版本的 read_frame"""
+    header = await read_header_async(reader)
+    if header is None:
+        return None
+    tag, request_id, length = header
+    check_length(tag, length, max_size)
+    return tag, request_id, await read_payload_async(reader, length)
+
+def detect_framed(sock, wait=1.0):
+    """窥探连接开头是否为 MAGIC（不消费数据）；是则读掉 MAGIC 并返回True"""
+    deadline = time.monotonic() + wait
+    while True:
+        data = sock.recv(len(MAGIC), socket.MSG_PEEK)
+        if not data or not MAGIC.startswith(data):
+            return False
+        if data == MAGIC:
+            recv_exact(sock, len(MAGIC))
+            return True
+        # 只收到 MAGIC 的一部分，稍等后再看
+        if time.monotonic() >= deadline:
+            return False
+        time.sleep(0.01)
+
+def detect_transport(sock, max_image_size=MAX_IMAGE_SIZE):
+    """窥探连接开头是否为 transport.py 的 STR/IMG 格式（不消费数据）
+    以 STR/IMG 开头的旧协议请求（如 IMG_0001.jpg|ABCDE）按长度区分：
+    IMG 的长度须为 1 ~ max_image_size；STR 的长度不超过 MAX_TEXT_FRAME，且字符串中没有“|”"""
+    tag = recv_peek(sock, 3)
+    if tag == b"IMG":
+        data = recv_peek(sock, 11)
+        if len(data) < 11:
+            return False
+        return 0 < int.from_bytes(data[3:], byteorder="big") <= max_image_size
+    if tag == b"STR":
+        data = recv_peek(sock, 7)
+        if len(data) < 7:
+            return False
+        length = int.from_bytes(data[3:], byteorder="big")
+        if length > MAX_TEXT_FRAME:
+            return False
+        data = recv_peek(sock, 7 + length)
+        return len(data) == 7 + length and b"|" not in data[7:]
+    return False
+
+def recv_peek(sock, size, wait=1.0):
+    """窥探最多 size 个字节，数据不足时最多等待 wait 秒"""
+    deadline = time.monotonic() + wait
+    while True:
+        data = sock.recv(size, socket.MSG_PEEK)
+        if not data or len(data) >= size or time.monotonic() >= deadline:
+            return data
+        time.sleep(0.01)
@@ -0,0 +1,670 @@
+# repository.py - 数据访问层
+# 服务器、init_db.py 和 sql.py 原来各自拼 SQL、直接连接 localhost 上的 MySQL，
+# 没有数据库服务器时（本地压测、单板网关）无法运行。这里把 trash_bin、trash_knowledge、
+# trash_alias、knowledge_version 和 images 等表的读写集中起来，按 config.DB_BACKEND 选择实现：
+#   mysql   原来的 MySQL（pymysql + db_pool 连接池），两个库 information / image_database
+#   sqlite  嵌入式 SQLite，所有表放在 SQLITE_PATH 一个文件中；
+#           WAL 模式下读不阻塞写，语句使用参数占位符，由 sqlite3 按连接缓存预编译结果
+# 两种实现的 SQL 只有建表语句和 upsert 写法不同，其余共用基类中的语句。
+# images 表按内容哈希去重：image_blobs 中每种内容只有一行（尺寸、格式、保存的那一份文件），
+# images 中每个文件路径一行，通过 content_hash 引用。文件删除或内容改变后，没有文件再引用的内容
+# 从 image_blobs 删除，保存路径指向该文件的改为指向同一内容的另一个文件（见 release_blobs）。
+import os
+import sqlite3
+import threading
+from contextlib import closing, contextmanager
+from functools import lru_cache
+import pymysql
+from config import (DB_BACKEND, DB_CONFIG, IMAGE_DB_CONFIG, DB_POOL_CONFIG,
+                    SQLITE_PATH, SQLITE_BUSY_TIMEOUT, STORAGE_FLUSH_MAX_UPDATES, SEED_CHUNK_SIZE)
+from db_pool import ConnectionPool, PoolTimeoutError, get_pool
+
+# 调用方捕获数据库错误时使用，不必关心当前是哪种数据库
+DB_ERRORS = (pymysql.Error, sqlite3.Error, PoolTimeoutError)
+
+class Repository:
+    """数据访问接口，SQL 使用 %s 占位符，子类负责方言差异"""
+    name = "base"
+
+    def __init__(self, pool, image_pool=None):
+        self.pool = pool
+        self.image_pool = image_pool or pool
+
+    # ---------------------------- 连接 ----------------------------
+
+    def _sql(self, query):
+        return query
+
+    @contextmanager
+    def _cursor(self, pool=None):
+        """从连接池取出连接和游标，with 结束后放回（未提交的事务会被回滚）"""
+        with (pool or self.pool).connection() as conn, closing(conn.cursor()) as cursor:
+            yield conn, cursor
+
+    def _execute(self, cursor, query, params=()):
+        cursor.execute(self._sql(query), params)
+        return cursor
+
+    def _fetchall(self, query, params=(), pool=None):
+        with self._cursor(pool) as (conn, cursor):
+            return self._execute(cursor, query, params).fetchall()
+
+    def _fetchone(self, query, params=(), pool=None):
+        with self._cursor(pool) as (conn, cursor):
+            return self._execute(cursor, query, params).fetchone()
+
+    def warm_up(self):
+        return self.pool.warm_up()
+
+    def start_reaper(self):
+        self.pool.start_reaper()
+
+    def print_stats(self):
+        self.pool.print_stats()
+        if self.image_pool is not self.pool:
+            self.image_pool.print_stats()
+
+    def close(self):
+        self.pool.close()
+        if self.image_pool is not self.pool:
+            self.image_pool.close()
+
+    # ---------------------------- 建表 ----------------------------
+
+    SCHEMA = ()
+    IMAGE_SCHEMA = ()
+    # 旧版本建的 images 表缺少的列，以及需要的二级索引（索引名 -> 列）
+    IMAGE_COLUMNS = {"content_hash": "CHAR(32)"}
+    IMAGE_INDEXES = {
+        "idx_content_hash": "content_hash",
+        "idx_created_time": "created_time, id",                 # 按添加时间分页
+        "idx_format_created": "file_format, created_time, id",  # 按格式筛选后分页
+        "idx_file_size": "file_size",
+    }
+
+    def create_schema(self):
+        """创建 trash_bin、trash_knowledge、trash_alias、knowledge_version 表"""
+        with self._cursor() as (conn, cursor):
+            for statement in self.SCHEMA:
+                cursor.execute(statement)
+            conn.commit()
+
+    def create_image_schema(self):
+        """创建 images、image_blobs 表，给旧表补上缺少的列和索引"""
+        with self._cursor(self.image_pool) as (conn, cursor):
+            for statement in self.IMAGE_SCHEMA:
+                cursor.execute(statement)
+            columns = self._columns(cursor, "images")
+            for column, definition in self.IMAGE_COLUMNS.items():
+                if column not in columns:
+                    cursor.execute(f"ALTER TABLE images ADD COLUMN {column} {definition}")
+                    print(f"images 表已添加列 {column}")
+            indexes = self._indexes(cursor, "images")
+            for index, columns in self.IMAGE_INDEXES.items():
+                if index not in indexes:
+                    cursor.execute(f"CREATE INDEX {index} ON images ({columns})")
+                    print(f"images 表已创建索引 {index}")
+            conn.commit()
+
+    def _columns(self, cursor, table):
+        raise NotImplementedError
+
+    def _indexes(self, cursor, table):
+        raise NotImplementedError
+
+    # ---------------------------- 垃圾桶 ----------------------------
+
+    UPSERT_STORAGE = ""
+    UPDATE_STORAGES = ""        # {rows} 为 _storage_rows 生成的 (location, category_id, storage) 多行
+    INSERT_BIN = ""
+
+    def get_storage(self, location, cate_code):
+        """查询垃圾桶存储情况，不存在返回None"""
+        row = self._fetchone(
+            "SELECT storage FROM trash_bin WHERE location = %s AND category_id = %s",
+            (location.upper(), int(cate_code))
+        )
+        return row[0] if row else None
+
+    def update_storage(self, location, cate_code, storage):
+        """更新已有垃圾桶的存储情况，返回是否找到该垃圾桶"""
+        with self._cursor() as (conn, cursor):
+            self._execute(
+                cursor,
+                "UPDATE trash_bin SET storage = %s WHERE location = %s AND category_id = %s",
+                (storage, location.upper(), int(cate_code))
+            )
+            conn.commit()
+            return cursor.rowcount > 0
+
+    def _storage_rows(self, count):
+        return ", ".join(["(%s, %s, %s)"] * count)
+
+    def update_storages(self, rows, chunk_size=STORAGE_FLUSH_MAX_UPDATES):
+        """批量更新已有垃圾桶的存储 [(位置, 类别, 存储)]，不存在的垃圾桶跳过（与 update_storage 一致，不插入），
+        每条语句最多 chunk_size 行，一个事务提交"""
+        with self._cursor() as (conn, cursor):
+            for start in range(0, len(rows), chunk_size):
+                chunk = rows[start:start + chunk_size]
+                self._execute(cursor, self.UPDATE_STORAGES.format(rows=self._storage_rows(len(chunk))),
+                              [value for row in chunk for value in row])
+            conn.commit()
+        return len(rows)
+
+    def upsert_storages(self, rows, chunk_size=STORAGE_FLUSH_MAX_UPDATES):
+        """批量写入 [(位置, 类别, 存储)]，不存在的垃圾桶会被插入（压力测试建库用），
+        每条语句最多 chunk_size 行，一个事务提交"""
+        with self._cursor() as (conn, cursor):
+            for start in range(0, len(rows), chunk_size):
+                chunk = rows[start:start + chunk_size]
+                placeholders = ", ".join(["(%s, %s, %s)"] * len(chunk))
+                self._execute(cursor, self.UPSERT_STORAGE.format(placeholders=placeholders),
+                              [value for row in chunk for value in row])
+            conn.commit()
+        return len(rows)
+
+    def add_bin(self, location, cate_id):
+        """添加垃圾桶，已存在时返回False"""
+        with self._cursor() as (conn, cursor):
+            self._execute(cursor, self.INSERT_BIN, (location.upper(), int(cate_id)))
+            conn.commit()
+            return cursor.rowcount > 0
+
+    def list_bins(self):
+        return self._fetchall("SELECT location, category_id, storage FROM trash_bin ORDER BY location, category_id")
+
+    def clear_bins(self):
+        with self._cursor() as (conn, cursor):
+            cursor.execute("DELETE FROM trash_bin")
+            conn.commit()
+
+    def count_bins(self):
+        return self._fetchone("SELECT COUNT(*) FROM trash_bin")[0]
+
+    # ---------------------------- 垃圾知识 ----------------------------
+
+    BUMP_VERSION = ""
+    INSERT_KNOWLEDGE = ""
+    INSERT_ALIAS = ""
+
+    def knowledge_version(self):
+        """知识库版本号，版本表不存在时返回None"""
+        try:
+            row = self._fetchone("SELECT version FROM knowledge_version WHERE id = 1")
+        except (pymysql.Error, sqlite3.Error):
+            return None  # 旧数据库没有版本表，只依赖TTL刷新
+        return row[0] if row else 0
+
+    def load_knowledge(self):
+        """整表读取垃圾知识和别名，返回 (版本号, {名称: 类别}, {别名: 名称})，在同一个连接上读取"""
+        with self._cursor() as (conn, cursor):
+            try:
+                row = self._execute(cursor, "SELECT version FROM knowledge_version WHERE id = 1").fetchone()
+                version = row[0] if row else 0
+            except (pymysql.Error, sqlite3.Error):
+                version = None
+            try:
+                cursor.execute("SELECT alias, name FROM trash_alias")
+                aliases = {alias.strip(): name.strip() for alias, name in cursor.fetchall()}
+            except (pymysql.Error, sqlite3.Error):
+                aliases = {}  # 旧数据库没有别名表
+            cursor.execute("SELECT name, category FROM trash_knowledge")
+            return version, {name.strip(): category for name, category in cursor.fetchall()}, aliases
+
+    def get_category(self, name):
+        """直接查询数据库中的垃圾类别（精确匹配），未找到返回None"""
+        row = self._fetchone("SELECT category FROM trash_knowledge WHERE name = %s", (name.strip(),))
+        return row[0] if row else None
+
+    def add_knowledge(self, name, category):
+        """添加一条垃圾知识并递增版本号，名称已存在时返回False"""
+        return bool(self.add_knowledge_many([(name, category)]))
+
+    def add_knowledge_many(self, items):
+        """在一个事务中添加多条 (名称, 类别)，跳过已存在的名称，返回实际添加的名称列表"""
+        added = []
+        with self._cursor() as (conn, cursor):
+            for name, category in items:
+                self._execute(cursor, self.INSERT_KNOWLEDGE, (name, int(category)))
+                if cursor.rowcount > 0:
+                    added.append(name)
+            if added:
+                cursor.execute(self.BUMP_VERSION)
+            conn.commit()
+        return added
+
+    def list_knowledge(self):
+        return self._fetchall("SELECT name, category FROM trash_knowledge ORDER BY category, name")
+
+    def clear_knowledge(self):
+        with self._cursor() as (conn, cursor):
+            cursor.execute("DELETE FROM trash_knowledge")
+            cursor.execute(self.BUMP_VERSION)
+            conn.commit()
+
+    def count_knowledge(self):
+        return self._fetchone("SELECT COUNT(*) FROM trash_knowledge")[0]
+
+    def seed(self, bins=(), knowledge=(), aliases=(), chunk_size=SEED_CHUNK_SIZE):
+        """批量导入 [(位置, 类别)] 垃圾桶、[(名称, 类别)] 垃圾知识和 [(别名, 名称)] 别名，已存在的跳过
+        每 chunk_size 行一次 executemany，全部在一个事务中提交（出错时整体回滚），
+        有新增的垃圾知识或别名时递增版本号。返回 (新增垃圾桶数, 新增垃圾知识数, 新增别名数)"""
+        with self._cursor() as (conn, cursor):
+            added_bins = self._executemany(cursor, self.INSERT_BIN, bins, chunk_size)
+            added_knowledge = self._executemany(cursor, self.INSERT_KNOWLEDGE, knowledge, chunk_size)
+            added_aliases = self._executemany(cursor, self.INSERT_ALIAS, aliases, chunk_size)
+            if added_knowledge or added_aliases:
+                cursor.execute(self.BUMP_VERSION)
+            conn.commit()
+        return added_bins, added_knowledge, added_aliases
+
+    def _executemany(self, cursor, query, rows, chunk_size):
+        """分块 executemany，返回影响的总行数"""
+        query = self._sql(query)
+        total = 0
+        for start in range(0, len(rows), chunk_size):
+            cursor.executemany(query, rows[start:start + chunk_size])
+            total += max(cursor.rowcount, 0)
+        return total
+
+    # ---------------------------- 图片信息 ----------------------------
+
+    UPSERT_IMAGE = ""
+    INSERT_BLOB = ""
+
+    def upsert_images(self, rows):
+        """写入 [(文件名, 路径, 大小, 宽, 高, 格式, 内容哈希)]，路径已存在时更新，一个事务提交
+        使用 executemany：pymysql 会改写成一条多行 INSERT，sqlite3 复用同一条预编译语句"""
+        if not rows:
+            return 0
+        with self._cursor(self.image_pool) as (conn, cursor):
+            cursor.executemany(self._sql(self.UPSERT_IMAGE), rows)
+            conn.commit()
+        return len(rows)
+
+    def insert_blobs(self, rows):
+        """写入 [(内容哈希, 大小, 宽, 高, 格式, 保存路径)]，内容已存在的跳过，返回新增的行数"""
+        if not rows:
+            return 0
+        with self._cursor(self.image_pool) as (conn, cursor):
+            cursor.executemany(self._sql(self.INSERT_BLOB), rows)
+            conn.commit()
+            return cursor.rowcount
+
+    def find_blobs(self, content_hashes, chunk_size=500):
+        """查询已有的内容，返回 {内容哈希: 保存路径}"""
+        content_hashes = list(content_hashes)
+        found = {}
+        for start in range(0, len(content_hashes), chunk_size):
+            chunk = content_hashes[start:start + chunk_size]
+            placeholders = ", ".join(["%s"] * len(chunk))
+            found.update(self._fetchall(
+                f"SELECT content_hash, blob_path FROM image_blobs WHERE content_hash IN ({placeholders})",
+                chunk, pool=self.image_pool
+            ))
+        return found
+
+    def duplicate_stats(self):
+        """返回 (图片行数, 不同内容数)"""
+        return self._fetchone("SELECT COUNT(*), COUNT(DISTINCT content_hash) FROM images",
+                              pool=self.image_pool)
+
+    def delete_images(self, file_paths, chunk_size=500):
+        """按路径删除图片信息，一个事务提交，返回 (删除的行数, 不再被引用的内容的保存路径列表)
+        被删除的文件引用的内容按 release_blobs 处理"""
+        if not file_paths:
+            return 0, []
+        file_paths = list(file_paths)
+        with self._cursor(self.image_pool) as (conn, cursor):
+            content_hashes = set()
+            for start in range(0, len(file_paths), chunk_size):
+                chunk = file_paths[start:start + chunk_size]
+                placeholders = ", ".join(["%s"] * len(chunk))
+                self._execute(cursor, f"SELECT content_hash FROM images WHERE file_path IN ({placeholders})", chunk)
+                content_hashes.update(row[0] for row in cursor.fetchall())
+            cursor.executemany(self._sql("DELETE FROM images WHERE file_path = %s"),
+                               [(file_path,) for file_path in file_paths])
+            deleted = cursor.rowcount
+            orphaned = self._release_blobs(cursor, content_hashes, set(file_paths))
+            conn.commit()
+        return deleted, orphaned
+
+    def release_blobs(self, content_hashes, released_paths):
+        """images 中的文件不再是 content_hashes 中的内容（已删除或内容已改变）之后调用，
+        released_paths 为这些文件的路径，返回不再被引用的内容的保存路径列表"""
+        with self._cursor(self.image_pool) as (conn, cursor):
+            orphaned = self._release_blobs(cursor, content_hashes, set(released_paths))
+            conn.commit()
+        return orphaned
+
+    def _release_blobs(self, cursor, content_hashes, released_paths):
+        """没有文件引用的内容从 image_blobs 删除；保存路径是 released_paths 中的文件
+        （未配置 IMAGE_BLOB_DIR 时引用第一次见到的文件）的，改为引用同一内容的另一个文件"""
+        orphaned = []
+        for content_hash in content_hashes:
+            if content_hash is None:
+                continue
+            blob = self._execute(cursor, "SELECT blob_path FROM image_blobs WHERE content_hash = %s",
+                                 (content_hash,)).fetchone()
+            if blob is None:
+                continue
+            survivor = self._execute(cursor, "SELECT MIN(file_path) FROM images WHERE content_hash = %s",
+                                     (content_hash,)).fetchone()[0]
+            if survivor is None:
+                self._execute(cursor, "DELETE FROM image_blobs WHERE content_hash = %s", (content_hash,))
+                orphaned.append(blob[0])
+            elif blob[0] in released_paths:
+                self._execute(cursor, "UPDATE image_blobs SET blob_path = %s WHERE content_hash = %s",
+                              (survivor, content_hash))
+        return orphaned
+
+    def count_images(self):
+        return self._fetchone("SELECT COUNT(*) FROM images", pool=self.image_pool)[0]
+
+    def query_images(self, limit=10, after=None, since=None, until=None, file_format=None,
+                     min_width=None, min_height=None):
+        """按添加时间从新到旧分页查询图片，返回 (行列表, 下一页游标)
+        行为 (id, 文件名, 大小, 宽, 高, 添加时间, 格式)；after 为上一页返回的游标 (添加时间, id)，
+        用 WHERE 定位到上一页最后一行之后（键集分页），每页的代价与页数无关，不使用 OFFSET。
+        since/until 为添加时间范围（含 since，不含 until），没有下一页时游标为None"""
+        conditions = []
+        params = []
+        if after is not None:
+            created_time, last_id = after
+            conditions.append("(created_time < %s OR (created_time = %s AND id < %s))")
+            params += [created_time, created_time, last_id]
+        if since is not None:
+            conditions.append("created_time >= %s")
+            params.append(since)
+        if until is not None:
+            conditions.append("created_time < %s")
+            params.append(until)
+        if file_format is not None:
+            conditions.append("file_format = %s")
+            params.append(file_format.upper())
+        if min_width is not None:
+            conditions.append("image_width >= %s")
+            params.append(int(min_width))
+        if min_height is not None:
+            conditions.append("image_height >= %s")
+            params.append(int(min_height))
+
+        where = " WHERE " + " AND ".join(conditions) if conditions else ""
+        rows = self._fetchall(
+            "SELECT id, file_name, file_size, image_width, image_height, created_time, file_format "
+            "FROM images" + where + " ORDER BY created_time DESC, id DESC LIMIT %s",
+            params + [int(limit)], pool=self.image_pool
+        )
+        cursor = (rows[-1][5], rows[-1][0]) if len(rows) == limit else None
+        return rows, cursor
+
+class MySQLRepository(Repository):
+    """MySQL实现"""
+    name = "mysql"
+
+    SCHEMA = (
+        '''
+        CREATE TABLE IF NOT EXISTS trash_bin (
+            location CHAR(5) NOT NULL,          -- 5位英文字符位置信息
+            category_id INT NOT NULL,           -- 垃圾桶类别编号(1-5)
+            storage INT DEFAULT 0,              -- 存储情况(0-100)
+            PRIMARY KEY (location, category_id)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS trash_knowledge (
+            category INT NOT NULL,              -- 垃圾类别(1-4)
+            name CHAR(50) NOT NULL,             -- 垃圾名称（主码）
+            PRIMARY KEY (name)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS trash_alias (
+            alias CHAR(50) NOT NULL,            -- 别名（如 饮料瓶、PET瓶）
+            name CHAR(50) NOT NULL,             -- 对应 trash_knowledge 中的垃圾名称
+            PRIMARY KEY (alias)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS knowledge_version (
+            id TINYINT NOT NULL,                -- 固定为1
+            version BIGINT NOT NULL DEFAULT 0,  -- 每次修改 trash_knowledge 后递增
+            PRIMARY KEY (id)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+        ''',
+    )
+
+    IMAGE_SCHEMA = (
+        '''
+        CREATE TABLE IF NOT EXISTS images (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            file_name VARCHAR(255) NOT NULL,
+            file_path VARCHAR(500) NOT NULL,
+            file_size BIGINT,
+            image_width INT,
+            image_height INT,
+            file_format VARCHAR(50),
+            created_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            content_hash CHAR(32),                  -- 文件内容哈希，引用 image_blobs
+            UNIQUE KEY unique_file (file_path)
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS image_blobs (
+            content_hash CHAR(32) NOT NULL PRIMARY KEY,
+            file_size BIGINT,
+            image_width INT,
+            image_height INT,
+            file_format VARCHAR(50),
+            blob_path VARCHAR(500) NOT NULL,        -- 保存的那一份内容（或第一次见到的文件）
+            created_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+    )
+
+    UPSERT_STORAGE = ("INSERT INTO trash_bin (location, category_id, storage) VALUES {placeholders}"
+                      " ON DUPLICATE KEY UPDATE storage = VALUES(storage)")
+    UPDATE_STORAGES = ("UPDATE trash_bin JOIN ({rows}) AS v"
+                       " ON trash_bin.location = v.location AND trash_bin.category_id = v.category_id"
+                       " SET trash_bin.storage = v.storage")
+    INSERT_BIN = "INSERT IGNORE INTO trash_bin (location, category_id) VALUES (%s, %s)"
+    BUMP_VERSION = ("INSERT INTO knowledge_version (id, version) VALUES (1, 1) "
+                    "ON DUPLICATE KEY UPDATE version = version + 1")
+    INSERT_KNOWLEDGE = "INSERT IGNORE INTO trash_knowledge (name, category) VALUES (%s, %s)"
+    INSERT_ALIAS = "INSERT IGNORE INTO trash_alias (alias, name) VALUES (%s, %s)"
+    UPSERT_IMAGE = '''
+        INSERT INTO images (file_name, file_path, file_size, image_width, image_height, file_format, content_hash)
+        VALUES (%s, %s, %s, %s, %s, %s, %s)
+        ON DUPLICATE KEY UPDATE
+            file_size = VALUES(file_size),
+            image_width = VALUES(image_width),
+            image_height = VALUES(image_height),
+            file_format = VALUES(file_format),
+            content_hash = VALUES(content_hash)
+    '''
+    INSERT_BLOB = '''
+        INSERT IGNORE INTO image_blobs (content_hash, file_size, image_width, image_height, file_format, blob_path)
+        VALUES (%s, %s, %s, %s, %s, %s)
+    '''
+
+    def __init__(self, pool=None, image_pool=None):
+        super().__init__(pool or get_pool(), image_pool or ConnectionPool(
+            lambda: pymysql.connect(**IMAGE_DB_CONFIG), name=IMAGE_DB_CONFIG["database"], **DB_POOL_CONFIG
+        ))
+
+    def _storage_rows(self, count):
+        """MySQL 5.7 没有 VALUES 表构造器，用 UNION ALL 拼出派生表"""
+        return " UNION ALL ".join(["SELECT %s AS location, %s AS category_id, %s AS storage"]
+                                  + ["SELECT %s, %s, %s"] * (count - 1))
+
+    @staticmethod
+    def create_database(config):
+        """连接MySQL服务器（不指定库）创建 config 中的数据库"""
+        conn = pymysql.connect(host=config["host"], user=config["user"],
+                               password=config["password"], charset="utf8mb4")
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute(f"CREATE DATABASE IF NOT EXISTS `{config['database']}` "
+                               "DEFAULT CHARACTER SET utf8mb4")
+        finally:
+            conn.close()
+
+    def create_schema(self):
+        self.create_database(DB_CONFIG)
+        super().create_schema()
+
+    def create_image_schema(self):
+        self.create_database(IMAGE_DB_CONFIG)
+        super().create_image_schema()
+
+    def _columns(self, cursor, table):
+        cursor.execute(f"SHOW COLUMNS FROM {table}")
+        return {row[0] for row in cursor.fetchall()}
+
+    def _indexes(self, cursor, table):
+        cursor.execute(f"SHOW INDEX FROM {table}")
+        return {row[2] for row in cursor.fetchall()}
+
+class SQLiteConnection(sqlite3.Connection):
+    """给 sqlite3 连接补上连接池健康检查用的 ping"""
+
+    def ping(self):
+        self.execute("SELECT 1")
+
+@lru_cache(maxsize=256)
+def qmark(query):
+    """把 %s 占位符换成 sqlite3 的 ?（结果缓存，同一语句每次得到同一字符串，命中语句缓存）"""
+    return query.replace("%s", "?")
+
+class SQLiteRepository(Repository):
+    """嵌入式SQLite实现，WAL模式"""
+    name = "sqlite"
+
+    SCHEMA = (
+        '''
+        CREATE TABLE IF NOT EXISTS trash_bin (
+            location CHAR(5) NOT NULL,
+            category_id INTEGER NOT NULL,
+            storage INTEGER DEFAULT 0,
+            PRIMARY KEY (location, category_id)
+        ) WITHOUT ROWID
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS trash_knowledge (
+            category INTEGER NOT NULL,
+            name CHAR(50) NOT NULL PRIMARY KEY
+        ) WITHOUT ROWID
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS trash_alias (
+            alias CHAR(50) NOT NULL PRIMARY KEY,
+            name CHAR(50) NOT NULL
+        ) WITHOUT ROWID
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS knowledge_version (
+            id INTEGER NOT NULL PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0
+        )
+        ''',
+    )
+
+    IMAGE_SCHEMA = (
+        '''
+        CREATE TABLE IF NOT EXISTS images (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            file_name VARCHAR(255) NOT NULL,
+            file_path VARCHAR(500) NOT NULL UNIQUE,
+            file_size BIGINT,
+            image_width INTEGER,
+            image_height INTEGER,
+            file_format VARCHAR(50),
+            created_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            content_hash CHAR(32)
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS image_blobs (
+            content_hash CHAR(32) NOT NULL PRIMARY KEY,
+            file_size BIGINT,
+            image_width INTEGER,
+            image_height INTEGER,
+            file_format VARCHAR(50),
+            blob_path VARCHAR(500) NOT NULL,
+            created_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        ) WITHOUT ROWID
+        ''',
+    )
+
+    UPSERT_STORAGE = ("INSERT INTO trash_bin (location, category_id, storage) VALUES {placeholders}"
+                      " ON CONFLICT(location, category_id) DO UPDATE SET storage = excluded.storage")
+    UPDATE_STORAGES = ("WITH v(location, category_id, storage) AS (VALUES {rows})"
+                       " UPDATE trash_bin SET storage = (SELECT v.storage FROM v"
+                       " WHERE v.location = trash_bin.location AND v.category_id = trash_bin.category_id)"
+                       " WHERE (location, category_id) IN (SELECT location, category_id FROM v)")
+    INSERT_BIN = "INSERT OR IGNORE INTO trash_bin (location, category_id) VALUES (%s, %s)"
+    BUMP_VERSION = ("INSERT INTO knowledge_version (id, version) VALUES (1, 1) "
+                    "ON CONFLICT(id) DO UPDATE SET version = version + 1")
+    INSERT_KNOWLEDGE = "INSERT OR IGNORE INTO trash_knowledge (name, category) VALUES (%s, %s)"
+    INSERT_ALIAS = "INSERT OR IGNORE INTO trash_alias (alias, name) VALUES (%s, %s)"
+    UPSERT_IMAGE = '''
+        INSERT INTO images (file_name, file_path, file_size, image_width, image_height, file_format, content_hash)
+        VALUES (%s, %s, %s, %s, %s, %s, %s)
+        ON CONFLICT(file_path) DO UPDATE SET
+            file_size = excluded.file_size,
+            image_width = excluded.image_width,
+            image_height = excluded.image_height,
+            file_format = excluded.file_format,
+            content_hash = excluded.content_hash
+    '''
+    INSERT_BLOB = '''
+        INSERT OR IGNORE INTO image_blobs (content_hash, file_size, image_width, image_height, file_format, blob_path)
+        VALUES (%s, %s, %s, %s, %s, %s)
+    '''
+
+    def __init__(self, path=SQLITE_PATH, pool_config=None):
+        self.path = path
+        config = dict(DB_POOL_CONFIG, **(pool_config or {}))
+        super().__init__(ConnectionPool(self._connect, name=f"sqlite:{os.path.basename(path)}", **config))
+
+    def _connect(self):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        # 连接由连接池在线程间借出，同一时间只有一个线程使用
+        conn = sqlite3.connect(self.path, timeout=SQLITE_BUSY_TIMEOUT, check_same_thread=False,
+                               cached_statements=256, factory=SQLiteConnection)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")    # WAL下只在检查点时fsync
+        return conn
+
+    def _sql(self, query):
+        return qmark(query)
+
+    def _columns(self, cursor, table):
+        cursor.execute(f"PRAGMA table_info({table})")
+        return {row[1] for row in cursor.fetchall()}
+
+    def _indexes(self, cursor, table):
+        cursor.execute(f"PRAGMA index_list({table})")
+        return {row[1] for row in cursor.fetchall()}
+
+_repository = None
+_repository_lock = threading.Lock()
+
+REPOSITORIES = {cls.name: cls for cls in (MySQLRepository, SQLiteRepository)}
+
+def get_repository():
+    """获取 config.DB_BACKEND 对应的全局数据访问对象"""
+    global _repository
+    with _repository_lock:
+        if _repository is None:
+            if DB_BACKEND not in REPOSITORIES:
+                raise ValueError(f"未知的数据库后端：{DB_BACKEND}，可选：{', '.join(REPOSITORIES)}")
+            _repository = REPOSITORIES[DB_BACKEND]()
+        return _repository
+
+def set_repository(repository):
+    """替换全局数据访问对象（压力测试等），需在服务器启动前调用"""
+    global _repository
+    with _repository_lock:
+        _repository = repository
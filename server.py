@@ -2,17 +2,19 @@
 import socket
 import threading
 import pymysql
-from config import DB_CONFIG, SERVER_HOST, SERVER_PORT
+from db_pool import get_pool, PoolTimeoutError
+from config import SERVER_HOST, SERVER_PORT, SERVER_BACKLOG
 
 def handle_client(client_socket, addr):
     """处理单个客户端连接"""
     print(f"\n🔌 客户端连接：{addr}")
     
-    # 连接MySQL数据库
+    # 从连接池取出MySQL连接
+    pool = get_pool()
     try:
-        conn = pymysql.connect(**DB_CONFIG)
+        conn = pool.acquire()
         cursor = conn.cursor()
-    except pymysql.Error as e:
+    except (pymysql.Error, PoolTimeoutError) as e:
         print(f"❌ 数据库连接失败：{e}")
         client_socket.send("数据库连接失败".encode("utf-8"))
         client_socket.close()
@@ -112,7 +114,7 @@ def handle_client(client_socket, addr):
         print(f"❌ 处理请求时出错：{e}")
     finally:
         cursor.close()
-        conn.close()
+        pool.release(conn)
         client_socket.close()
         print(f"🔌 客户端 {addr} 连接关闭")
 
@@ -131,7 +133,7 @@ def server_program():
     
     try:
         server_socket.bind((SERVER_HOST, SERVER_PORT))
-        server_socket.listen(5)
+        server_socket.listen(SERVER_BACKLOG)
         print(f"✅ 服务器已启动，等待客户端连接...")
         
         while True:
@@ -0,0 +1,208 @@
+# session.py - 垃圾桶与服务器之间的长连接会话
+# client2.py 原来每次投放都新建一个 TCP 连接，服务器处理完一轮就关闭，每次投放都要多付出一次握手。
+# 会话模式下垃圾桶保持一个分帧协议连接（见 protocol.py）：
+#   - 多次投放复用同一个连接，每次投放使用新的请求编号，回复由接收线程按编号交给等待的调用方
+#   - 空闲超过 HEARTBEAT_INTERVAL 秒时发送心跳帧 HBT，服务器原样回复；
+#     两个心跳周期内没有收到任何帧，认为连接已断开
+#     （服务器超过 SESSION_IDLE_TIMEOUT 秒没有收到任何帧时也会关闭连接）
+#   - 连接由心跳线程在后台建立，断开后重连，等待时间按指数退避并随机抖动（full jitter），
+#     服务器重启后大量垃圾桶不会同时重连
+# 连接断开时正在等待的请求以 ConnectionResetError 失败；服务器端第一轮的状态随连接丢失，需要重新投放。
+# 没有连接时发送请求最多等待 timeout 秒，仍未连上则以 ConnectionRefusedError 失败。
+# 服务器繁忙时请求以 ServerBusyError 失败；连接数已达上限时服务器回复 BSY 后关闭连接，
+# 重连前至少等待服务器建议的时间。
+import itertools
+import random
+import socket
+import threading
+import time
+from config import (SERVER_HOST, SERVER_PORT, HEARTBEAT_INTERVAL,
+                    RECONNECT_BACKOFF_BASE, RECONNECT_BACKOFF_MAX)
+from protocol import MAGIC, TAG_HEARTBEAT, TAG_ERROR, TAG_BUSY, ServerBusyError, send_frame, read_frame
+
+def backoff_delays(base=RECONNECT_BACKOFF_BASE, cap=RECONNECT_BACKOFF_MAX):
+    """重连等待时间：第 n 次失败后在 [0, min(cap, base * 2^n)] 中均匀随机"""
+    for attempt in itertools.count():
+        yield random.uniform(0, min(cap, base * 2 ** attempt))
+
+class BinSession:
+    """一个垃圾桶到服务器的长连接会话，可在多个线程中同时发送请求"""
+
+    def __init__(self, host=SERVER_HOST, port=SERVER_PORT, heartbeat_interval=HEARTBEAT_INTERVAL,
+                 connect_timeout=5):
+        self.host = host
+        self.port = port
+        self.heartbeat_interval = heartbeat_interval
+        self.connect_timeout = connect_timeout
+
+        self._sock = None
+        self._waiting = {}          # 请求编号 -> [事件, 回复帧]，连接断开时回复帧为None
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()           # 保护 _sock、_waiting、_ids
+        self._send_lock = threading.Lock()      # 一帧必须完整写出后才能写下一帧
+        self._connected = threading.Event()
+        self._last_sent = 0.0
+        self._last_received = 0.0
+        self._busy_until = 0.0                  # 服务器拒绝连接后，在此之前不重连
+        self._closed = False
+        self._stats = {"connects": 0, "failures": 0, "heartbeats": 0, "requests": 0}
+        self._stats_lock = threading.Lock()     # 多个请求线程和心跳线程都会计数
+
+        self._heartbeat_thread = threading.Thread(target=self._heartbeat_loop, name="session-heartbeat",
+                                                  daemon=True)
+        self._heartbeat_thread.start()
+
+    @property
+    def connected(self):
+        return self._sock is not None
+
+    def next_id(self):
+        """新的请求编号（一次投放的 REQ 和 INR 使用同一个编号，0 留给心跳）"""
+        with self._lock:
+            request_id = next(self._ids) % 2 ** 32
+            if request_id == 0:
+                request_id = next(self._ids) % 2 ** 32
+            return request_id
+
+    def _connect(self):
+        """（心跳线程）连接服务器，失败时按退避时间重试，直到成功或会话关闭"""
+        delays = backoff_delays()
+        while not self._closed:
+            busy_wait = self._busy_until - time.monotonic()
+            if busy_wait > 0:
+                time.sleep(busy_wait)
+            try:
+                sock = socket.create_connection((self.host, self.port), timeout=self.connect_timeout)
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                sock.sendall(MAGIC)  # 协议标识
+                sock.settimeout(None)
+            except OSError as e:
+                self._count("failures")
+                delay = next(delays)
+                print(f"⚠️  连接服务器失败：{e}，{delay:.1f} 秒后重试")
+                time.sleep(delay)
+                continue
+
+            self._last_sent = self._last_received = time.monotonic()
+            with self._lock:
+                self._sock = sock
+            self._count("connects")
+            threading.Thread(target=self._receive_loop, args=(sock,), name="session-receiver",
+                             daemon=True).start()
+            self._connected.set()
+            print(f"✅ 已建立会话：{self.host}:{self.port}")
+            return
+
+    def request(self, tag, request_id, payload, timeout=30):
+        """发送一帧并等待同一编号的回复，返回回复内容（文本）"""
+        if not self._connected.wait(timeout):
+            raise ConnectionRefusedError("无法连接服务器")
+
+        event = threading.Event()
+        waiter = [event, None]
+        with self._lock:
+            sock = self._sock
+            if sock is None:
+                raise ConnectionResetError("连接已断开")
+            self._waiting[request_id] = waiter
+        try:
+            self._send(sock, tag, request_id, payload)
+        except OSError:
+            self._disconnect(sock)
+            raise ConnectionResetError("发送失败，连接已断开")
+        self._count("requests")
+
+        if not event.wait(timeout):
+            with self._lock:
+                self._waiting.pop(request_id, None)
+            raise socket.timeout("等待回复超时")
+        frame = waiter[1]
+        if frame is None:
+            raise ConnectionResetError("连接已断开")
+        reply_tag, _, reply = frame
+        if reply_tag == TAG_ERROR:
+            raise RuntimeError(f"服务器错误：{reply.decode('utf-8')}")
+        if reply_tag == TAG_BUSY:
+            raise ServerBusyError(int(reply))
+        return reply.decode("utf-8")
+
+    def _send(self, sock, tag, request_id, payload=b""):
+        with self._send_lock:
+            send_frame(sock, tag, request_id, payload)
+        self._last_sent = time.monotonic()
+
+    def _receive_loop(self, sock):
+        """接收线程：按请求编号把回复交给等待的调用方"""
+        try:
+            while True:
+                frame = read_frame(sock)
+                if frame is None:
+                    break   # 服务器关闭了连接
+                self._last_received = time.monotonic()
+                tag, request_id, payload = frame
+                if tag == TAG_HEARTBEAT:
+                    continue
+                if tag == TAG_BUSY and request_id == 0:
+                    # 连接数已达上限，服务器随后关闭连接
+                    self._busy_until = time.monotonic() + int(payload) / 1000
+                    print(f"⚠️  服务器繁忙，{int(payload)}ms 后重连")
+                    continue
+                with self._lock:
+                    waiter = self._waiting.pop(request_id, None)
+                if waiter is not None:
+                    waiter[1] = frame
+                    waiter[0].set()
+        except OSError:
+            pass
+        self._disconnect(sock)
+
+    def _disconnect(self, sock):
+        """关闭一个连接，让正在等待它的请求失败"""
+        with self._lock:
+            if self._sock is not sock:
+                return  # 已经处理过
+            self._sock = None
+            self._connected.clear()
+            waiting, self._waiting = self._waiting, {}
+        try:
+            sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        sock.close()
+        for event, _ in waiting.values():
+            event.set()
+        if not self._closed:
+            print("⚠️  与服务器的会话已断开，将在后台重连")
+
+    def _heartbeat_loop(self):
+        while not self._closed:
+            sock = self._sock
+            if sock is None:
+                self._connect()
+                continue
+            time.sleep(min(1.0, self.heartbeat_interval / 3))
+
+            now = time.monotonic()
+            if now - self._last_received > 2 * self.heartbeat_interval:
+                print("⚠️  心跳超时")
+                self._disconnect(sock)
+            elif now - self._last_sent >= self.heartbeat_interval:
+                try:
+                    self._send(sock, TAG_HEARTBEAT, 0)
+                    self._count("heartbeats")
+                except OSError:
+                    self._disconnect(sock)
+
+    def _count(self, name):
+        with self._stats_lock:
+            self._stats[name] += 1
+
+    def stats(self):
+        with self._stats_lock:
+            return dict(self._stats)
+
+    def close(self):
+        self._closed = True
+        sock = self._sock
+        if sock is not None:
+            self._disconnect(sock)
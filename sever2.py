@@ -1,105 +1,484 @@
 # server.py - 服务器端程序
+import queue
 import socket
 import threading
-import pymysql
-from config import DB_CONFIG, SERVER_HOST, SERVER_PORT
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from repository import get_repository, DB_ERRORS
+from knowledge_cache import get_knowledge_cache
+from classifier import get_classifier, get_fill_estimator, console_lock
+from storage_writer import get_storage_writer
+from dashboard import start_dashboard, stop_dashboard
+from metrics import get_metrics, phase
+from admission import admitted, check_rate, AdmissionTimeoutError, REJECT_WAIT
+from protocol import (detect_framed, detect_transport, read_header, recv_exact, check_length,
+                      send_frame, FrameError, TAG_REQUEST, TAG_CATEGORY, TAG_INNER,
+                      TAG_STORAGE, TAG_ERROR, TAG_IMAGE, TAG_HEARTBEAT, TAG_DISPOSE, TAG_RESULT,
+                      TAG_BUSY, ServerBusyError)
+from image_receiver import receive_image, discard_images, ImageTooLargeError
+from config import (SERVER_HOST, SERVER_PORT, SERVER_BACKLOG, CLIENT_TIMEOUT, SESSION_IDLE_TIMEOUT,
+                    DASHBOARD_PORT, MAX_THREAD_CONNECTIONS, SERVER_WORKERS, SERVER_QUEUE_DEPTH,
+                    BUSY_RETRY_AFTER_MS)
+
+# 允许的图片格式（上传的图片按文件头保存为 .jpg 或 .png）
+IMAGE_SUFFIXES = ('.jpg', '.jpeg', '.png')
+
+# 合并请求中与识别同时分析内部图片的线程
+analysis_executor = ThreadPoolExecutor(thread_name_prefix="inner-analysis")
+
+# 请求耗时按请求类型分别统计（旧协议的两轮分别记为 category 和 storage）
+REQUEST_TYPES = {TAG_REQUEST: "category", TAG_INNER: "storage", TAG_DISPOSE: "dispose"}
+
+# 当前保持的连接数（每个连接一个线程）
+active_connections = 0
+connections_lock = threading.Lock()
+
+# 超过连接上限的连接交给一个线程回复繁忙后关闭，排不上的直接关闭
+rejected_connections = queue.Queue(maxsize=SERVER_QUEUE_DEPTH)
+
+
+def parse_request(request_data):
+    """解析第一轮请求（外部图片路径|站点编号），格式错误返回None"""
+    if "|" not in request_data:
+        print("❌ 请求格式错误，应为：外部图片路径|站点编号")
+        return None
+
+    outer_path, location = request_data.split("|", 1)
+    print(f"📦 解析结果：外部图片={outer_path}, 站点={location}")
+
+    # 验证站点编号格式
+    if not (len(location) == 5 and location.isalpha()):
+        print(f"❌ 站点编号格式错误：{location}")
+        return None
+
+    # 验证外部图片格式
+    if not outer_path.lower().endswith(IMAGE_SUFFIXES):
+        print(f"❌ 外部图片格式错误：{outer_path}")
+        return None
+
+    return outer_path, location
+
+def parse_dispose(request_data, uploaded=()):
+    """解析合并请求（外部图片路径|内部图片路径|站点编号），格式错误返回None
+    uploaded 为本请求已上传的图片（依次为外部、内部），代替请求中的路径"""
+    if request_data.count("|") != 2:
+        print("❌ 请求格式错误，应为：外部图片路径|内部图片路径|站点编号")
+        return None
+
+    outer_path, inner_path, location = request_data.split("|")
+    if len(uploaded) > 0:
+        outer_path = uploaded[0]
+    if len(uploaded) > 1:
+        inner_path = uploaded[1]
+    elif not inner_path.endswith('.jpg'):
+        print(f"❌ 内部图片格式错误：{inner_path}")
+        return None
+
+    parsed = parse_request(f"{outer_path}|{location}")
+    if parsed is None:
+        return None
+    return parsed[0], inner_path, parsed[1]
+
+def query_category(trash_name):
+    """查询垃圾类别编号（内存缓存，支持别名和模糊匹配），未找到返回None"""
+    with phase("knowledge_lookup"):
+        match = get_knowledge_cache().match(trash_name)
+
+    if match is not None:
+        cate_code = str(match.category)
+        if match.name == trash_name.strip():
+            print(f"✅ 查询结果：{trash_name} -> 类别{cate_code}")
+        else:
+            print(f"✅ 查询结果：{trash_name} ≈ {match.name} -> 类别{cate_code}（置信度 {match.confidence:.2f}）")
+        return cate_code
+
+    print(f"❌ 未找到垃圾信息：{trash_name}")
+    print(f"  提示：请先在数据库中添加该垃圾")
+    return None
+
+def check_inner_path(inner_path, location, cate_code):
+    """解析内部图片名称（位置_类别），只给出警告，不中断处理"""
+    try:
+        filename = inner_path.split("/")[-1] if "/" in inner_path else inner_path
+        basename = filename.split(".")[0]
+
+        # 期望格式：位置_类别
+        if "_" not in basename:
+            raise ValueError("内部图片名称格式错误")
+
+        inner_location, inner_cate_id = basename.split("_", 1)
+
+        # 验证内部图片中的位置是否与外部一致
+        if inner_location != location:
+            print(f"⚠️  警告：内部图片位置({inner_location})与外部位置({location})不一致")
+
+        # 验证类别是否匹配
+        if inner_cate_id != cate_code:
+            print(f"⚠️  警告：内部图片类别({inner_cate_id})与识别类别({cate_code})不一致")
+
+        # 这里不验证类别范围，因为内部图片可能对应1-5的任何类别
+
+    except Exception as e:
+        print(f"⚠️  内部图片名称解析警告：{e}")
+        # 继续处理，不中断
+
+def query_storage(location, cate_code):
+    """查询垃圾桶当前存储情况，不存在时返回0"""
+    # 还在写入缓冲区中的值比数据库中的新
+    with phase("storage_read"):
+        pending = get_storage_writer().pending_value(location, cate_code)
+        current_storage = get_repository().get_storage(location, cate_code) if pending is None else None
+    if pending is not None:
+        print(f"当前存储情况：{pending}%")
+        return pending
+
+    if current_storage is not None:
+        print(f"当前存储情况：{current_storage}%")
+        return current_storage
+
+    print("⚠️  警告：数据库中不存在该垃圾桶")
+    print(f"  位置={location}, 类别={cate_code}")
+    return 0
+
+def classify_outer(outer_path):
+    """第一轮：识别外部垃圾图片并查询类别编号，无法识别返回None"""
+    print(f"🖼️  待识别图片：{outer_path}")
+
+    # 识别外部垃圾图片（后端见 classifier.py）
+    get_metrics().inc("classifications")
+    with phase("classify"):
+        trash_name = get_classifier().classify(outer_path)
+    if trash_name is None:
+        print("❌ 无法识别垃圾")
+        get_metrics().inc("unrecognized")
+        return None
+
+    # 查询垃圾类别编号
+    cate_code = query_category(trash_name)
+    if cate_code is None:
+        get_metrics().inc("unrecognized")
+    return cate_code
+
+def analyze_storage(location, cate_code, inner_path=None, observation=None):
+    """第二轮：分析垃圾桶存储情况并更新数据库，返回新的存储百分比
+    observation 为已经算好的内部图片分析结果（见 FillEstimator.analyze）"""
+    # 数据库连接只在查询/更新时从连接池取出，等待人工输入期间不占用连接
+    estimator = get_fill_estimator()
+
+    # 人工输入时独占控制台，自动估计时不需要加锁
+    with console_lock if estimator.interactive else nullcontext():
+        print("\n" + "=" * 30)
+        print("第二步：垃圾桶存储情况分析")
+        print("=" * 30)
+        print(f"当前处理的垃圾桶：位置={location}, 类别={cate_code}")
+
+        # 先查询当前存储情况
+        current_storage = query_storage(location, cate_code)
+
+        # 估计新的存储情况（后端见 classifier.py）
+        new_storage = estimator.estimate(location, cate_code, current_storage, inner_path, observation)
+
+    # 更新数据库存储情况（立即写入或批量写入，见 storage_writer.py）
+    with phase("storage_write"):
+        get_storage_writer().write(location, cate_code, new_storage)
+    get_metrics().inc("storage_updates")
+
+    return new_storage
+
+def observe_request(tag, start):
+    """记录一个请求从 start（time.perf_counter()）到得出回复的耗时"""
+    get_metrics().observe("request_seconds", time.perf_counter() - start, type=REQUEST_TYPES.get(tag, "other"))
+
+def classify_admitted(outer_path, location):
+    """新的投放：站点未超过限流、取得处理名额后识别外部图片，过载时抛出 ServerBusyError"""
+    check_rate(location)
+    with admitted():
+        return classify_outer(outer_path)
+
+def analyze_admitted(location, cate_code, inner_path=None):
+    """已经开始的投放的第二轮：等到处理名额后分析存储（不会被拒绝）"""
+    with admitted(required=True):
+        return analyze_storage(location, cate_code, inner_path)
+
+def dispose(outer_path, inner_path, location, check_inner=True):
+    """合并请求：识别外部图片并分析垃圾桶存储，返回 (类别编号, 新的存储百分比)，无法识别时返回 (None, None)
+    内部图片的分析不依赖识别结果，自动估计时与识别同时进行；人工输入时仍按先识别、后输入存储的顺序"""
+    estimator = get_fill_estimator()
+    analysis = None
+    if not estimator.interactive:
+        analysis = analysis_executor.submit(estimator.analyze, inner_path)
+
+    cate_code = classify_outer(outer_path)
+    observation = analysis.result() if analysis is not None else None
+    if cate_code is None:
+        return None, None
+
+    if check_inner:
+        check_inner_path(inner_path, location, cate_code)
+    return cate_code, analyze_storage(location, cate_code, inner_path, observation)
+
+def handle_frame(tag, request_id, payload, pending, uploads):
+    """处理分帧协议中的一个请求帧，返回 (回复类型, 回复内容)
+    pending 记录本连接上已完成第一轮、等待内部图片的请求：请求编号 -> (站点编号, 类别)
+    uploads 记录本连接上已通过 IMG 帧上传、尚未使用的图片：请求编号 -> [暂存路径]（按上传顺序）
+    请求用到的暂存图片在处理完（包括出错、繁忙）后删除"""
+    used = []
+    try:
+        return _handle_frame(tag, request_id, payload, pending, uploads, used)
+    finally:
+        discard_images(used)
+
+def _handle_frame(tag, request_id, payload, pending, uploads, used):
+    """handle_frame 的处理部分，从 uploads 取出的暂存图片记入 used"""
+    text = payload.decode("utf-8").strip()
+
+    if tag == TAG_REQUEST:
+        print(f"📩 收到请求[{request_id}]：{text}")
+        if request_id in uploads and "|" in text:
+            # 已上传外部图片，使用暂存文件代替请求中的路径
+            used.extend(uploads.pop(request_id))
+            text = used[0] + "|" + text.split("|", 1)[1]
+        parsed = parse_request(text)
+        if parsed is None:
+            return TAG_CATEGORY, "5"  # 发送错误代码
+
+        outer_path, location = parsed
+        cate_code = classify_admitted(outer_path, location)
+        if cate_code is None:
+            return TAG_CATEGORY, "5"  # 回复5
+
+        pending[request_id] = (location, cate_code)
+        return TAG_CATEGORY, cate_code
+
+    if tag == TAG_INNER:
+        print(f"📩 收到内部图片[{request_id}]：{text}")
+        if request_id not in pending:
+            return TAG_ERROR, f"未知的请求编号：{request_id}"
+
+        location, cate_code = pending.pop(request_id)
+        inner_path = text
+        if request_id in uploads:
+            # 已上传内部图片，使用暂存文件（文件名不含位置_类别信息，不再检查）
+            used.extend(uploads.pop(request_id))
+            inner_path = used[-1]
+            print(f"🖼️  内部图片：{inner_path}")
+        elif not inner_path.endswith('.jpg'):
+            print(f"❌ 内部图片格式错误：{inner_path}")
+            return TAG_STORAGE, "0"  # 发送默认存储
+        else:
+            check_inner_path(inner_path, location, cate_code)
+        new_storage = analyze_admitted(location, cate_code, inner_path)
+        return TAG_STORAGE, f"{new_storage}"
+
+    if tag == TAG_DISPOSE:
+        print(f"📩 收到合并请求[{request_id}]：{text}")
+        uploaded = uploads.pop(request_id, [])
+        used.extend(uploaded)
+        parsed = parse_dispose(text, uploaded)
+        if parsed is None:
+            return TAG_RESULT, "5|"
+
+        outer_path, inner_path, location = parsed
+        check_rate(location)
+        with admitted():
+            # 上传的内部图片文件名不含位置_类别信息，不再检查
+            cate_code, new_storage = dispose(outer_path, inner_path, location, check_inner=len(uploaded) < 2)
+        if cate_code is None:
+            return TAG_RESULT, "5|"
+        return TAG_RESULT, f"{cate_code}|{new_storage}"
+
+    return TAG_ERROR, f"未知的帧类型：{tag!r}"
+
+def handle_framed_client(client_socket, addr, max_inflight=SERVER_WORKERS):
+    """分帧协议：一个连接上连续处理多个请求，请求帧交给本连接的工作线程并发处理，按请求编号回复。
+    同时处理的请求不超过 max_inflight 个，达到上限时暂停读取，直到有请求处理完（由 TCP 流量控制让客户端等待）"""
+    print(f"🧩 客户端 {addr} 使用分帧协议")
+    pending = {}
+    uploads = {}
+    send_lock = threading.Lock()
+    inflight = threading.BoundedSemaphore(max_inflight)
+    executor = ThreadPoolExecutor(max_workers=max_inflight, thread_name_prefix="frame")
+
+    def process(tag, request_id, payload):
+        try:
+            reply(tag, request_id, payload)
+        finally:
+            inflight.release()
+
+    def reply(tag, request_id, payload):
+        start = time.perf_counter()
+        try:
+            reply_tag, reply = handle_frame(tag, request_id, payload, pending, uploads)
+        except ServerBusyError as e:
+            reply_tag, reply = TAG_BUSY, f"{e.retry_after_ms}"
+        except DB_ERRORS as e:
+            print(f"❌ 数据库连接失败：{e}")
+            reply_tag, reply = TAG_ERROR, "数据库连接失败"
+            get_metrics().inc("errors")
+        except Exception as e:
+            print(f"❌ 处理请求[{request_id}]时出错：{e}")
+            reply_tag, reply = TAG_ERROR, f"{e}"
+            get_metrics().inc("errors")
+        observe_request(tag, start)
+
+        try:
+            with phase("send"), send_lock:
+                send_frame(client_socket, reply_tag, request_id, reply)
+            print(f"📤 已回复[{request_id}]：{reply_tag.decode()} {reply}")
+        except OSError as e:
+            print(f"❌ 回复[{request_id}]失败：{e}")
+
+    try:
+        while True:
+            # 会话在两次投放之间可能空闲很久，心跳会刷新这个超时
+            client_socket.settimeout(SESSION_IDLE_TIMEOUT)
+            header = read_header(client_socket)
+            if header is None:
+                break  # 客户端正常关闭连接
+            client_socket.settimeout(CLIENT_TIMEOUT)
+
+            tag, request_id, length = header
+            if tag == TAG_HEARTBEAT:
+                # 心跳直接回复，不占用处理线程
+                check_length(tag, length)
+                recv_exact(client_socket, length)
+                with send_lock:
+                    send_frame(client_socket, TAG_HEARTBEAT, request_id)
+                continue
+
+            if tag == TAG_IMAGE:
+                # 图片边收边写入暂存目录，收完后才读取下一帧，保证先于对应的请求帧就绪
+                # 已完成第一轮或已上传过一张图片的请求，这一张是内部图片
+                inner = request_id in pending or request_id in uploads
+                try:
+                    with phase("recv_inner" if inner else "recv_outer"):
+                        uploads.setdefault(request_id, []).append(receive_image(client_socket, length))
+                except (ImageTooLargeError, ValueError) as e:
+                    # 剩余数据无法跳过，回复错误后关闭连接
+                    print(f"❌ 拒绝图片[{request_id}]：{e}")
+                    with send_lock:
+                        send_frame(client_socket, TAG_ERROR, request_id, f"{e}")
+                    break
+                continue
+
+            check_length(tag, length)
+            payload = recv_exact(client_socket, length)
+            inflight.acquire()
+            executor.submit(process, tag, request_id, payload)
+    except FrameError as e:
+        print(f"❌ 帧格式错误：{e}")
+    finally:
+        # 等待已收到的请求处理完再关闭连接
+        executor.shutdown(wait=True)
+        # 上传后没有被请求用到的暂存图片
+        for paths in uploads.values():
+            discard_images(paths)
+
+def handle_transport_client(client_socket, addr):
+    """兼容 transport.py：STR(4字节长度)/IMG(8字节长度) 帧，没有请求编号，也不回复。
+    STR 为5位字母时作为站点编号；IMG 图片接收后交给识别步骤"""
+    print(f"📷 客户端 {addr} 使用 transport 格式上传")
+    location = None
+
+    while True:
+        tag = client_socket.recv(3)
+        if not tag:
+            break  # 客户端正常关闭连接
+        if len(tag) < 3:
+            tag += recv_exact(client_socket, 3 - len(tag))
+
+        if tag == b"STR":
+            length = int.from_bytes(recv_exact(client_socket, 4), byteorder="big")
+            check_length(tag, length)
+            text = recv_exact(client_socket, length).decode("utf-8").strip()
+            print(f"📩 收到字符串：{text}")
+            if len(text) == 5 and text.isalpha():
+                location = text.upper()
+                print(f"📍 站点编号：{location}")
+
+        elif tag == b"IMG":
+            size = int.from_bytes(recv_exact(client_socket, 8), byteorder="big")
+            try:
+                path = receive_image(client_socket, size)
+            except (ImageTooLargeError, ValueError) as e:
+                print(f"❌ 拒绝图片：{e}")
+                break  # 剩余数据无法跳过，关闭连接
+            try:
+                cate_code = classify_outer(path)
+            finally:
+                discard_images([path])
+            print(f"🗑️  识别结果：站点={location or '未知'}，图片={path}，类别={cate_code or '5'}")
+
+        else:
+            raise FrameError(f"未知的数据类型：{tag!r}")
 
 def handle_client(client_socket, addr):
     """处理单个客户端连接"""
     print(f"\n🔌 客户端连接：{addr}")
-    
-    # 连接MySQL数据库
-    try:
-        conn = pymysql.connect(**DB_CONFIG)
-        cursor = conn.cursor()
-    except pymysql.Error as e:
-        print(f"❌ 数据库连接失败：{e}")
-        try:
-            client_socket.send("数据库连接失败".encode("utf-8"))
-        except:
-            pass
-        client_socket.close()
-        return
+    get_metrics().inc("connections")
+    connected = time.perf_counter()
 
     try:
         # 设置接收超时
-        client_socket.settimeout(60)  # 设置60秒超时
-        
+        client_socket.settimeout(CLIENT_TIMEOUT)
+
+        # 新客户端先发送协议标识，使用分帧协议
+        if detect_framed(client_socket):
+            handle_framed_client(client_socket, addr)
+            return
+
+        # transport.py 直接发送 STR/IMG 数据
+        if detect_transport(client_socket):
+            handle_transport_client(client_socket, addr)
+            return
+
         # 第一步：接收客户端发送的外部图片路径和站点编号
         # 格式：外部图片路径|站点编号
         request_data = client_socket.recv(1024).decode("utf-8").strip()
         print(f"📩 收到请求：{request_data}")
-        
+        start = time.perf_counter()
+        get_metrics().observe("phase_seconds", start - connected, phase="recv_outer")
+
         # 解析请求数据
-        if "|" not in request_data:
-            print("❌ 请求格式错误，应为：外部图片路径|站点编号")
-            try:
-                client_socket.send("5".encode("utf-8"))  # 发送错误代码
-            except:
-                pass
-            return
-        
-        outer_path, location = request_data.split("|", 1)
-        print(f"📦 解析结果：外部图片={outer_path}, 站点={location}")
-        
-        # 验证站点编号格式
-        if not (len(location) == 5 and location.isalpha()):
-            print(f"❌ 站点编号格式错误：{location}")
+        parsed = parse_request(request_data)
+        if parsed is None:
             try:
                 client_socket.send("5".encode("utf-8"))  # 发送错误代码
             except:
                 pass
             return
-        
-        # 验证外部图片格式
-        if not outer_path.endswith('.jpg'):
-            print(f"❌ 外部图片格式错误：{outer_path}")
+
+        outer_path, location = parsed
+
+        # 识别外部垃圾图片，查询垃圾类别编号（旧协议没有繁忙回复，过载时也回复5）
+        try:
+            cate_code = classify_admitted(outer_path, location)
+        except ServerBusyError:
+            cate_code = None
+        observe_request(TAG_REQUEST, start)
+
+        if cate_code is None:
             try:
-                client_socket.send("5".encode("utf-8"))  # 发送错误代码
+                client_socket.send("5".encode("utf-8"))  # 回复5
             except:
                 pass
             return
-        
-        # 模拟AI解析外部垃圾图片（人工输入）
-        print("\n" + "=" * 30)
-        print("第一步：AI垃圾识别模拟")
-        print("=" * 30)
-        
-        while True:
-            trash_name = input("> 请输入识别的垃圾名称（如：矿泉水瓶）: ").strip()
-            if trash_name:
-                break
-            print("❌ 垃圾名称不能为空！")
-        
-        # 查询垃圾类别编号
-        cursor.execute(
-            "SELECT category FROM trash_knowledge WHERE name = %s",
-            (trash_name,)
-        )
-        result = cursor.fetchone()
-        
-        if result:
-            cate_code = str(result[0])
-            print(f"✅ 查询结果：{trash_name} -> 类别{cate_code}")
-            try:
+
+        try:
+            with phase("send"):
                 client_socket.send(cate_code.encode("utf-8"))  # 回复类别编号
-            except Exception as e:
-                print(f"❌ 发送类别失败：{e}")
-                return
-        else:
-            print(f"❌ 未找到垃圾信息：{trash_name}")
-            print(f"  提示：请先在数据库中添加该垃圾")
-            try:
-                client_socket.send("5".encode("utf-8"))  # 回复5
-            except:
-                pass
+        except Exception as e:
+            print(f"❌ 发送类别失败：{e}")
             return
-        
+
         # 第二步：接收内部垃圾桶图片路径
         try:
-            inner_path = client_socket.recv(1024).decode("utf-8").strip()
+            with phase("recv_inner"):
+                inner_path = client_socket.recv(1024).decode("utf-8").strip()
             print(f"📩 收到内部图片：{inner_path}")
-            
+            start = time.perf_counter()
+
             # 验证内部图片格式
             if not inner_path.endswith('.jpg'):
                 print(f"❌ 内部图片格式错误：{inner_path}")
@@ -108,109 +487,85 @@ def handle_client(client_socket, addr):
                 except:
                     pass
                 return
-            
+
             # 解析内部图片名称，获取垃圾桶类别
-            try:
-                filename = inner_path.split("/")[-1] if "/" in inner_path else inner_path
-                basename = filename.split(".")[0]
-                
-                # 期望格式：位置_类别
-                if "_" not in basename:
-                    raise ValueError("内部图片名称格式错误")
-                    
-                inner_location, inner_cate_id = basename.split("_", 1)
-                
-                # 验证内部图片中的位置是否与外部一致
-                if inner_location != location:
-                    print(f"⚠️  警告：内部图片位置({inner_location})与外部位置({location})不一致")
-                
-                # 验证类别是否匹配
-                if inner_cate_id != cate_code:
-                    print(f"⚠️  警告：内部图片类别({inner_cate_id})与识别类别({cate_code})不一致")
-                    
-                # 这里不验证类别范围，因为内部图片可能对应1-5的任何类别
-                    
-            except Exception as e:
-                print(f"⚠️  内部图片名称解析警告：{e}")
-                # 继续处理，不中断
-            
-            # 模拟AI解析内部图片（人工输入存储情况）
-            print("\n" + "=" * 30)
-            print("第二步：垃圾桶存储情况分析")
-            print("=" * 30)
-            print(f"当前处理的垃圾桶：位置={location}, 类别={cate_code}")
-            
-            # 先查询当前存储情况
-            cursor.execute(
-                "SELECT storage FROM trash_bin WHERE location = %s AND category_id = %s",
-                (location.upper(), cate_code)
-            )
-            current_storage_result = cursor.fetchone()
-            
-            if current_storage_result:
-                current_storage = current_storage_result[0]
-                print(f"当前存储情况：{current_storage}%")
-            else:
-                print("⚠️  警告：数据库中不存在该垃圾桶")
-                print(f"  位置={location}, 类别={cate_code}")
-                current_storage = 0
-            
-            # 人工输入存储情况
-            while True:
-                storage_input = input(f"> 请输入更新后的存储百分比（0-100，当前：{current_storage}%）: ").strip()
-                if storage_input.isdigit() and 0 <= int(storage_input) <= 100:
-                    new_storage = int(storage_input)
-                    break
-                print("❌ 请输入0-100的数字！")
-            
-            # 更新数据库存储情况
-            try:
-                cursor.execute(
-                    "UPDATE trash_bin SET storage = %s WHERE location = %s AND category_id = %s",
-                    (new_storage, location.upper(), cate_code)
-                )
-                conn.commit()
-                
-                if cursor.rowcount == 0:
-                    print(f"❌ 未找到垃圾桶：{location}_{cate_code}")
-                    print("  注意：数据库更新失败，但继续发送存储情况给客户端")
-                else:
-                    print(f"✅ 已更新垃圾桶 {location}_{cate_code} 存储为 {new_storage}%")
-                    
-            except pymysql.Error as e:
-                conn.rollback()
-                print(f"❌ 数据库更新失败：{e}")
-                print("  注意：数据库更新失败，但继续发送存储情况给客户端")
-            
+            check_inner_path(inner_path, location, cate_code)
+
+            # 分析存储情况并更新数据库
+            new_storage = analyze_admitted(location, cate_code, inner_path)
+            observe_request(TAG_INNER, start)
+
             # 发送存储情况给客户端
             try:
-                client_socket.send(f"{new_storage}".encode("utf-8"))
+                with phase("send"):
+                    client_socket.send(f"{new_storage}".encode("utf-8"))
                 print(f"📤 已发送存储情况：{new_storage}%")
             except Exception as e:
                 print(f"❌ 发送存储情况失败：{e}")
-                
+
         except socket.timeout:
             print(f"❌ 接收内部图片超时")
         except ConnectionResetError:
             print(f"❌ 客户端 {addr} 连接断开")
+        except AdmissionTimeoutError as e:
+            # 旧协议没有错误回复，与数据库连接失败一样回复5
+            print(f"❌ 分析存储失败：{e}")
+            get_metrics().inc("errors")
+            try:
+                client_socket.send("5".encode("utf-8"))
+            except:
+                pass
 
     except socket.timeout:
         print(f"❌ 接收请求超时")
     except ConnectionResetError:
         print(f"❌ 客户端 {addr} 连接断开")
+    except DB_ERRORS as e:
+        print(f"❌ 数据库连接失败：{e}")
+        get_metrics().inc("errors")
+        try:
+            client_socket.send("5".encode("utf-8"))  # 回复5
+        except:
+            pass
     except Exception as e:
         print(f"❌ 处理请求时出错：{e}")
+        get_metrics().inc("errors")
     finally:
         try:
-            cursor.close()
-            conn.close()
             client_socket.close()
         except:
             pass
         print(f"🔌 客户端 {addr} 连接关闭")
 
-def server_program():
-    """服务器主程序"""
+def serve_client(client_socket, addr):
+    """连接线程入口"""
+    global active_connections
+    try:
+        handle_client(client_socket, addr)
+    finally:
+        with connections_lock:
+            active_connections -= 1
+
+def reject_client(client_socket, addr):
+    """连接数已达上限：分帧协议回复 BSY（请求编号0），旧协议回复5，然后关闭"""
+    try:
+        client_socket.settimeout(REJECT_WAIT)
+        if detect_framed(client_socket, wait=REJECT_WAIT):
+            send_frame(client_socket, TAG_BUSY, 0, f"{BUSY_RETRY_AFTER_MS}")
+        else:
+            client_socket.send("5".encode("utf-8"))
+    except OSError:
+        pass
+    finally:
+        client_socket.close()
+
+def reject_loop():
+    while True:
+        reject_client(*rejected_connections.get())
+
+def server_program(server_socket=None, dashboard_port=DASHBOARD_PORT):
+    """服务器主程序
+    预派生模式（见 prefork.py）下由工作进程传入已监听的套接字，看板只在主进程运行（dashboard_port 为None）"""
     print("=" * 50)
     print("智能垃圾桶服务器")
     print("=" * 50)
@@ -219,20 +574,58 @@ def server_program():
     print("-" * 50)
 
     # 创建TCP服务端
-    server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-    
+    listening = server_socket is not None
+    if not listening:
+        server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    dashboard = None
+
     try:
-        server_socket.bind((SERVER_HOST, SERVER_PORT))
-        server_socket.listen(5)
+        if not listening:
+            server_socket.bind((SERVER_HOST, SERVER_PORT))
+            server_socket.listen(SERVER_BACKLOG)
         print(f"✅ 服务器已启动，等待客户端连接...")
-        
+        print(f"🤖 识别后端：{get_classifier().name}，存储估计后端：{get_fill_estimator().name}，"
+              f"写入模式：{get_storage_writer().mode}")
+
+        # 预先建立常驻数据库连接，并定期回收多余的空闲连接
+        repository = get_repository()
+        print(f"🗄️  数据库后端：{repository.name}")
+        repository.warm_up()
+        repository.start_reaper()
+
+        # 启动时加载垃圾知识缓存，分类查询不再访问数据库
+        try:
+            get_knowledge_cache().load()
+        except DB_ERRORS as e:
+            print(f"⚠️  垃圾知识缓存加载失败，将在首次查询时重试：{e}")
+
+        # 存储情况看板（只读 HTTP/JSON，数据来自内存汇总）
+        dashboard = start_dashboard(repository, port=dashboard_port)
+        threading.Thread(target=reject_loop, name="reject", daemon=True).start()
+
+        global active_connections
         while True:
             try:
                 client_socket, addr = server_socket.accept()
+
+                # 超过连接上限时不再创建线程
+                with connections_lock:
+                    accepted = active_connections < MAX_THREAD_CONNECTIONS
+                    if accepted:
+                        active_connections += 1
+                if not accepted:
+                    print(f"⚠️  连接数已达上限({MAX_THREAD_CONNECTIONS})，拒绝客户端：{addr}")
+                    get_metrics().inc("rejected_connections")
+                    try:
+                        rejected_connections.put_nowait((client_socket, addr))
+                    except queue.Full:
+                        client_socket.close()
+                    continue
+
                 # 启动新线程处理客户端
                 client_thread = threading.Thread(
-                    target=handle_client, 
+                    target=serve_client,
                     args=(client_socket, addr),
                     daemon=True
                 )
@@ -240,14 +633,20 @@ def server_program():
             except Exception as e:
                 print(f"❌ 接受连接失败：{e}")
                 continue
-            
+
     except KeyboardInterrupt:
         print("\n\n🛑 正在关闭服务器...")
     except Exception as e:
         print(f"❌ 服务器启动失败：{e}")
     finally:
         server_socket.close()
+        stop_dashboard(dashboard)
+        get_classifier().close()
+        # 把缓冲中的存储更新写入数据库后再关闭连接池
+        get_storage_writer().close()
+        get_repository().print_stats()
+        get_repository().close()
         print("✅ 服务器已关闭")
 
 if __name__ == "__main__":
-    server_program()
\ No newline at end of file
+    server_program()
@@ -1,56 +1,39 @@
+import argparse
 import os
-import mysql.connector
-from mysql.connector import Error
+import shutil
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from PIL import Image
 import datetime
+from config import (INGEST_WORKERS, INGEST_USE_PROCESSES, INGEST_BATCH_SIZE,
+                    INGEST_CHUNK_SIZE, INGEST_PROGRESS_INTERVAL, INGEST_DEDUP, IMAGE_BLOB_DIR)
+from repository import get_repository, DB_ERRORS
+from image_manifest import ImageManifest, file_digest
+from image_probe import probe_dimensions
+
+# 入库的图片扩展名
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
 
 def create_database_and_table():
-    """创建数据库和表"""
+    """创建数据库和表（MySQL 的 image_database 库或 SQLite 文件，见 config.DB_BACKEND）"""
     try:
-        # 连接到MySQL服务器（请修改为你的MySQL连接信息）
-        connection = mysql.connector.connect(
-            host='localhost',
-            user='work',           # 你的MySQL用户名
-            password='1111' # 你的MySQL密码
-        )
-        
-        if connection.is_connected():
-            cursor = connection.cursor()
-            
-            # 创建数据库
-            cursor.execute("CREATE DATABASE IF NOT EXISTS image_database")
-            print("数据库创建成功或已存在")
-            
-            # 切换到新数据库
-            cursor.execute("USE image_database")
-            
-            # 创建表
-            create_table_query = """
-            CREATE TABLE IF NOT EXISTS images (
-                id INT AUTO_INCREMENT PRIMARY KEY,
-                file_name VARCHAR(255) NOT NULL,
-                file_path VARCHAR(500) NOT NULL,
-                file_size BIGINT,
-                image_width INT,
-                image_height INT,
-                file_format VARCHAR(50),
-                created_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                UNIQUE KEY unique_file (file_path)
-            )
-            """
-            cursor.execute(create_table_query)
-            print("数据表创建成功或已存在")
-            
-            cursor.close()
-            connection.close()
-            return True
-            
-    except Error as e:
+        get_repository().create_image_schema()
+        print("数据表创建成功或已存在")
+        return True
+    except DB_ERRORS as e:
         print(f"数据库创建错误: {e}")
         return False
 
 def get_image_info(image_path):
-    """获取图片的详细信息"""
+    """获取图片的详细信息：JPEG/PNG 只读文件头（见 image_probe.py），其他文件用 Pillow"""
+    try:
+        info = probe_dimensions(image_path)
+        if info is not None:
+            return info
+    except OSError:
+        pass  # 交给 Pillow 再试一次并报告错误
+
     try:
         with Image.open(image_path) as img:
             width, height = img.size
@@ -60,124 +43,352 @@ def get_image_info(image_path):
         print(f"无法读取图片信息 {image_path}: {e}")
         return None, None, None
 
-def store_images_to_database(folder_path):
-    """将文件夹中的JPG图片信息存储到数据库"""
+def probe_image(file_path, file_size=None):
+    """读取单个文件的信息，返回 images 表的一行，失败返回None"""
+    filename = os.path.basename(file_path)
     try:
-        # 连接到数据库
-        connection = mysql.connector.connect(
-            host='localhost',
-            user='work',
-            password='1111',
-            database='image_database'
-        )
-        
-        if connection.is_connected():
-            cursor = connection.cursor()
-            
-            # 统计变量
-            total_files = 0
-            successful_files = 0
-            
-            # 遍历文件夹中的所有文件
-            for filename in os.listdir(folder_path):
-                if filename.lower().endswith(('.jpg', '.jpeg')):
-                    total_files += 1
-                    file_path = os.path.join(folder_path, filename)
-                    
+        if file_size is None:
+            file_size = os.path.getsize(file_path)
+        image_width, image_height, file_format = get_image_info(file_path)
+        return (filename, file_path, file_size, image_width, image_height, file_format)
+    except Exception as e:
+        print(f"处理文件 {filename} 时出错: {e}")
+        return None
+
+def probe_file(file_path, size, mtime_ns, old_digest=None, derivatives=False, dedup=True):
+    """读取单个文件的信息（大小和修改时间来自扫描时的 stat），返回 (路径, 行, 大小, 修改时间, 内容哈希)，
+    失败返回None；内容哈希与清单中的相同时不打开图片，行为None
+    dedup=False 时不计算内容哈希（要读完整个文件，比只读文件头的 probe_image 慢得多），内容哈希为None
+    derivatives=True 时顺便生成模型输入缓存（见 image_derivatives.py）"""
+    digest = None
+    if dedup:
+        try:
+            digest = file_digest(file_path)
+        except OSError as e:
+            print(f"处理文件 {os.path.basename(file_path)} 时出错: {e}")
+            return None
+        if digest == old_digest:
+            return file_path, None, size, mtime_ns, digest
+    row = probe_image(file_path, size)
+    if row is None:
+        return None
+    if derivatives:
+        try:
+            from image_derivatives import ensure_derivatives
+            ensure_derivatives(file_path, digest)
+        except Exception as e:
+            print(f"生成 {os.path.basename(file_path)} 的模型输入缓存失败: {e}")
+    return file_path, row + (digest,), size, mtime_ns, digest
+
+def probe_files(tasks):
+    """在工作线程/进程中处理一组 (路径, 大小, 修改时间, 清单中的内容哈希, 是否生成衍生图, 是否去重)"""
+    return [probe_file(*task) for task in tasks]
+
+def store_blob(file_path, content_hash, blob_dir=IMAGE_BLOB_DIR):
+    """去重时保存一份内容：blob_dir/哈希前两位/哈希.扩展名，优先硬链接，返回保存路径
+    未配置 blob_dir 时直接引用该文件"""
+    if not blob_dir:
+        return file_path
+    extension = os.path.splitext(file_path)[1].lower()
+    blob_path = os.path.join(blob_dir, content_hash[:2], content_hash + extension)
+    if not os.path.exists(blob_path):
+        os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+        try:
+            os.link(file_path, blob_path)
+        except OSError:
+            # 跨文件系统等无法硬链接时复制，先写临时文件再改名
+            temp_path = blob_path + ".part"
+            shutil.copyfile(file_path, temp_path)
+            os.replace(temp_path, blob_path)
+    return blob_path
+
+def remove_blobs(blob_paths, blob_dir=IMAGE_BLOB_DIR):
+    """删除 blob_dir 中不再被引用的内容副本（未配置 blob_dir 时保存路径就是原文件，不删除）"""
+    if not blob_dir:
+        return
+    root = os.path.abspath(blob_dir)
+    for blob_path in blob_paths:
+        if os.path.abspath(blob_path).startswith(root + os.sep):
+            try:
+                os.remove(blob_path)
+            except OSError as e:
+                print(f"删除图片副本 {blob_path} 失败: {e}")
+
+def scan_images(folder_path, extensions=IMAGE_EXTENSIONS, errors=None):
+    """递归扫描文件夹，逐个产生 (路径, stat)，不构建完整的文件列表
+    使用 os.scandir：文件类型来自目录项，无需额外系统调用；stat 结果由目录项缓存
+    （Windows 上随目录一起返回）。不跟随指向目录的符号链接，避免循环。
+    无法读取的路径记入 errors 列表"""
+    stack = [folder_path]
+    while stack:
+        directory = stack.pop()
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
                     try:
-                        # 获取文件信息
-                        file_size = os.path.getsize(file_path)
-                        image_width, image_height, file_format = get_image_info(file_path)
-                        
-                        # 插入数据到数据库
-                        insert_query = """
-                        INSERT INTO images (file_name, file_path, file_size, image_width, image_height, file_format)
-                        VALUES (%s, %s, %s, %s, %s, %s)
-                        ON DUPLICATE KEY UPDATE 
-                            file_size = VALUES(file_size),
-                            image_width = VALUES(image_width),
-                            image_height = VALUES(image_height),
-                            file_format = VALUES(file_format)
-                        """
-                        
-                        cursor.execute(insert_query, (
-                            filename,
-                            file_path,
-                            file_size,
-                            image_width,
-                            image_height,
-                            file_format
-                        ))
-                        
-                        successful_files += 1
-                        print(f"成功处理: {filename}")
-                        
-                    except Exception as e:
-                        print(f"处理文件 {filename} 时出错: {e}")
+                        if entry.is_dir(follow_symlinks=False):
+                            stack.append(entry.path)
+                        elif entry.name.lower().endswith(extensions) and entry.is_file():
+                            yield entry.path, entry.stat()
+                    except OSError as e:
+                        print(f"无法读取 {entry.path}: {e}")
+                        if errors is not None:
+                            errors.append(entry.path)
+        except OSError as e:
+            print(f"无法打开文件夹 {directory}: {e}")
+            if errors is not None:
+                errors.append(directory)
+
+def chunked(iterable, size):
+    """把可迭代对象切成最多 size 个元素的列表"""
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def bounded_map(executor, func, iterable, window):
+    """按输入顺序返回结果，同时最多 window 个任务在执行，不会一次提交全部任务"""
+    pending = deque()
+    for item in iterable:
+        pending.append(executor.submit(func, item))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+class IngestProgress:
+    """入库进度和吞吐量统计"""
+
+    def __init__(self, interval=INGEST_PROGRESS_INTERVAL):
+        self.interval = interval
+        self.start = time.perf_counter()
+        self.last_report = self.start
+        self.scanned = 0        # 已扫描到的图片文件数
+        self.unchanged = 0      # 未变化而跳过的文件数
+        self.probed = 0         # 已读取信息的文件数
+        self.failed = 0         # 读取失败的文件数
+        self.stored = 0         # 已写入数据库的行数
+        self.duplicates = 0     # 内容与已有图片相同的文件数
+        self.batches = 0        # 写入批次数
+
+    def report(self, force=False):
+        now = time.perf_counter()
+        if not force and now - self.last_report < self.interval:
+            return
+        self.last_report = now
+        elapsed = max(now - self.start, 1e-9)
+        print(f"进度: 已扫描 {self.scanned} 个文件（未变化 {self.unchanged}），已读取 {self.probed} 个（失败 {self.failed}），"
+              f"已写入 {self.stored} 条/{self.batches} 批，{self.scanned / elapsed:.0f} 个/秒")
+
+def store_images_to_database(folder_path, workers=INGEST_WORKERS, batch_size=INGEST_BATCH_SIZE,
+                             use_processes=INGEST_USE_PROCESSES, full=False, dedup=INGEST_DEDUP,
+                             derivatives=False):
+    """将文件夹（含子文件夹）中的图片信息存储到数据库
+    扫描结果边产生边交给线程池（或进程池）读取，结果每 batch_size 行用一次 executemany 写入并提交；
+    跳过与上次入库相比没有变化的文件，并删除已不存在的文件（见 image_manifest.py）；
+    full=True 时重新读取所有文件，结果仍记入清单；
+    dedup=True 时相同内容只在 image_blobs 中记录（并按 IMAGE_BLOB_DIR 保存）一份，images 中的行引用它；
+    derivatives=True 时在读取的同时生成模型输入缓存"""
+    manifest = ImageManifest()
+    print(f"清单中记录了 {manifest.load()} 个文件")
+    workers = workers or os.cpu_count()
+    executor_class = ProcessPoolExecutor if use_processes else ThreadPoolExecutor
+    print(f"递归扫描 {folder_path}，使用 {workers} 个{'进程' if use_processes else '线程'}读取，"
+          f"每批写入 {batch_size} 条")
+
+    repository = get_repository()
+    progress = IngestProgress()
+    previous = set(manifest.paths_under(folder_path))   # 上次入库时该文件夹中的文件
+    seen = set()                                        # 其中本次仍然存在的文件
+    scan_errors = []
+
+    def pending_tasks():
+        """大小和修改时间都没变的文件不再读取，其余的产生读取任务"""
+        for file_path, stat in scan_images(folder_path, errors=scan_errors):
+            progress.scanned += 1
+            entry = manifest.get(file_path)
+            if entry is not None:
+                seen.add(file_path)
+                if not full and manifest.is_unchanged(file_path, stat.st_size, stat.st_mtime_ns):
+                    progress.unchanged += 1
+                    continue
+            yield (file_path, stat.st_size, stat.st_mtime_ns,
+                   entry[2] if entry and not full else None, derivatives, dedup)
+
+    batch = []
+    batch_entries = []
+
+    def write_blobs():
+        """这一批中第一次出现的内容写入 image_blobs，其余的只是引用"""
+        known = repository.find_blobs({row[6] for row in batch})
+        blobs = {}
+        for row in batch:
+            content_hash = row[6]
+            if content_hash in known or content_hash in blobs:
+                progress.duplicates += 1
+                continue
+            file_name, file_path, file_size, width, height, file_format = row[:6]
+            blobs[content_hash] = (content_hash, file_size, width, height, file_format,
+                                   store_blob(file_path, content_hash))
+        repository.insert_blobs(list(blobs.values()))
+
+    def write_batch():
+        if dedup:
+            write_blobs()
+        progress.stored += repository.upsert_images(batch)
+        progress.batches += 1
+        if dedup:
+            # 内容改变了的文件不再引用原来的内容
+            changed = {}
+            for file_path, _, _, digest in batch_entries:
+                entry = manifest.get(file_path)
+                if entry is not None and entry[2] and entry[2] != digest:
+                    changed[file_path] = entry[2]
+            if changed:
+                remove_blobs(repository.release_blobs(set(changed.values()), changed))
+        # 写入成功后才记入清单
+        for entry in batch_entries:
+            manifest.update(*entry)
+        batch.clear()
+        batch_entries.clear()
+
+    try:
+        with executor_class(max_workers=workers) as executor:
+            # 数据库写入在主线程进行，同时工作线程继续读取后面的文件
+            for results in bounded_map(executor, probe_files, chunked(pending_tasks(), INGEST_CHUNK_SIZE),
+                                       workers * 2):
+                for result in results:
+                    if result is None:
+                        progress.failed += 1
                         continue
-            
-            # 提交事务
-            connection.commit()
-            print(f"\n处理完成! 总共找到 {total_files} 个JPG文件，成功存储 {successful_files} 个")
-            
-            cursor.close()
-            connection.close()
-            
-    except Error as e:
+                    file_path, row, size, mtime_ns, digest = result
+                    if row is None:
+                        # 内容没有变化，只更新清单中的修改时间
+                        progress.unchanged += 1
+                        manifest.update(file_path, size, mtime_ns, digest)
+                        continue
+                    batch.append(row)
+                    batch_entries.append((file_path, size, mtime_ns, digest))
+                progress.probed += len(results)
+                if len(batch) >= batch_size:
+                    write_batch()
+                progress.report()
+            if batch:
+                write_batch()
+
+        # 清单中有、文件夹中已没有的文件；有文件夹无法读取时不判断，以免误删
+        deleted = sorted(previous - seen)
+        if scan_errors:
+            print(f"⚠️  有 {len(scan_errors)} 个路径无法读取，本次不删除数据库中的记录")
+        elif deleted:
+            removed, orphaned = repository.delete_images(deleted)
+            remove_blobs(orphaned)
+            for file_path in deleted:
+                manifest.remove(file_path)
+            print(f"已删除 {len(deleted)} 个不存在的文件（数据库中 {removed} 行）")
+    except DB_ERRORS as e:
         print(f"数据库连接错误: {e}")
+    except OSError as e:
+        print(f"保存图片副本失败: {e}")
+    finally:
+        manifest.save()
+    progress.report(force=True)
+
+    elapsed = time.perf_counter() - progress.start
+    print(f"\n处理完成! 总共找到 {progress.scanned} 个图片文件，跳过未变化的 {progress.unchanged} 个，"
+          f"成功存储 {progress.stored} 个（其中内容重复 {progress.duplicates} 个），耗时 {elapsed:.1f} 秒（{progress.scanned / max(elapsed, 1e-9):.0f} 个/秒）")
+    return progress.stored
 
 def display_stored_images():
     """显示数据库中存储的图片信息"""
     try:
-        connection = mysql.connector.connect(
-            host='localhost',
-            user='work',
-            password='1111',
-            database='image_database'
-        )
-        
-        if connection.is_connected():
-            cursor = connection.cursor()
-            
-            cursor.execute("SELECT COUNT(*) FROM images")
-            total_count = cursor.fetchone()[0]
-            
-            print(f"\n数据库中总共存储了 {total_count} 张图片")
-            print("\n最近添加的10张图片:")
+        repository = get_repository()
+        total_count, distinct_count = repository.duplicate_stats()
+
+        print(f"\n数据库中总共存储了 {total_count} 张图片（不同内容 {distinct_count} 种）")
+        print("\n最近添加的10张图片:")
+        print("-" * 100)
+
+        rows, _ = repository.query_images(10)
+        for row in rows:
+            print_image_row(row)
+
+    except DB_ERRORS as e:
+        print(f"查询数据库错误: {e}")
+
+def print_image_row(row):
+    file_size_kb = row[2] / 1024 if row[2] else 0
+    print(f"ID: {row[0]}, 文件名: {row[1]}, 大小: {file_size_kb:.1f}KB, "
+          f"尺寸: {row[3]}x{row[4]}, 格式: {row[6]}, 添加时间: {row[5]}")
+
+def browse_images(page_size=20, **filters):
+    """按添加时间从新到旧分页浏览图片，回车显示下一页，输入 q 退出
+    filters 传给 Repository.query_images（since/until/file_format/min_width/min_height）"""
+    repository = get_repository()
+    cursor = None
+    page = 1
+    try:
+        while True:
+            rows, cursor = repository.query_images(page_size, after=cursor, **filters)
+            print(f"\n第 {page} 页:")
             print("-" * 100)
-            
-            cursor.execute("""
-                SELECT id, file_name, file_size, image_width, image_height, created_time 
-                FROM images 
-                ORDER BY created_time DESC 
-                LIMIT 10
-            """)
-            
-            results = cursor.fetchall()
-            for row in results:
-                file_size_kb = row[2] / 1024 if row[2] else 0
-                print(f"ID: {row[0]}, 文件名: {row[1]}, 大小: {file_size_kb:.1f}KB, "
-                      f"尺寸: {row[3]}x{row[4]}, 添加时间: {row[5]}")
-            
-            cursor.close()
-            connection.close()
-            
-    except Error as e:
+            for row in rows:
+                print_image_row(row)
+            if cursor is None:
+                print("\n已显示全部图片")
+                return
+            if input("\n回车显示下一页，输入 q 退出: ").strip().lower() == "q":
+                return
+            page += 1
+    except DB_ERRORS as e:
         print(f"查询数据库错误: {e}")
 
 def main():
     """主函数"""
-    print("=== JPG图片信息存储到MySQL数据库 ===")
+    parser = argparse.ArgumentParser(description="图片信息存储到数据库")
+    parser.add_argument("folder", nargs="?", help="图片文件夹路径，不指定时交互输入")
+    parser.add_argument("--workers", type=int, default=INGEST_WORKERS, help="读取图片信息的并发数")
+    parser.add_argument("--batch-size", type=int, default=INGEST_BATCH_SIZE, help="每批写入数据库的行数")
+    parser.add_argument("--processes", action="store_true", default=INGEST_USE_PROCESSES,
+                        help="使用进程池读取图片信息")
+    parser.add_argument("--full", action="store_true", help="忽略变化检测清单，重新读取所有文件")
+    parser.add_argument("--derivatives", action="store_true", help="同时生成模型输入缓存")
+    parser.add_argument("--no-dedup", dest="dedup", action="store_false", default=INGEST_DEDUP,
+                        help="不按内容哈希去重")
+    browse = parser.add_argument_group("浏览已入库的图片（不入库）")
+    browse.add_argument("--browse", action="store_true", help="分页浏览已入库的图片")
+    browse.add_argument("--page-size", type=int, default=20, help="每页显示的图片数")
+    browse.add_argument("--since", help="添加时间不早于，如 2024-01-01 或 '2024-01-01 08:00:00'")
+    browse.add_argument("--until", help="添加时间早于")
+    browse.add_argument("--format", dest="file_format", help="图片格式，如 JPEG、PNG")
+    browse.add_argument("--min-width", type=int, help="最小宽度")
+    browse.add_argument("--min-height", type=int, help="最小高度")
+    args = parser.parse_args()
+
+    print("=== 图片信息存储到数据库 ===")
     
     # 第一步：创建数据库和表
     print("\n1. 正在创建数据库和表...")
     if not create_database_and_table():
         print("数据库创建失败，程序退出")
         return
+
+    if args.browse:
+        browse_images(args.page_size, since=args.since, until=args.until, file_format=args.file_format,
+                      min_width=args.min_width, min_height=args.min_height)
+        get_repository().close()
+        return
     
     # 第二步：获取用户输入的文件夹路径
-    print("\n2. 请输入包含JPG图片的文件夹路径:")
-    folder_path = input("文件夹路径: ").strip()
+    if args.folder:
+        folder_path = args.folder
+    else:
+        print("\n2. 请输入包含图片的文件夹路径（含子文件夹）:")
+        folder_path = input("文件夹路径: ").strip()
     
     # 移除路径两端的引号（如果用户复制路径时带了引号）
     folder_path = folder_path.strip('"\'')
@@ -193,11 +404,14 @@ def main():
     
     # 第三步：处理图片并存储到数据库
     print(f"\n3. 正在处理文件夹: {folder_path}")
-    store_images_to_database(folder_path)
+    store_images_to_database(folder_path, args.workers, args.batch_size, args.processes,
+                             full=args.full, dedup=args.dedup, derivatives=args.derivatives)
     
     # 第四步：显示存储结果
     display_stored_images()
     
+    get_repository().print_stats()
+    get_repository().close()
     print("\n程序执行完成!")
 
 if __name__ == "__main__":
@@ -0,0 +1,158 @@
+# storage_writer.py - 垃圾桶存储情况写入
+# 每次投放都执行一次 UPDATE trash_bin ... + commit，高峰时每次投放都要等一次落盘。
+# 写入模式（config.STORAGE_WRITE_MODE）：
+#   sync          原来的方式，每次更新立即 UPDATE 并提交
+#   write_behind  先记在内存中，同一个 (位置, 类别) 只保留最新值，
+#                 每隔 STORAGE_FLUSH_INTERVAL_MS 毫秒或累计 STORAGE_FLUSH_MAX_UPDATES 个
+#                 垃圾桶后，用一条多行 UPDATE（与 VALUES 列表连接）批量写入
+# 两种模式都只更新已有的垃圾桶：write_behind 模式下第一次写入某个垃圾桶时查询一次是否存在，
+# 不存在时与 sync 模式一样提示“未找到垃圾桶”，不记入缓冲区和汇总。
+# write_behind 模式下进程异常退出会丢失最近一个刷新周期内的更新，服务器关闭时会先刷新。
+# 两种模式下每次更新都同时记入存储情况汇总（见 fill_stats.py），看板不必查询数据库。
+import threading
+from config import STORAGE_WRITE_MODE, STORAGE_FLUSH_INTERVAL_MS, STORAGE_FLUSH_MAX_UPDATES
+from repository import get_repository, DB_ERRORS
+from fill_stats import get_fill_stats
+
+def update_storage(repository, location, cate_code, new_storage):
+    """更新数据库存储情况，返回是否更新成功，失败时只打印提示"""
+    try:
+        if not repository.update_storage(location, cate_code, new_storage):
+            print(f"❌ 未找到垃圾桶：{location}_{cate_code}")
+            print("  注意：数据库更新失败，但继续发送存储情况给客户端")
+            return False
+        print(f"✅ 已更新垃圾桶 {location}_{cate_code} 存储为 {new_storage}%")
+        return True
+
+    except DB_ERRORS as e:
+        print(f"❌ 数据库更新失败：{e}")
+        print("  注意：数据库更新失败，但继续发送存储情况给客户端")
+        return False
+
+class StorageWriter:
+    """按写入模式更新 trash_bin.storage"""
+
+    def __init__(self, mode=STORAGE_WRITE_MODE, flush_interval_ms=STORAGE_FLUSH_INTERVAL_MS,
+                 max_updates=STORAGE_FLUSH_MAX_UPDATES, repository=None, fill_stats=None):
+        if mode not in ("sync", "write_behind"):
+            raise ValueError(f"未知的写入模式：{mode}，可选：sync, write_behind")
+        self.mode = mode
+        self.flush_interval = flush_interval_ms / 1000
+        self.max_updates = max_updates
+        self.repository = repository or get_repository()
+        self.fill_stats = fill_stats or get_fill_stats()
+
+        self._pending = {}          # (位置, 类别) -> 最新存储值，等待写入
+        self._inflight = {}         # 正在写入数据库的一批
+        self._known = set()         # 已确认存在的垃圾桶
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()     # 同一时间只有一个线程在刷新
+        self._wakeup = threading.Event()
+        self._closed = False
+        self._stats = {"updates": 0, "flushes": 0, "rows": 0, "failures": 0}
+
+        self._thread = None
+        if mode == "write_behind":
+            self._thread = threading.Thread(target=self._flush_loop, name="storage-writer", daemon=True)
+            self._thread.start()
+
+    def write(self, location, cate_code, new_storage):
+        """记录一次存储更新"""
+        key = (location.upper(), int(cate_code))
+        if self.mode == "sync":
+            if update_storage(self.repository, location, cate_code, new_storage):
+                self.fill_stats.update(location, cate_code, new_storage)
+            return
+
+        if key not in self._known:
+            try:
+                if self.repository.get_storage(*key) is None:
+                    print(f"❌ 未找到垃圾桶：{location}_{cate_code}")
+                    print("  注意：数据库更新失败，但继续发送存储情况给客户端")
+                    return
+                self._known.add(key)
+            except DB_ERRORS as e:
+                # 无法确认时照常缓冲，刷新时不存在的垃圾桶也不会被插入
+                print(f"⚠️  查询垃圾桶失败：{e}")
+
+        self.fill_stats.update(location, cate_code, new_storage)
+        with self._lock:
+            self._pending[key] = new_storage
+            self._stats["updates"] += 1
+            full = len(self._pending) >= self.max_updates
+        print(f"📝 已记录垃圾桶 {location}_{cate_code} 存储为 {new_storage}%（等待批量写入）")
+        if full:
+            self._wakeup.set()
+
+    def pending_value(self, location, cate_code):
+        """尚未写入数据库的最新存储值，没有则返回None（保证读到自己刚写的值）"""
+        key = (location.upper(), int(cate_code))
+        with self._lock:
+            if key in self._pending:
+                return self._pending[key]
+            return self._inflight.get(key)
+
+    def _flush_loop(self):
+        while not self._closed:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+
+    def flush(self):
+        """把缓冲的更新用一条多行语句写入数据库，返回写入的垃圾桶数"""
+        with self._flush_lock:
+            with self._lock:
+                if not self._pending:
+                    return 0
+                batch, self._pending = self._pending, {}
+                self._inflight = batch
+
+            rows = [(location, cate_id, storage) for (location, cate_id), storage in batch.items()]
+            try:
+                # 写入失败重试后积压的行可能很多，每条语句最多 max_updates 行，一次提交
+                self.repository.update_storages(rows, self.max_updates)
+            except DB_ERRORS as e:
+                # 写入失败时放回缓冲区，已有更新的值优先
+                with self._lock:
+                    for key, storage in batch.items():
+                        self._pending.setdefault(key, storage)
+                    self._inflight = {}
+                    self._stats["failures"] += 1
+                print(f"❌ 批量写入存储情况失败，稍后重试：{e}")
+                return 0
+
+            with self._lock:
+                self._inflight = {}
+                self._stats["flushes"] += 1
+                self._stats["rows"] += len(rows)
+            return len(rows)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["pending"] = len(self._pending)
+        return stats
+
+    def close(self):
+        """停止后台刷新，并把剩余的更新写入数据库"""
+        if self._closed:
+            return
+        self._closed = True
+        if self._thread is not None:
+            self._wakeup.set()
+            self._thread.join(timeout=5)
+            written = self.flush()
+            s = self.stats()
+            print(f"📊 存储写入：更新 {s['updates']} 次，批量写入 {s['flushes']} 次共 {s['rows']} 行，"
+                  f"失败 {s['failures']} 次，关闭时写入 {written} 行，未写入 {s['pending']} 行")
+
+_writer = None
+_writer_lock = threading.Lock()
+
+def get_storage_writer():
+    """获取全局存储写入器"""
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = StorageWriter()
+        return _writer
@@ -1,10 +1,11 @@
 import socket
 import os
+from config import SERVER_HOST, SERVER_PORT
 
 def send_data():
     # 配置服务器信息（填服务器端的 IP 和端口）
-    HOST = '192.168.3.10'  # 必须与服务器端 IP 一致
-    PORT = 8888
+    HOST = SERVER_HOST  # 必须与服务器端 IP 一致
+    PORT = SERVER_PORT
 
     # 创建 TCP 套接字并连接
     with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
@@ -26,7 +27,9 @@ def send_data():
             elif choice == '1':
                 content = input("请输入要发送的字符串：")
                 # 发送类型标识符 + 字符串长度（4字节） + 字符串内容
-                s.sendall(b'STR' + len(content).to_bytes(4, byteorder='big') + content.encode('utf-8'))
+                # 长度按UTF-8编码后的字节数计算，中文字符串按字符数会导致服务器读错边界
+                data = content.encode('utf-8')
+                s.sendall(b'STR' + len(data).to_bytes(4, byteorder='big') + data)
                 print("字符串发送成功！")
 
             # 发送图片